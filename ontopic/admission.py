@@ -0,0 +1,137 @@
+"""Admission control for the onTopic analyses.
+
+The time an analysis occupies a worker grows with the size of the document,
+so oversized documents are rejected before any spaCy work, from a cost
+estimated on the HTML with regular expressions. Clients can also only have a
+limited number of analysis requests in progress, so that a burst from one
+client does not fill the analysis queue for everybody else.
+"""
+
+import re
+from dataclasses import dataclass
+
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from metrics import REJECTED_REQUESTS
+
+BLOCK_ELEMENT = re.compile(r"<(?:p|li|h[1-6])[\s/>]", re.IGNORECASE)
+TAG = re.compile(r"<[^>]*>")
+TOKEN = re.compile(r"\w+|[^\w\s]")
+
+
+class DocumentTooLarge(ValueError):
+    """Raised when a document exceeds one of the admission limits."""
+
+
+@dataclass(frozen=True)
+class Cost:
+    """Estimated size of the analysis of an HTML fragment."""
+
+    bytes: int
+    paragraphs: int  # block elements that are parsed (p, li and headings)
+    tokens: int  # words and punctuation outside of the tags
+
+    def __add__(self, other: "Cost") -> "Cost":
+        return Cost(
+            bytes=self.bytes + other.bytes,
+            paragraphs=self.paragraphs + other.paragraphs,
+            tokens=self.tokens + other.tokens,
+        )
+
+
+def estimate_cost(html: str) -> Cost:
+    """Estimate the cost of analysing an HTML fragment without parsing it."""
+    text = TAG.sub(" ", html)
+    return Cost(
+        bytes=len(html.encode("utf-8")),
+        paragraphs=len(BLOCK_ELEMENT.findall(html)),
+        tokens=sum(1 for _ in TOKEN.finditer(text)),
+    )
+
+
+@dataclass(frozen=True)
+class Limits:
+    """The largest document admitted for analysis, 0 is unlimited."""
+
+    max_bytes: int = 0
+    max_paragraphs: int = 0
+    max_tokens: int = 0
+
+    def check(self, cost: Cost) -> None:
+        """Raise DocumentTooLarge if the cost exceeds one of the limits."""
+        for name, value, limit in (
+            ("bytes", cost.bytes, self.max_bytes),
+            ("paragraphs", cost.paragraphs, self.max_paragraphs),
+            ("words", cost.tokens, self.max_tokens),
+        ):
+            if 0 < limit < value:
+                raise DocumentTooLarge(
+                    f"The document is too large to be analysed: about {value} "
+                    f"{name}, the limit is {limit}."
+                )
+
+
+class ClientConcurrencyMiddleware:
+    """
+    Limits the number of analysis requests (POST and PATCH) that a client has in
+    progress, including the time spent streaming the response. Requests beyond
+    'max_requests' are rejected with 429. The client is identified by its
+    address, or by 'header' if it is given, e.g., "x-forwarded-for" behind
+    'proxies' trusted proxies. Each proxy appends the address it received the
+    request from to the header, and the values before those of the trusted
+    proxies are set by the client itself, so the client is the value that the
+    outermost trusted proxy appended, 'proxies' values from the end.
+    """
+
+    def __init__(
+        self, app: ASGIApp, max_requests: int = 0, header: str = "", proxies: int = 1
+    ):
+        self.app = app
+        self.max_requests = max_requests
+        self.header = header.lower().encode("latin-1")
+        self.proxies = max(proxies, 1)
+        self.active: dict[str, int] = {}  # requests in progress by client
+
+    def client(self, scope: Scope) -> str:
+        """The identity of the client of a request."""
+        if self.header:
+            values = [
+                value.strip()
+                for name, header in scope["headers"]
+                if name == self.header
+                for value in header.decode("latin-1").split(",")
+                if value.strip()
+            ]
+            if values:
+                return values[-min(self.proxies, len(values))]
+        client = scope.get("client")
+        return client[0] if client else ""
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if (
+            scope["type"] != "http"
+            or self.max_requests <= 0
+            or scope["method"] not in ("POST", "PATCH")
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        client = self.client(scope)
+        if self.active.get(client, 0) >= self.max_requests:
+            REJECTED_REQUESTS.inc("client_limit")
+            response = JSONResponse(
+                {"detail": "Too many requests in progress, please try again later."},
+                status_code=429,
+                headers={"Retry-After": "1"},
+            )
+            await response(scope, receive, send)
+            return
+
+        self.active[client] = self.active.get(client, 0) + 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.active[client] -= 1
+            if self.active[client] == 0:
+                del self.active[client]
@@ -0,0 +1,267 @@
+"""onTopic analysis pipeline.
+
+These functions are the units of work handed to the execution backend.
+They only take and return plain picklable values so that they can run
+inline, on a thread or in a worker process.
+"""
+
+import logging
+from typing import Any, Callable, Collection, Iterator, Optional
+
+from bs4 import BeautifulSoup as bs
+
+import config
+from localization.NLP import NLP_MODELS
+from ds_document import DSDocument, TopicSort, element_ids
+from paragraph_cache import PARAGRAPH_CACHE
+from topic_clusters import ClusterDefinition, TopicClusters
+
+
+# The OnTopicData fields that an analysis can generate, see document_results().
+FIELDS = ("coherence", "local", "clarity", "html", "html_sentences")
+
+
+class InvalidEdit(ValueError):
+    """Raised when a paragraph edit does not apply to the document."""
+
+
+def document_stats(document: DSDocument) -> dict[str, int]:
+    """Return the size of a loaded document and its paragraph cache lookups."""
+    return {
+        "paragraphs": document.getNumParagraphs(),
+        "sentences": document.getSentCount(),
+        "words": document.word_count,
+        "cache_hits": document.cache_hits,
+        "cache_misses": document.cache_misses,
+    }
+
+
+def clarity_data(clarity: list) -> list:
+    """Remove the redundant sentence analysis from getSentStructureData()."""
+    # The data is unexpected in the frontend.
+    return [d[:2] + d[3:] if isinstance(d, tuple) else d for d in clarity]
+
+
+def clarity_chunks(clarity: list) -> Iterator[list]:
+    """Split clarity data at the "\n" that starts each block element."""
+    start = 0
+    for i, item in enumerate(clarity):
+        if item == "\n" and i > start:
+            yield clarity[start:i]
+            start = i
+    if start < len(clarity):
+        yield clarity[start:]
+
+
+def document_results(
+    document: DSDocument, fields: Collection[str] = FIELDS
+) -> dict[str, Any]:
+    """
+    Generate the requested OnTopicData fields for a processed document, together
+    with the document statistics used for the service metrics. Only the stages
+    needed for the fields are run: the html field needs the topics of the
+    coherence analysis and the html_sentences field needs the clarity data.
+    """
+    result: dict[str, Any] = {}
+    if "coherence" in fields or "html" in fields:
+        coherence = document.generateGlobalVisData(2, 1, TopicSort.APPEARANCE)
+        num_paragraphs = coherence.get("num_paras")
+        if num_paragraphs:
+            logging.info(
+                "Number of paragraphs processed: %d (might be 1 for very short text)",
+                num_paragraphs,
+            )
+        else:
+            logging.warning(
+                "Error obtaining number of paragraphs from %s, setting to 0",
+                num_paragraphs,
+            )
+        if "coherence" in fields:
+            result["coherence"] = coherence
+
+    if "local" in fields:
+        # Currently unused in visualization,
+        #  reduce processing by not performing this analysis.
+        # [LocalData.model_validate(document.generateGlobalVisData([i], 1, 2))
+        #  for i in range(1, nrParagraphs+1)]
+        result["local"] = []
+
+    clarity = None
+    if "clarity" in fields or "html_sentences" in fields:
+        document.recalculateGivenWords()
+        clarity = document.getSentStructureData()
+        if "clarity" in fields:
+            result["clarity"] = clarity_data(clarity)
+
+    if "html" in fields:
+        result["html"] = document.toHtml(document.getCurrentTopics(), -1)
+    if clarity is not None and "html_sentences" in fields:
+        result["html_sentences"] = document.getHtmlSents(clarity)
+
+    result["stats"] = document_stats(document)
+    return result
+
+
+def ontopic_analysis(
+    language: str,
+    html: str,
+    fields: Collection[str] = FIELDS,
+    clusters: ClusterDefinition = (),
+) -> dict[str, Any]:
+    """Analyse an HTML fragment for coherence and clarity.
+
+    Returns a dictionary with the requested fields of the OnTopicData response,
+    the document statistics and the timings of the pipeline stages. The topic
+    'clusters' are those of cluster_definition().
+    """
+    locale = NLP_MODELS[language]
+    with locale.lock, locale.nlp.memory_zone():
+        document = DSDocument(
+            locale=locale, cache=PARAGRAPH_CACHE, clusters=TopicClusters(clusters)
+        )
+        # The sentences are tagged by toHtml() only if the html field is requested.
+        document.setHtml(f"<body>{html}</body>")
+        document.processDoc()
+        result = document_results(document, fields)
+        result["timings"] = document.timings.to_dict()
+        return result
+
+
+def ontopic_stream_analysis(
+    language: str,
+    html: str,
+    fields: Collection[str],
+    clusters: ClusterDefinition,
+    emit: Callable[[dict[str, Any]], None],
+) -> None:
+    """
+    Analyse an HTML fragment like ontopic_analysis() but emit the requested
+    fields of the OnTopicData response as soon as they are ready. The clarity
+    data is emitted for each block element once the given and new words are
+    known, followed by coherence, local, html and html_sentences. The last item
+    holds the document statistics and the timings of the pipeline stages.
+    """
+    locale = NLP_MODELS[language]
+    with locale.lock, locale.nlp.memory_zone():
+        document = DSDocument(
+            locale=locale, cache=PARAGRAPH_CACHE, clusters=TopicClusters(clusters)
+        )
+        document.setHtml(f"<body>{html}</body>")
+        document.processDoc()
+        clarity = None
+        if "clarity" in fields or "html_sentences" in fields:
+            document.recalculateGivenWords()
+            clarity = document.getSentStructureData()
+        if "clarity" in fields:
+            for chunk in clarity_chunks(clarity_data(clarity)):
+                emit({"clarity": chunk})
+
+        if "coherence" in fields or "html" in fields:
+            coherence = document.generateGlobalVisData(2, 1, TopicSort.APPEARANCE)
+            if "coherence" in fields:
+                emit({"coherence": coherence})
+        if "local" in fields:
+            emit({"local": []})
+        if "html" in fields:
+            emit({"html": document.toHtml(document.getCurrentTopics(), -1)})
+        if clarity is not None and "html_sentences" in fields:
+            emit({"html_sentences": document.getHtmlSents(clarity)})
+        emit({"stats": document_stats(document), "timings": document.timings.to_dict()})
+
+
+def apply_edits(html: str, edits: list[dict[str, Any]]) -> str:
+    """
+    Apply paragraph edits to an HTML fragment and return the new fragment.
+
+    Each edit is a dictionary with the 'id' of a block element of the last
+    analysis of the fragment (e.g., "p3" or "li5"), an 'op' that is one of
+    "replace", "remove", "insert_before" or "insert_after", and the new 'html'
+    for all but "remove", which cannot be empty: a paragraph is removed with
+    "remove". All the ids refer to the fragment before the edits.
+    """
+    soup = bs(f"<body>{html}</body>", "html.parser")
+    ids = element_ids(soup)
+    targets = []
+    replaced = set()
+    for edit in edits:
+        tag = ids.get(edit["id"])
+        if tag is None:
+            raise InvalidEdit(f"Unknown paragraph id: {edit['id']}")
+        if edit["op"] in ("replace", "remove"):
+            if edit["id"] in replaced:
+                raise InvalidEdit(f"Paragraph {edit['id']} is edited twice")
+            replaced.add(edit["id"])
+        elif edit["op"] not in ("insert_before", "insert_after"):
+            raise InvalidEdit(f"Unknown edit operation: {edit['op']}")
+        if edit["op"] != "remove" and not (edit.get("html") or "").strip():
+            raise InvalidEdit(
+                f"The {edit['op']} edit of paragraph {edit['id']} has no html"
+            )
+        targets.append((tag, edit))
+
+    for tag, edit in targets:
+        if all(parent is not soup for parent in tag.parents):
+            raise InvalidEdit(f"Paragraph {edit['id']} is in a removed element")
+        if edit["op"] == "remove":
+            tag.extract()
+            continue
+        nodes = list(bs(edit["html"], "html.parser").contents)
+        if edit["op"] == "replace":
+            tag.replace_with(*nodes)
+        elif edit["op"] == "insert_before":
+            tag.insert_before(*nodes)
+        else:
+            tag.insert_after(*nodes)
+    return soup.body.decode_contents() if soup.body else ""
+
+
+def edit_analysis(
+    language: str,
+    html: str,
+    edits: list[dict[str, Any]],
+    clusters: ClusterDefinition = (),
+) -> tuple[str, dict[str, Any]]:
+    """
+    Apply paragraph edits to an HTML fragment (see apply_edits) and analyse the
+    result. Only the paragraphs that changed are parsed again, the others are in
+    the paragraph cache. Returns the new fragment and the analysis.
+    """
+    html = apply_edits(html, edits)
+    return html, ontopic_analysis(language, html, FIELDS, clusters)
+
+
+def ontopic_batch_analysis(
+    language: str,
+    htmls: list[str],
+    fields: Collection[str] = FIELDS,
+    clusters: Optional[list[ClusterDefinition]] = None,
+) -> list[dict[str, Any]]:
+    """
+    Analyse several HTML fragments with a single spaCy pipe pass, with the topic
+    'clusters' of each fragment if they are given.
+    """
+    locale = NLP_MODELS[language]
+    with locale.lock, locale.nlp.memory_zone():
+        documents = DSDocument.loadManyFromHtmlStrings(
+            locale,
+            [f"<body>{html}</body>" for html in htmls],
+            batch_size=config.BATCH_SIZE,
+            n_process=config.BATCH_PROCESSES,
+            cache=PARAGRAPH_CACHE,
+            tag_sentences=False,
+            clusters=(
+                [TopicClusters(definition) for definition in clusters]
+                if clusters is not None
+                else None
+            ),
+        )
+        return [document_results(document, fields) for document in documents]
+
+
+def segment_analysis(language: str, text: str) -> str:
+    """Segment an HTML fragment into paragraphs and sentences."""
+    locale = NLP_MODELS[language]
+    with locale.lock, locale.nlp.memory_zone():
+        document = DSDocument(locale=locale, cache=PARAGRAPH_CACHE)
+        document.loadFromHtmlString(f"<body>{text}</body>")
+        return document.toXml()
@@ -0,0 +1,72 @@
+"""Analysis of several onTopic documents in one request."""
+
+import logging
+from typing import Annotated, Optional
+
+from fastapi import APIRouter, Depends, Header, Request, Response
+from pydantic import AfterValidator, Field
+
+import config
+from analysis import ontopic_batch_analysis
+from api_common import (
+    admit_documents,
+    analysis_etag,
+    cache_result,
+    cached_result,
+    get_fields,
+    json_response,
+    run_analysis,
+    to_ontopic_data,
+    to_ontopic_json,
+    validate_language,
+)
+from api_schemas import OnTopicData, OnTopicRequest, request_clusters
+from metrics import observe_document
+
+router = APIRouter()
+
+
+@router.post("/api/v2/ontopic/batch")
+async def ontopic_batch(
+    request: Request,
+    response: Response,
+    data: Annotated[list[OnTopicRequest], Field(max_length=config.MAX_BATCH_DOCUMENTS)],
+    accept_language: Annotated[
+        Optional[str], Header(), AfterValidator(validate_language)
+    ] = "en",
+    fields: tuple[str, ...] = Depends(get_fields),
+) -> list[OnTopicData]:
+    """Analyse several documents at once, results are in the order posted."""
+    language = accept_language or "en"
+    response.headers["Content-Language"] = language
+    logging.info(
+        "Received onTopic batch request of %d documents for language: %s",
+        len(data),
+        language,
+    )
+    clusters = [request_clusters(d) for d in data]
+    admit_documents(*(d.base for d in data), clusters=clusters)
+    etag = await analysis_etag(request, language)
+    cached = cached_result(request, response, etag)
+    if cached is not None:
+        return cached
+    results = await run_analysis(
+        request,
+        ontopic_batch_analysis,
+        language,
+        [d.base for d in data],
+        fields,
+        clusters if any(clusters) else None,
+    )
+    for result in results:
+        observe_document("/api/v2/ontopic/batch", language, result["stats"])
+
+    if config.VALIDATE_RESPONSES:
+        return [to_ontopic_data(result) for result in results]
+    return cache_result(
+        etag,
+        json_response(
+            response,
+            "[" + ",".join(to_ontopic_json(result) for result in results) + "]",
+        ),
+    )
@@ -0,0 +1,281 @@
+"""Dependencies and response helpers shared by the onTopic endpoints."""
+
+import logging
+from typing import Annotated, Any, AsyncIterator, Iterable, Optional
+
+from fastapi import HTTPException, Query, Request, Response
+from langcodes import tag_is_valid, closest_supported_match
+
+import config
+from admission import Cost, DocumentTooLarge, Limits, estimate_cost
+from analysis import FIELDS
+from api_schemas import ClaritySentenceData, CoherenceData, OnTopicData
+from executor import ExecutorSaturated
+from localization.NLP import NLP_MODELS, Locale
+from metrics import (
+    REJECTED_REQUESTS,
+    RESULT_CACHE_LOOKUPS,
+    observe_document,
+    observe_stages,
+)
+from result_cache import RESULT_CACHE, etag_matches, model_version, result_etag
+from stage_timer import StageTimings, log_fields, server_timing
+from topic_clusters import ClusterDefinition
+
+
+def validate_language(accept_language: Optional[str]) -> str:
+    """Validate the language tag and return a standardized version."""
+    if accept_language is None or accept_language == "*":
+        return "en"
+    for l in [l.strip() for l in accept_language.split(",")]:
+        [la, _] = l.split(";") if ";" in l else (l, "")
+        if tag_is_valid(la):
+            return closest_supported_match(la, NLP_MODELS.keys()) or "en"
+    raise ValueError(f"Unsupported language: {accept_language}")
+
+
+def get_language(request: Request) -> str:
+    """Get the supported language key based on the Accept-Language header."""
+    accept_language = request.headers.get("Accept-Language", "en")
+    try:
+        lang = validate_language(accept_language)
+    except ValueError as e:
+        logging.warning("Language validation error: %s, defaulting to 'en'", e)
+        lang = "en"
+    return lang if lang in request.app.state.nlp_models else "en"
+
+
+def get_locale(request: Request) -> Locale:
+    """Get the appropriate NLP model based on the Accept-Language header."""
+    return request.app.state.nlp_models[get_language(request)]
+
+
+def get_fields(
+    fields: Annotated[
+        Optional[str],
+        Query(
+            description="Comma separated OnTopicData fields to generate, e.g., "
+            '"coherence,clarity". Only the analysis stages needed for them are run, '
+            "the other fields are left empty. All fields by default.",
+        ),
+    ] = None,
+) -> tuple[str, ...]:
+    """Get the requested OnTopicData fields from the 'fields' query parameter."""
+    if fields is None:
+        return FIELDS
+    requested = tuple(name.strip() for name in fields.split(",") if name.strip())
+    unknown = [name for name in requested if name not in FIELDS]
+    if unknown:
+        raise HTTPException(
+            status_code=422,
+            detail=f"Unknown fields: {', '.join(unknown)}; "
+            f"expected any of {', '.join(FIELDS)}.",
+        )
+    return requested
+
+
+DOCUMENT_LIMITS = Limits(
+    max_bytes=config.MAX_DOCUMENT_BYTES,
+    max_paragraphs=config.MAX_DOCUMENT_PARAGRAPHS,
+    max_tokens=config.MAX_DOCUMENT_WORDS,
+)
+
+
+def admit_documents(*htmls: str, clusters: Iterable[ClusterDefinition] = ()) -> None:
+    """
+    Check the estimated cost of the documents of a request and of the phrases
+    of their topic clusters before they are analysed, and respond with 413 if
+    they are too large. The documents of a batch are analysed by the same
+    worker, so their total cost is checked.
+    """
+    phrases = [
+        phrase
+        for definition in clusters
+        for _, synonyms in definition
+        for phrase in synonyms
+    ]
+    try:
+        DOCUMENT_LIMITS.check(
+            sum(map(estimate_cost, [*htmls, *phrases]), Cost(0, 0, 0))
+        )
+    except DocumentTooLarge as e:
+        REJECTED_REQUESTS.inc("too_large")
+        logging.warning("Rejecting request: %s", e)
+        raise HTTPException(status_code=413, detail=str(e)) from e
+
+
+def service_busy(error: ExecutorSaturated) -> HTTPException:
+    """The response to a request rejected by the execution backend."""
+    REJECTED_REQUESTS.inc("queue_full")
+    logging.warning("Rejecting request: %s", error)
+    return HTTPException(
+        status_code=429,
+        detail="The analysis service is busy, please try again later.",
+        headers={"Retry-After": str(error.retry_after)},
+    )
+
+
+async def run_analysis(request: Request, func, *args):
+    """Run a blocking analysis function on the configured execution backend."""
+    try:
+        return await request.app.state.executor.run(func, *args)
+    except ExecutorSaturated as e:
+        raise service_busy(e) from e
+
+
+def stream_analysis(request: Request, func, *args) -> AsyncIterator[Any]:
+    """Run a streaming analysis function on the configured execution backend."""
+    try:
+        return request.app.state.executor.stream(func, *args)
+    except ExecutorSaturated as e:
+        raise service_busy(e) from e
+
+
+def to_ontopic_data(
+    result: dict, model: type[OnTopicData] = OnTopicData, **fields
+) -> OnTopicData:
+    """
+    Convert an analysis result into the response model, the fields that were
+    not generated keep their defaults.
+    """
+    data = {name: result[name] for name in FIELDS if name in result}
+    if "coherence" in data:
+        data["coherence"] = CoherenceData.model_validate(data["coherence"])
+    return model(**data, **fields)
+
+
+# The defaults of the coherence data and the keys of the clarity sentences that
+# the validation of the response models adds and keeps.
+COHERENCE_DEFAULTS = CoherenceData().model_dump()
+CLARITY_SENTENCE_FIELDS = tuple(ClaritySentenceData.model_fields)
+
+
+def trusted_field(name: str, value: Any) -> Any:
+    """
+    Prepare a field of an analysis result to be serialized without validation,
+    so that its JSON is the same as that of the validated field.
+    """
+    if name == "coherence" and value is not None:
+        return COHERENCE_DEFAULTS | value
+    if name == "clarity" and value is not None:
+        return [
+            (
+                d[:2] + ({key: d[2][key] for key in CLARITY_SENTENCE_FIELDS},) + d[3:]
+                if isinstance(d, tuple) and isinstance(d[2], dict)
+                else d
+            )
+            for d in value
+        ]
+    return value
+
+
+def to_ontopic_json(
+    result: dict, model: type[OnTopicData] = OnTopicData, **fields
+) -> str:
+    """
+    Serialize an analysis result as the response model without validating it.
+    The analysis results are trusted, set ONTOPIC_VALIDATE_RESPONSES to check
+    them against the model instead.
+    """
+    data = {
+        name: trusted_field(name, result[name]) for name in FIELDS if name in result
+    }
+    return model.model_construct(**data, **fields).model_dump_json(warnings=False)
+
+
+def json_response(response: Response, content: str | bytes) -> Response:
+    """A JSON response with the headers that were set on 'response'."""
+    return Response(
+        content=content, media_type="application/json", headers=response.headers
+    )
+
+
+def ontopic_response(
+    response: Response,
+    endpoint: str,
+    language: str,
+    result: dict,
+    model: type[OnTopicData] = OnTopicData,
+    **fields,
+) -> OnTopicData | Response:
+    """
+    Convert the result of a single document analysis into the response model,
+    or serialize it directly unless the responses are validated, and report the
+    document statistics and the stage timings.
+    """
+    timings = StageTimings(result["timings"])
+    if config.VALIDATE_RESPONSES:
+        with timings.stage("validation"):
+            content = to_ontopic_data(result, model, **fields)
+    else:
+        with timings.stage("serialization"):
+            content = to_ontopic_json(result, model, **fields)
+    stage_timings = timings.to_dict()
+    report_analysis(endpoint, language, result["stats"], stage_timings)
+    response.headers["Server-Timing"] = server_timing(stage_timings)
+    if isinstance(content, str):
+        return json_response(response, content)
+    return content
+
+
+async def analysis_etag(request: Request, language: str) -> str:
+    """
+    The ETag of the result of an analysis request: a hash of its body and query,
+    its locale, and the versions of the model and of the service.
+    """
+    model_name = request.app.state.nlp_models[language].model_name
+    return result_etag(
+        await request.body(),
+        request.url.query,
+        language,
+        model_name,
+        model_version(model_name),
+        request.app.version,
+    )
+
+
+def cached_result(
+    request: Request, response: Response, etag: str
+) -> Optional[Response]:
+    """
+    Set the ETag of the result and answer with 304 if the client already has
+    it, or with the cached result. None if the request has to be analysed.
+    """
+    response.headers["ETag"] = etag
+    if etag_matches(request.headers.get("If-None-Match"), etag):
+        RESULT_CACHE_LOOKUPS.inc("not_modified")
+        # The same Vary as the 200, which CompressionMiddleware adds to bodies.
+        not_modified = Response(status_code=304, headers=response.headers)
+        not_modified.headers.add_vary_header("Accept-Encoding")
+        return not_modified
+    body = RESULT_CACHE.get(etag)
+    if body is None:
+        RESULT_CACHE_LOOKUPS.inc("miss")
+        return None
+    RESULT_CACHE_LOOKUPS.inc("hit")
+    return json_response(response, body)
+
+
+def cache_result(etag: str, content: Any) -> Any:
+    """Keep a serialized result for the requests with the same ETag."""
+    if isinstance(content, Response):
+        RESULT_CACHE.put(etag, bytes(content.body))
+    return content
+
+
+def report_analysis(
+    endpoint: str,
+    language: str,
+    stats: dict[str, int],
+    stage_timings: dict[str, tuple[float, float]],
+) -> None:
+    """Add the document statistics and stage timings to the metrics and the log."""
+    observe_document(endpoint, language, stats)
+    observe_stages(stage_timings, language, stats["paragraphs"])
+    log = {"locale": language, "paragraphs": stats["paragraphs"]}
+    log.update(log_fields(stage_timings))
+    logging.info(
+        "onTopic stage timings: %s",
+        " ".join(f"{key}={value}" for key, value in log.items()),
+        extra=log,
+    )
@@ -0,0 +1,109 @@
+"""Analysis of uploaded Word documents."""
+
+import asyncio
+import logging
+import tempfile
+from concurrent.futures import Executor
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, BinaryIO, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+
+import config
+from analysis import ontopic_analysis
+from api_common import (
+    admit_documents,
+    get_fields,
+    get_language,
+    ontopic_response,
+    run_analysis,
+)
+from api_schemas import OnTopicData
+from docx_import import InvalidDocument, docx_to_html
+from metrics import REJECTED_REQUESTS
+from stage_timer import StageTimings
+
+router = APIRouter()
+
+DOCX = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+
+# Uploads are kept in memory up to this size, and written to disk beyond it.
+UPLOAD_SPOOL_BYTES = 1_000_000
+
+
+def upload_too_large() -> HTTPException:
+    """The response to an upload larger than MAX_UPLOAD_BYTES."""
+    REJECTED_REQUESTS.inc("too_large")
+    return HTTPException(
+        status_code=413,
+        detail="The document is too large to be uploaded, the limit is "
+        f"{config.MAX_UPLOAD_BYTES} bytes.",
+    )
+
+
+@asynccontextmanager
+async def spool_upload(
+    request: Request,
+) -> AsyncIterator[tempfile.SpooledTemporaryFile]:
+    """
+    Stream the body of a request to a temporary file, and respond with 413 if
+    it is larger than MAX_UPLOAD_BYTES. The file is closed on exit.
+    """
+    limit = config.MAX_UPLOAD_BYTES
+    length = request.headers.get("Content-Length", "")
+    if limit > 0 and length.isdigit() and int(length) > limit:
+        raise upload_too_large()
+    with tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_BYTES) as upload:
+        size = 0
+        async for chunk in request.stream():
+            size += len(chunk)
+            if 0 < limit < size:
+                raise upload_too_large()
+            upload.write(chunk)
+        upload.seek(0)
+        yield upload
+
+
+def convert_docx(
+    upload: BinaryIO, pool: Optional[Executor], timings: StageTimings
+) -> str:
+    """Convert an uploaded Word document to HTML, timed as the "docx" stage."""
+    with timings.stage("docx"):
+        return docx_to_html(upload, pool)
+
+
+@router.post(
+    "/api/v2/ontopic/docx",
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {DOCX: {"schema": {"type": "string", "format": "binary"}}},
+        }
+    },
+)
+async def ontopic_docx(
+    request: Request,
+    response: Response,
+    language: str = Depends(get_language),
+    fields: tuple[str, ...] = Depends(get_fields),
+) -> OnTopicData:
+    """
+    Analyse a Word document posted as the request body, the same as
+    /api/v2/ontopic with the HTML of the document. The images of the document
+    are scaled down to be displayed in the html field.
+    """
+    logging.info("Received onTopic docx request for language: %s", language)
+    timings = StageTimings()
+    async with spool_upload(request) as upload:
+        try:
+            html = await asyncio.to_thread(
+                convert_docx, upload, request.app.state.image_pool, timings
+            )
+        except InvalidDocument as e:
+            raise HTTPException(status_code=422, detail=str(e)) from e
+    admit_documents(html)
+    result = await run_analysis(request, ontopic_analysis, language, html, fields)
+    result["timings"] = timings.to_dict() | result["timings"]
+
+    response.headers["Content-Language"] = language
+    return ontopic_response(response, "/api/v2/ontopic/docx", language, result)
@@ -0,0 +1,233 @@
+"""Request and response models of the onTopic endpoints."""
+
+from typing import Annotated, Optional
+
+from pydantic import BaseModel, Field
+
+import config
+from topic_clusters import ClusterDefinition, cluster_definition
+
+
+class TopicCluster(BaseModel):  # pylint: disable=too-few-public-methods
+    """A user defined topic and the words and phrases that refer to it."""
+
+    topic: Annotated[
+        str,
+        Field(
+            description='The topic, e.g., "climate change".',
+            min_length=1,
+            max_length=config.MAX_TOPIC_LENGTH,
+        ),
+    ]
+    synonyms: Annotated[
+        list[Annotated[str, Field(max_length=config.MAX_TOPIC_LENGTH)]],
+        Field(
+            description="Other words and phrases for the topic, e.g., "
+            '"global warming". The topic itself is always included.',
+            max_length=config.MAX_CLUSTER_SYNONYMS,
+        ),
+    ] = []
+
+
+class OnTopicRequest(BaseModel):  # pylint: disable=too-few-public-methods
+    """onTopic input JSON."""
+
+    base: Annotated[str, Field(description="The HTML fragment string to be analysed.")]
+    custom: Annotated[
+        Optional[str],
+        Field(description="Custom settings for the analysis", deprecated=True),
+    ] = None
+    customStructured: Annotated[
+        Optional[list[Annotated[str, Field(max_length=config.MAX_TOPIC_LENGTH)]]],
+        Field(
+            description="Multi-word topics, e.g., \"climate change\", that are "
+            "analysed as a single word.",
+            max_length=config.MAX_CLUSTERS,
+        ),
+    ] = None
+    clusters: Annotated[
+        Optional[list[TopicCluster]],
+        Field(
+            description="Topic clusters: their words and phrases are analysed as "
+            "the same topic and they are always listed in the coherence data.",
+            max_length=config.MAX_CLUSTERS,
+        ),
+    ] = None
+
+
+def request_clusters(data: OnTopicRequest) -> ClusterDefinition:
+    """The topic clusters and multi-word topics of a request."""
+    return cluster_definition(
+        ((cluster.topic, cluster.synonyms) for cluster in data.clusters or ()),
+        data.customStructured or (),
+    )
+
+
+type Lemma = list[str | bool | None | int]
+
+
+class NounChunk(BaseModel):  # pylint: disable=too-few-public-methods
+    """onTopic Clarity noun chunk data."""
+
+    text: str
+    start: int
+    end: int
+
+
+class Token(BaseModel):  # pylint: disable=too-few-public-methods
+    """onTopic sentence Tokens."""
+
+    text: Annotated[str, Field(description="The text of the token")]
+    is_root: Annotated[
+        bool, Field(description="Whether the token is the root of the sentence")
+    ]
+
+
+class SentenceData(BaseModel):  # pylint: disable=too-few-public-methods
+    """onTopic Clarity sentence statistics."""
+
+    NOUNS: Annotated[int, Field(description="Total number of nouns in the sentence")]
+    HNOUNS: Annotated[
+        int, Field(description="Total number of head nouns in the sentence")
+    ]
+    L_HNOUNS: Annotated[
+        int, Field(description="Head nouns on the left side of the main verb")
+    ]
+    R_HNOUNS: Annotated[
+        int, Field(description="Head nouns on the right side of the main verb")
+    ]
+    L_NOUNS: Annotated[
+        list[Lemma],
+        Field(description="List of noun lemmas on the left side of the main verb"),
+    ]
+    R_NOUNS: Annotated[
+        list[Lemma],
+        Field(description="List of noun lemmas on the right side of the main verb"),
+    ]
+    MV_LINKS: Annotated[
+        int, Field(description="Total number of links from the root verb")
+    ]
+    MV_L_LINKS: Annotated[
+        int, Field(description="Total number of left links from the root verb")
+    ]
+    MV_R_LINKS: Annotated[
+        int, Field(description="Total number of right links from the root verb")
+    ]
+    V_LINKS: Annotated[
+        int, Field(description="Total number of links from all the non-root verbs")
+    ]
+    V_L_LINKS: Annotated[
+        int, Field(description="Total number of left links from all the non-root verbs")
+    ]
+    V_R_LINKS: Annotated[
+        int,
+        Field(description="Total number of right links from all the non-root verbs"),
+    ]
+    NR_VERBS: Annotated[int, Field(description="Total number of non-root verbs")]
+    NPS: list[str]
+    NUM_NPS: Annotated[int, Field(description="Total number of noun phrases")]
+    L_NPS: Annotated[
+        int,
+        Field(description="Number of noun phrases on the left side of the main verb"),
+    ]
+    R_NPS: Annotated[
+        int,
+        Field(description="Number of noun phrases on the right side of the main verb"),
+    ]
+    BE_VERB: Annotated[
+        bool, Field(description="Whether the sentence contains a be verb")
+    ]
+    HEADING: Annotated[bool, Field(description="Whether the sentence is a heading")]
+    NOUN_CHUNKS: list[NounChunk]
+    TOKENS: list[Token]
+    MOD_CL: None | tuple[int, int, str, int]  # [start, end, mod_cl, last_np]
+
+
+class ClaritySentenceData(BaseModel):  # pylint: disable=too-few-public-methods
+    """onTopic Clarity sentence lemma support data."""
+
+    text: str
+    text_w_info: list[Lemma]
+    sent_analysis: SentenceData
+    lemmas: list[Lemma]
+    accum_lemmas: list[Lemma]
+    given_lemmas: list[Lemma]
+    new_lemmas: list[Lemma]
+    given_accum_lemmas: list[Lemma]
+    new_accum_lemmas: list[Lemma]
+
+
+type ClarityData = str | tuple[int, int, ClaritySentenceData, bool]
+
+
+class CoherenceParagraph(BaseModel):  # pylint: disable=too-few-public-methods
+    """onTopic Coherence paragraph data."""
+
+    first_left_sent_id: int
+    is_left: bool
+    is_topic_sent: bool
+    para_pos: int
+
+
+class CoherenceDatum(BaseModel):  # pylint: disable=too-few-public-methods
+    """onTopic Coherence supporting data."""
+
+    is_non_local: Optional[bool] = None
+    is_topic_cluster: Optional[bool] = None
+    paragraphs: list[CoherenceParagraph | None] = []
+    sent_count: Optional[int]
+    topic: list[str] = []
+
+
+class CoherenceData(BaseModel):  # pylint: disable=too-few-public-methods
+    """onTopic Coherence data."""
+
+    error: Optional[str] = None
+    data: list[CoherenceDatum] = []
+    num_paras: int = 0
+    num_topics: int = 0
+
+
+class LocalSentenceData(BaseModel):  # pylint: disable=too-few-public-methods
+    """onTopic local data item sentence data."""
+
+    is_left: bool
+    is_topic_sent: bool
+    para_pos: int
+    sent_pos: int
+
+
+class LocalDatum(BaseModel):  # pylint: disable=too-few-public-methods
+    """onTopic local data list item."""
+
+    is_global: bool
+    is_non_local: Optional[bool] = None
+    is_topic_cluster: Optional[bool] = None
+    num_sents: int
+    sentences: list[LocalSentenceData | None] = []
+    topic: list[str] = []
+
+
+class LocalData(BaseModel):  # pylint: disable=too-few-public-methods
+    """onTopic local data."""
+
+    error: Optional[str] = None
+    data: list[LocalDatum] = []
+
+
+class OnTopicData(BaseModel):  # pylint: disable=too-few-public-methods
+    """onTopic JSON data."""
+
+    clarity: Annotated[
+        Optional[list[ClarityData]],
+        Field(description="Clarity analysis data for each sentence"),
+    ] = []
+    coherence: Annotated[
+        Optional[CoherenceData], Field(description="Coherence analysis data")
+    ] = None
+    html: Annotated[
+        Optional[str],
+        Field(description="The annotated HTML output of the original text."),
+    ] = ""
+    html_sentences: Optional[list[list[str]]] = []
+    local: Optional[list[LocalData]] = []
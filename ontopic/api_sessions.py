@@ -0,0 +1,135 @@
+"""Incremental analysis sessions: the edits of a document are analysed again."""
+
+import logging
+from typing import Annotated, Literal, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from pydantic import BaseModel, Field
+
+from analysis import FIELDS, InvalidEdit, edit_analysis, ontopic_analysis
+from api_common import admit_documents, get_language, ontopic_response, run_analysis
+from api_schemas import OnTopicData, OnTopicRequest, request_clusters
+from sessions import Session
+
+router = APIRouter()
+
+
+class ParagraphEdit(BaseModel):  # pylint: disable=too-few-public-methods
+    """A change to one block element of the last analysis of a session."""
+
+    id: Annotated[
+        str,
+        Field(description='The id of the element in the last analysis, e.g., "p3".'),
+    ]
+    op: Annotated[
+        Literal["replace", "remove", "insert_before", "insert_after"],
+        Field(description="How the element is changed."),
+    ] = "replace"
+    html: Annotated[
+        Optional[str],
+        Field(
+            description="The new HTML, required and not empty for all but the "
+            "remove operation."
+        ),
+    ] = None
+
+
+class OnTopicEditRequest(BaseModel):  # pylint: disable=too-few-public-methods
+    """Incremental onTopic input JSON."""
+
+    edits: Annotated[
+        list[ParagraphEdit],
+        Field(description="The edits, the ids all refer to the last analysis."),
+    ]
+
+
+class OnTopicSessionData(OnTopicData):  # pylint: disable=too-few-public-methods
+    """onTopic JSON data of an incremental analysis session."""
+
+    session: Annotated[
+        str, Field(description="The handle of the session for follow-up edits.")
+    ]
+
+
+def get_session(request: Request, handle: str) -> Session:
+    """Get a session by handle, or respond with 404 if it has expired."""
+    session = request.app.state.sessions.get(handle)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired session.")
+    return session
+
+
+@router.post("/api/v2/ontopic/sessions")
+async def ontopic_session(
+    request: Request,
+    response: Response,
+    data: OnTopicRequest,
+    language: str = Depends(get_language),
+) -> OnTopicSessionData:
+    """
+    Analyse the posted prose and keep it in a session so that the following
+    analyses only need the edited paragraphs.
+    """
+    logging.info("Received onTopic session request for language: %s", language)
+    clusters = request_clusters(data)
+    admit_documents(data.base, clusters=[clusters])
+    result = await run_analysis(
+        request, ontopic_analysis, language, data.base, FIELDS, clusters
+    )
+    session = request.app.state.sessions.create(language, data.base, clusters)
+
+    response.headers["Content-Language"] = language
+    return ontopic_response(
+        response,
+        "/api/v2/ontopic/sessions",
+        language,
+        result,
+        OnTopicSessionData,
+        session=session.handle,
+    )
+
+
+@router.patch("/api/v2/ontopic/sessions/{handle}")
+async def ontopic_session_edit(
+    request: Request, response: Response, handle: str, data: OnTopicEditRequest
+) -> OnTopicSessionData:
+    """
+    Apply paragraph edits to the document of a session and analyse it again.
+    Only the edited paragraphs are parsed again if the others are in the
+    paragraph cache of the worker that runs the analysis: with the process
+    executor, this needs the shared disk tier (ONTOPIC_CACHE_DIR).
+    """
+    session = get_session(request, handle)
+    edits = [edit.model_dump() for edit in data.edits]
+    async with session.lock:
+        # The edited document is at most the current one and the new paragraphs.
+        admit_documents(session.html + "".join(e["html"] or "" for e in edits))
+        try:
+            html, result = await run_analysis(
+                request,
+                edit_analysis,
+                session.language,
+                session.html,
+                edits,
+                session.clusters,
+            )
+        except InvalidEdit as e:
+            raise HTTPException(status_code=422, detail=str(e)) from e
+        session.html = html
+
+    response.headers["Content-Language"] = session.language
+    return ontopic_response(
+        response,
+        "/api/v2/ontopic/sessions/{handle}",
+        session.language,
+        result,
+        OnTopicSessionData,
+        session=session.handle,
+    )
+
+
+@router.delete("/api/v2/ontopic/sessions/{handle}", status_code=204)
+async def ontopic_session_end(request: Request, handle: str) -> None:
+    """End a session."""
+    if not request.app.state.sessions.remove(handle):
+        raise HTTPException(status_code=404, detail="Unknown or expired session.")
@@ -0,0 +1,99 @@
+"""Streaming of the onTopic results as newline delimited JSON."""
+
+import json
+import logging
+from typing import AsyncIterator
+
+from fastapi import APIRouter, Depends, Request
+from fastapi.responses import StreamingResponse
+from pydantic import TypeAdapter
+
+import config
+from analysis import FIELDS, ontopic_stream_analysis
+from api_common import (
+    admit_documents,
+    get_fields,
+    get_language,
+    report_analysis,
+    stream_analysis,
+    trusted_field,
+)
+from api_schemas import OnTopicData, OnTopicRequest, request_clusters
+from stage_timer import StageTimings
+from topic_clusters import ClusterDefinition
+
+router = APIRouter()
+
+NDJSON = "application/x-ndjson"
+
+# Serialize each field of OnTopicData on its own for streaming.
+FIELD_ADAPTERS = {
+    name: TypeAdapter(field.annotation)
+    for name, field in OnTopicData.model_fields.items()
+}
+
+
+def ndjson_response(
+    request: Request,
+    language: str,
+    html: str,
+    fields: tuple[str, ...] = FIELDS,
+    clusters: ClusterDefinition = (),
+) -> StreamingResponse:
+    """
+    Stream an analysis as newline delimited JSON. Each line is an object with
+    one of the requested OnTopicData fields, the clarity field comes in a line
+    for each block element and its lists have to be concatenated. The metrics
+    are reported for the endpoint of the request's route.
+    """
+    endpoint = request.scope["route"].path
+    items = stream_analysis(
+        request, ontopic_stream_analysis, language, html, fields, clusters
+    )
+
+    async def lines() -> AsyncIterator[bytes]:
+        timings = StageTimings()
+        try:
+            async for item in items:
+                if "timings" in item:
+                    timings = StageTimings(item["timings"] | timings.to_dict())
+                    report_analysis(
+                        endpoint, language, item["stats"], timings.to_dict()
+                    )
+                    continue
+                [(name, value)] = item.items()
+                adapter = FIELD_ADAPTERS[name]
+                if config.VALIDATE_RESPONSES:
+                    with timings.stage("validation"):
+                        data = adapter.dump_json(adapter.validate_python(value))
+                else:
+                    with timings.stage("serialization"):
+                        data = adapter.dump_json(
+                            trusted_field(name, value), warnings=False
+                        )
+                yield b'{"' + name.encode() + b'":' + data + b"}\n"
+        except Exception:  # pylint: disable=broad-exception-caught
+            # The response has started, report the error in the stream.
+            logging.exception("onTopic streaming analysis failed")
+            yield json.dumps({"error": "The analysis failed."}).encode() + b"\n"
+
+    return StreamingResponse(
+        lines(), media_type=NDJSON, headers={"Content-Language": language}
+    )
+
+
+@router.post("/api/v2/ontopic/stream", response_class=StreamingResponse)
+async def ontopic_stream(
+    request: Request,
+    data: OnTopicRequest,
+    language: str = Depends(get_language),
+    fields: tuple[str, ...] = Depends(get_fields),
+):
+    """
+    Analyse the posted prose and stream the results as newline delimited JSON,
+    the same as /api/v2/ontopic with an "Accept: application/x-ndjson" header.
+    """
+    logging.info("Received onTopic stream request for language: %s", language)
+    clusters = request_clusters(data)
+    admit_documents(data.base, clusters=[clusters])
+    return ndjson_response(request, language, data.base, fields, clusters)
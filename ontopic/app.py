@@ -1,14 +1,84 @@
 """onTopic Web API"""
 
+import asyncio
 import logging
-from typing import Annotated, Optional
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Annotated, Literal, Optional
 
 from fastapi import Depends, FastAPI, Header, Request, Response
-from langcodes import tag_is_valid, closest_supported_match
 from pydantic import AfterValidator, BaseModel, Field
 
-from localization.NLP import NLP_MODELS, Locale
-from ds_document import DSDocument, TopicSort
+import config
+from admission import ClientConcurrencyMiddleware
+from analysis import ontopic_analysis, segment_analysis
+from api_batch import router as batch_router
+from api_common import (
+    admit_documents,
+    analysis_etag,
+    cache_result,
+    cached_result,
+    get_fields,
+    get_language,
+    ontopic_response,
+    run_analysis,
+    validate_language,
+)
+from api_docx import router as docx_router
+from api_schemas import OnTopicData, OnTopicRequest, request_clusters
+from api_sessions import router as sessions_router
+from api_stream import NDJSON, ndjson_response, router as stream_router
+from executor import AnalysisExecutor, ExecutionMode
+from http_compression import CompressionMiddleware
+from localization.NLP import NLP_MODELS, preload_models
+from metrics import (
+    CONTENT_TYPE,
+    REGISTRY,
+    SESSIONS,
+    RequestMetricsMiddleware,
+    watch_executor,
+)
+from sessions import SessionStore
+
+
+@asynccontextmanager
+async def lifespan(fastapi_app: FastAPI):
+    """
+    Load the language models that are preloaded in this process, then start
+    and stop the analysis execution backend and the session store.
+    """
+    mode = ExecutionMode(config.EXECUTOR)
+    prefork = config.PREFORK and mode == ExecutionMode.PROCESS
+    if mode != ExecutionMode.PROCESS or prefork:
+        preload_models(config.PRELOAD_LANGUAGES)
+    fastapi_app.state.executor = AnalysisExecutor(
+        mode=mode,
+        max_workers=config.WORKERS,
+        max_queue=config.MAX_QUEUE,
+        prefork=prefork,
+        locales=len(NLP_MODELS),
+    )
+    fastapi_app.state.executor.start()
+    if mode == ExecutionMode.PROCESS and not config.CACHE_DIR:
+        logging.warning(
+            "The session edits are parsed again in full when they run in "
+            "another worker process, set ONTOPIC_CACHE_DIR to share the "
+            "paragraph cache between the workers"
+        )
+    watch_executor(fastapi_app.state.executor)
+    fastapi_app.state.image_pool = (
+        ProcessPoolExecutor(max_workers=config.IMAGE_WORKERS)
+        if config.IMAGE_WORKERS > 0
+        else None
+    )
+    sessions = SessionStore(ttl=config.SESSION_TTL, max_sessions=config.MAX_SESSIONS)
+    fastapi_app.state.sessions = sessions
+    SESSIONS.set_function(lambda: len(sessions))
+    yield
+    fastapi_app.state.executor.shutdown()
+    if fastapi_app.state.image_pool is not None:
+        fastapi_app.state.image_pool.shutdown(wait=True, cancel_futures=True)
+
 
 app = FastAPI(
     title="onTopic Tools",
@@ -19,279 +89,144 @@
         "name": "CC BY-NC-SA 4.0",
         "url": "https://creativecommons.org/licenses/by-nc-sa/4.0/",
     },
+    lifespan=lifespan,
 )
 
 
 app.state.nlp_models = NLP_MODELS
 
-# Unused, to be removed, replace with prometheus library
-# @app.get("/metrics")
-# async def metrics():
-#   pass
-
-
-class OnTopicRequest(BaseModel):  # pylint: disable=too-few-public-methods
-    """onTopic input JSON."""
-
-    base: Annotated[str, Field(description="The HTML fragment string to be analysed.")]
-    custom: Annotated[
-        Optional[str],
-        Field(description="Custom settings for the analysis", deprecated=True),
-    ] = None
-    customStructured: Annotated[
-        Optional[list[str]],
-        Field(
-            description="Custom structured settings for the analysis", deprecated=True
-        ),
-    ] = None
-
-
-type Lemma = list[str | bool | None | int]
-
+app.add_middleware(
+    ClientConcurrencyMiddleware,
+    max_requests=config.MAX_CLIENT_REQUESTS,
+    header=config.CLIENT_HEADER,
+    proxies=config.CLIENT_PROXIES,
+)
+app.add_middleware(
+    CompressionMiddleware,
+    encodings=config.COMPRESSION,
+    minimum_size=config.COMPRESSION_MIN_BYTES,
+)
+app.add_middleware(
+    RequestMetricsMiddleware, language=lambda scope: get_language(Request(scope))
+)
 
-class NounChunk(BaseModel):  # pylint: disable=too-few-public-methods
-    """onTopic Clarity noun chunk data."""
 
-    text: str
-    start: int
-    end: int
+@app.get("/metrics", include_in_schema=False)
+async def metrics() -> Response:
+    """Return the service metrics in the Prometheus text exposition format."""
+    return Response(content=REGISTRY.expose(), media_type=CONTENT_TYPE)
 
 
-class Token(BaseModel):  # pylint: disable=too-few-public-methods
-    """onTopic sentence Tokens."""
+class Liveness(BaseModel):  # pylint: disable=too-few-public-methods
+    """Liveness probe JSON."""
 
-    text: Annotated[str, Field(description="The text of the token")]
-    is_root: Annotated[
-        bool, Field(description="Whether the token is the root of the sentence")
-    ]
+    status: Literal["ok"] = "ok"
 
 
-class SentenceData(BaseModel):  # pylint: disable=too-few-public-methods
-    """onTopic Clarity sentence statistics."""
+class Readiness(BaseModel):  # pylint: disable=too-few-public-methods
+    """Readiness probe JSON."""
 
-    NOUNS: Annotated[int, Field(description="Total number of nouns in the sentence")]
-    HNOUNS: Annotated[
-        int, Field(description="Total number of head nouns in the sentence")
-    ]
-    L_HNOUNS: Annotated[
-        int, Field(description="Head nouns on the left side of the main verb")
-    ]
-    R_HNOUNS: Annotated[
-        int, Field(description="Head nouns on the right side of the main verb")
-    ]
-    L_NOUNS: Annotated[
-        list[Lemma],
-        Field(description="List of noun lemmas on the left side of the main verb"),
-    ]
-    R_NOUNS: Annotated[
-        list[Lemma],
-        Field(description="List of noun lemmas on the right side of the main verb"),
-    ]
-    MV_LINKS: Annotated[
-        int, Field(description="Total number of links from the root verb")
-    ]
-    MV_L_LINKS: Annotated[
-        int, Field(description="Total number of left links from the root verb")
-    ]
-    MV_R_LINKS: Annotated[
-        int, Field(description="Total number of right links from the root verb")
-    ]
-    V_LINKS: Annotated[
-        int, Field(description="Total number of links from all the non-root verbs")
-    ]
-    V_L_LINKS: Annotated[
-        int, Field(description="Total number of left links from all the non-root verbs")
-    ]
-    V_R_LINKS: Annotated[
-        int,
-        Field(description="Total number of right links from all the non-root verbs"),
+    ready: bool
+    reasons: Annotated[
+        list[str], Field(description="Why the service is not ready, if it is not.")
+    ] = []
+    models: Annotated[
+        Optional[dict[str, bool]],
+        Field(
+            description="Whether the model of each language is loaded, null when "
+            "the models are only loaded in the analysis worker processes."
+        ),
     ]
-    NR_VERBS: Annotated[int, Field(description="Total number of non-root verbs")]
-    NPS: list[str]
-    NUM_NPS: Annotated[int, Field(description="Total number of noun phrases")]
-    L_NPS: Annotated[
-        int,
-        Field(description="Number of noun phrases on the left side of the main verb"),
+    queue_depth: Annotated[
+        int, Field(description="Number of analyses waiting for a free worker.")
     ]
-    R_NPS: Annotated[
+    max_queue: Annotated[
         int,
-        Field(description="Number of noun phrases on the right side of the main verb"),
+        Field(description="Analyses beyond this many are rejected, 0 is unbounded."),
     ]
-    BE_VERB: Annotated[
-        bool, Field(description="Whether the sentence contains a be verb")
+    in_flight: Annotated[int, Field(description="Number of analyses being processed.")]
+    oldest_job_seconds: Annotated[
+        float,
+        Field(description="Age of the oldest running or queued analysis, in seconds."),
     ]
-    HEADING: Annotated[bool, Field(description="Whether the sentence is a heading")]
-    NOUN_CHUNKS: list[NounChunk]
-    TOKENS: list[Token]
-    MOD_CL: None | tuple[int, int, str, int]  # [start, end, mod_cl, last_np]
-
-
-class ClaritySentenceData(BaseModel):  # pylint: disable=too-few-public-methods
-    """onTopic Clarity sentence lemma support data."""
-
-    text: str
-    text_w_info: list[Lemma]
-    sent_analysis: SentenceData
-    lemmas: list[Lemma]
-    accum_lemmas: list[Lemma]
-    given_lemmas: list[Lemma]
-    new_lemmas: list[Lemma]
-    given_accum_lemmas: list[Lemma]
-    new_accum_lemmas: list[Lemma]
-
-
-type ClarityData = str | tuple[int, int, ClaritySentenceData, bool]
-
-
-class CoherenceParagraph(BaseModel):  # pylint: disable=too-few-public-methods
-    """onTopic Coherence paragraph data."""
-
-    first_left_sent_id: int
-    is_left: bool
-    is_topic_sent: bool
-    para_pos: int
-
-
-class CoherenceDatum(BaseModel):  # pylint: disable=too-few-public-methods
-    """onTopic Coherence supporting data."""
-
-    is_non_local: Optional[bool] = None
-    is_topic_cluster: Optional[bool] = None
-    paragraphs: list[CoherenceParagraph | None] = []
-    sent_count: Optional[int]
-    topic: list[str] = []
-
-
-class CoherenceData(BaseModel):  # pylint: disable=too-few-public-methods
-    """onTopic Coherence data."""
-
-    error: Optional[str] = None
-    data: list[CoherenceDatum] = []
-    num_paras: int = 0
-    num_topics: int = 0
-
 
-class LocalSentenceData(BaseModel):  # pylint: disable=too-few-public-methods
-    """onTopic local data item sentence data."""
 
-    is_left: bool
-    is_topic_sent: bool
-    para_pos: int
-    sent_pos: int
+@app.get("/healthz", include_in_schema=False)
+async def healthz() -> Liveness:
+    """Liveness probe, answered as long as the event loop is responsive."""
+    return Liveness()
 
 
-class LocalDatum(BaseModel):  # pylint: disable=too-few-public-methods
-    """onTopic local data list item."""
-
-    is_global: bool
-    is_non_local: Optional[bool] = None
-    is_topic_cluster: Optional[bool] = None
-    num_sents: int
-    sentences: list[LocalSentenceData | None] = []
-    topic: list[str] = []
-
-
-class LocalData(BaseModel):  # pylint: disable=too-few-public-methods
-    """onTopic local data."""
-
-    error: Optional[str] = None
-    data: list[LocalDatum] = []
-
-
-class OnTopicData(BaseModel):  # pylint: disable=too-few-public-methods
-    """onTopic JSON data."""
-
-    clarity: Annotated[
-        Optional[list[ClarityData]],
-        Field(description="Clarity analysis data for each sentence"),
-    ] = []
-    coherence: Annotated[
-        Optional[CoherenceData], Field(description="Coherence analysis data")
-    ] = None
-    html: Annotated[
-        Optional[str],
-        Field(description="The annotated HTML output of the original text."),
-    ] = ""
-    html_sentences: Optional[list[list[str]]] = []
-    local: Optional[list[LocalData]] = []
-
-
-def validate_language(accept_language: Optional[str]) -> str:
-    """Validate the language tag and return a standardized version."""
-    if accept_language is None or accept_language == "*":
-        return "en"
-    for l in [l.strip() for l in accept_language.split(",")]:
-        [la, _] = l.split(";") if ";" in l else (l, "")
-        if tag_is_valid(la):
-            return closest_supported_match(la, app.state.nlp_models.keys()) or "en"
-    raise ValueError(f"Unsupported language: {accept_language}")
-
-
-def get_locale(request: Request) -> Locale:
-    """Get the appropriate NLP model based on the Accept-Language header."""
-    accept_language = request.headers.get("Accept-Language", "en")
-    try:
-        lang = validate_language(accept_language)
-    except ValueError as e:
-        logging.warning(f"Language validation error: {e}, defaulting to 'en'")
-        lang = "en"
-    return request.app.state.nlp_models.get(lang, request.app.state.nlp_models["en"])
+@app.get("/readyz", include_in_schema=False)
+async def readyz(request: Request, response: Response) -> Readiness:
+    """
+    Readiness probe, 503 if the analysis queue is full or an analysis has been in
+    progress for more than ONTOPIC_READY_MAX_JOB_SECONDS, so that the load
+    balancer sends the requests to other instances.
+    """
+    executor = request.app.state.executor
+    reasons = []
+    if 0 < executor.max_queue <= executor.queue_depth:
+        reasons.append("The analysis queue is full.")
+    oldest = executor.oldest_job_seconds
+    if 0 < config.READY_MAX_JOB_SECONDS < oldest:
+        reasons.append(f"An analysis has been in progress for {oldest:.0f} s.")
+    if reasons:
+        response.status_code = 503
+    models = None
+    if executor.mode != ExecutionMode.PROCESS or executor.prefork:
+        models = {
+            language: locale.loaded
+            for language, locale in request.app.state.nlp_models.items()
+        }
+    return Readiness(
+        ready=not reasons,
+        reasons=reasons,
+        models=models,
+        queue_depth=executor.queue_depth,
+        max_queue=executor.max_queue,
+        in_flight=executor.in_flight,
+        oldest_job_seconds=round(oldest, 3),
+    )
 
 
 @app.post("/api/v2/ontopic")
 async def ontopic(
+    request: Request,
     response: Response,
     data: OnTopicRequest,
     accept_language: Annotated[
         Optional[str], Header(), AfterValidator(validate_language)
     ] = "en",
-    locale: Locale = Depends(get_locale),
+    fields: tuple[str, ...] = Depends(get_fields),
 ) -> OnTopicData:
     """Analyse the posted prose for coherence and clarity."""
-    logging.info(f"Received onTopic request for language: {accept_language}")
-    with locale.nlp.memory_zone():
-        document = DSDocument(locale=locale)
-        document.loadFromHtmlString(f"<body>{data.base}</body>")
-
-        coherence = document.generateGlobalVisData(2, 1, TopicSort.APPEARANCE)
-        clarity = document.getSentStructureData()
-        # Remove redundant data as it is unexpected in the frontend.
-        clarity_data: list[ClarityData] = [
-            d[:2] + d[3:] if isinstance(d, tuple) else d for d in clarity
-        ]
-        topics = document.getCurrentTopics()
-
-        num_paragraphs = coherence.get("num_paras")
-        if num_paragraphs:
-            logging.info(
-                "Number of paragraphs processed: %d (might be 1 for very short text)",
-                num_paragraphs,
-            )
-        else:
-            logging.warning(
-                "Error obtaining number of paragraphs from %d, setting to 0", num_paragraphs
-            )
-            num_paragraphs = 0
-
-        # Currently unused in visualization,
-        #  reduce processing by not performing this analysis.
-        # [LocalData.model_validate(document.generateGlobalVisData([i], 1, 2))
-        #  for i in range(1, nrParagraphs+1)]
-        local = []
-
-        html = document.toHtml(topics, -1)
-        html_sentences = document.getHtmlSents(clarity)
+    language = accept_language or "en"
+    logging.info("Received onTopic request for language: %s", language)
+    clusters = request_clusters(data)
+    admit_documents(data.base, clusters=[clusters])
+    if NDJSON in request.headers.get("Accept", ""):
+        return ndjson_response(request, language, data.base, fields, clusters)
+    response.headers["Content-Language"] = language
+    etag = await analysis_etag(request, language)
+    cached = cached_result(request, response, etag)
+    if cached is not None:
+        return cached
+    result = await run_analysis(
+        request, ontopic_analysis, language, data.base, fields, clusters
+    )
 
-    response.headers["Content-Language"] = accept_language or "en"
-    return OnTopicData(
-        coherence=CoherenceData.model_validate(coherence),
-        local=local,
-        clarity=clarity_data,
-        html=html,
-        html_sentences=html_sentences,
+    return cache_result(
+        etag, ontopic_response(response, "/api/v2/ontopic", language, result)
     )
 
 
+app.include_router(stream_router)
+app.include_router(batch_router)
+app.include_router(docx_router)
+app.include_router(sessions_router)
+
+
 class SegmentRequest(BaseModel):  # pylint: disable=too-few-public-methods
     """segment request input JSON"""
 
@@ -300,23 +235,22 @@ class SegmentRequest(BaseModel):  # pylint: disable=too-few-public-methods
 
 @app.post("/api/v2/segment")
 async def segment(
+    request: Request,
     response: Response,
     data: SegmentRequest,
     accept_language: Annotated[
         Optional[str], Header(), AfterValidator(validate_language)
     ] = "en",
-    locale: Locale = Depends(get_locale),
+    language: str = Depends(get_language),
 ) -> str:
     """Segment the given text into sentences.
 
     Returns the original text with added id attributes for paragraphs
     and spans with id attributes for deliminating the sentences.
     """
-    logging.info(f"Received segment request for language: {accept_language}")
-    with locale.nlp.memory_zone():
-        document = DSDocument(locale=locale)
-        document.loadFromHtmlString(f"<body>{data.text}</body>")
-        xml = document.toXml()
+    logging.info("Received segment request for language: %s", accept_language)
+    admit_documents(data.text)
+    xml = await run_analysis(request, segment_analysis, language, data.text)
     response.headers["Content-Language"] = accept_language or "en"
     return xml
 
@@ -326,18 +260,17 @@ async def languages() -> list[str]:
     """Return the list of supported languages."""
     return list(app.state.nlp_models.keys())
 
-# For production, start this with the following:
-# > hypercorn app:app --bind 0.0.0.0:5000 --root-path /
+
+# For production, start this with the pre-fork launcher (see server.py):
+# > python server.py
 # Following is for developement and can be used as follows:
 # > python3 app.py
 if __name__ == "__main__":
     logging.basicConfig(level=logging.INFO)
-    import asyncio
-
     from hypercorn.asyncio import serve
     from hypercorn.config import Config
 
-    config = Config()
-    config.bind = ["0.0.0.0:5000"]
-    config.loglevel = "info"
-    asyncio.run(serve(app, config)) # type: ignore
+    hypercorn_config = Config()
+    hypercorn_config.bind = ["0.0.0.0:5000"]
+    hypercorn_config.loglevel = "info"
+    asyncio.run(serve(app, hypercorn_config))  # type: ignore
@@ -0,0 +1,565 @@
+"""Offline benchmark of the onTopic analysis pipeline.
+
+Runs the DSDocument stages and the FastAPI app in-process over a corpus of
+essays and reports, for each document, the latency percentiles and the
+throughput (paragraphs per second) of every stage, the end to end request
+latency and the peak memory of an analysis. The corpus is made of the
+essays in tests/test-texts.txt (or the .txt and .html files of a directory)
+and of synthetic documents of 1 to 500 paragraphs built from their
+sentences, so that super-linear stages stand out as the documents grow.
+
+Results are saved as JSON so that two runs can be compared:
+
+    > python benchmark.py run --output before.json
+    > python benchmark.py run --output after.json
+    > python benchmark.py compare before.json after.json
+
+The outputs command checks that a change keeps the results of the analysis:
+it saves the /api/v2/ontopic and /api/v2/segment results of the essays and
+of the nested HTML documents in tests/html/ before the change, and compares
+them, computed without and with the paragraph cache, after the change:
+
+    > python benchmark.py outputs --save baseline.json
+    > python benchmark.py outputs baseline.json
+
+The pipeline command checks that the trimmed spaCy pipeline of a locale (see
+EXCLUDE_COMPONENTS in localization/) parses the corpus exactly like the full
+model, and reports the time of each pipeline component:
+
+    > python benchmark.py pipeline --language en
+"""
+
+import html
+import json
+import os
+import platform
+import random
+import re
+import statistics
+import sys
+import time
+import tracemalloc
+from contextlib import ExitStack
+from datetime import datetime, timezone
+from typing import Any, Optional
+
+import click
+import spacy
+
+from analysis import (
+    document_results,
+    document_stats,
+    ontopic_analysis,
+    segment_analysis,
+)
+from corpus import load_corpus, paragraphs_to_html
+from ds_document import DSDocument
+from localization.NLP import NLP_MODELS, initialize_nlp_model
+from paragraph_cache import PARAGRAPH_CACHE
+from result_cache import RESULT_CACHE
+
+# Bump when the layout of the results changes.
+RESULTS_FORMAT = 1
+
+DEFAULT_CORPUS = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "tests", "test-texts.txt"
+)
+DEFAULT_HTML = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "tests", "html"
+)
+DEFAULT_SIZES = (1, 5, 10, 25, 50, 100, 250, 500)
+
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+##################################################
+# Corpus
+##################################################
+
+
+def corpus_sentences(corpus: dict[str, str]) -> list[str]:
+    """Collect the sentences of the corpus essays for the synthetic documents."""
+    sentences = []
+    for fragment in corpus.values():
+        for paragraph in re.findall(r"<p>(.*?)</p>", fragment, re.S):
+            text = html.unescape(re.sub(r"<[^>]+>", "", paragraph))
+            sentences.extend(s for s in SENTENCE_END.split(text) if s.strip())
+    return sentences
+
+
+def synthetic_document(sentences: list[str], num_paragraphs: int, seed: int = 0) -> str:
+    """
+    Create a document of num_paragraphs paragraphs of 3 to 8 sentences drawn
+    from the corpus. The same seed always creates the same document.
+    """
+    rng = random.Random(f"{seed}-{num_paragraphs}")
+    paragraphs = [
+        " ".join(rng.choice(sentences) for _ in range(rng.randint(3, 8)))
+        for _ in range(num_paragraphs)
+    ]
+    return paragraphs_to_html(paragraphs)
+
+
+##################################################
+# Measurements
+##################################################
+
+
+def percentile(values: list[float], q: float) -> float:
+    """Return the q-th percentile (0-100) with linear interpolation."""
+    ordered = sorted(values)
+    if len(ordered) == 1:
+        return ordered[0]
+    k = (len(ordered) - 1) * q / 100
+    low = int(k)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (k - low)
+
+
+def summarize(values: list[float]) -> dict[str, float]:
+    """Summarize a list of durations in seconds as milliseconds."""
+    return {
+        "mean": round(statistics.fmean(values) * 1000, 3),
+        "p50": round(percentile(values, 50) * 1000, 3),
+        "p90": round(percentile(values, 90) * 1000, 3),
+        "p99": round(percentile(values, 99) * 1000, 3),
+        "min": round(min(values) * 1000, 3),
+        "max": round(max(values) * 1000, 3),
+    }
+
+
+def analyse(language: str, fragment: str) -> DSDocument:
+    """Run the stages of an /api/v2/ontopic analysis without the cache."""
+    locale = NLP_MODELS[language]
+    with locale.nlp.memory_zone():
+        document = DSDocument(locale=locale)
+        document.setHtml(f"<body>{fragment}</body>")
+        document.processDoc()
+        document_results(document)
+    return document
+
+
+def bench_stages(
+    language: str, fragment: str, repeat: int, warmup: int
+) -> dict[str, Any]:
+    """Time each DSDocument stage of the analysis of a document."""
+    for _ in range(warmup):
+        analyse(language, fragment)
+
+    wall: dict[str, list[float]] = {}
+    cpu: dict[str, list[float]] = {}
+    total: list[float] = []
+    stats: dict[str, int] = {}
+    for _ in range(repeat):
+        start = time.perf_counter()
+        document = analyse(language, fragment)
+        total.append(time.perf_counter() - start)
+        stats = document_stats(document)
+        for stage, (stage_wall, stage_cpu) in document.timings.to_dict().items():
+            wall.setdefault(stage, []).append(stage_wall)
+            cpu.setdefault(stage, []).append(stage_cpu)
+
+    paragraphs = max(stats["paragraphs"], 1)
+    stages = {}
+    for stage, values in wall.items():
+        mean = statistics.fmean(values)
+        stages[stage] = {
+            "wall_ms": summarize(values),
+            "cpu_ms": summarize(cpu[stage]),
+            "paragraphs_per_s": round(paragraphs / mean, 1) if mean > 0 else None,
+        }
+    return {
+        "paragraphs": stats["paragraphs"],
+        "sentences": stats["sentences"],
+        "words": stats["words"],
+        "stages": stages,
+        "total_ms": summarize(total),
+    }
+
+
+def peak_memory(language: str, fragment: str) -> int:
+    """Return the peak memory in bytes allocated by Python during an analysis."""
+    tracemalloc.start()
+    try:
+        analyse(language, fragment)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak
+
+
+def bench_app(client, language: str, fragment: str, repeat: int) -> dict[str, Any]:
+    """Time the /api/v2/ontopic requests of a document, with empty caches."""
+    latencies = []
+    for _ in range(repeat):
+        PARAGRAPH_CACHE.clear()
+        RESULT_CACHE.clear()
+        start = time.perf_counter()
+        response = client.post(
+            "/api/v2/ontopic",
+            json={"base": fragment},
+            headers={"Accept-Language": language},
+        )
+        latencies.append(time.perf_counter() - start)
+        response.raise_for_status()
+    return {"request_ms": summarize(latencies)}
+
+
+def document_outputs(language: str, fragment: str) -> dict[str, Any]:
+    """
+    The /api/v2/ontopic results and the /api/v2/segment XML of a document,
+    without the timings and statistics, as they are serialized to JSON.
+    """
+    result = ontopic_analysis(language, fragment)
+    result.pop("timings", None)
+    result.pop("stats", None)
+    result["segment"] = segment_analysis(language, fragment)
+    return json.loads(json.dumps(result))
+
+
+def corpus_paragraphs(corpus: dict[str, str]) -> list[str]:
+    """Collect the paragraph texts of the corpus essays as they are parsed."""
+    return [
+        html.unescape(re.sub(r"<[^>]+>", "", paragraph))
+        for fragment in corpus.values()
+        for paragraph in re.findall(r"<p>(.*?)</p>", fragment, re.S)
+    ]
+
+
+def parse_signature(doc) -> list[tuple]:
+    """The parts of a parse used by the analysis, to compare two pipelines."""
+    tokens = [
+        (
+            t.text,
+            t.pos_,
+            t.tag_,
+            t.lemma_,
+            t.dep_,
+            t.head.i,
+            t.is_sent_start,
+        )
+        for t in doc
+    ]
+    return tokens + [(n.start, n.end) for n in doc.noun_chunks]
+
+
+def component_times(nlp, texts: list[str]) -> dict[str, float]:
+    """Parse the texts one component at a time, return the seconds of each."""
+    times = {"tokenizer": 0.0} | {name: 0.0 for name in nlp.pipe_names}
+    with nlp.memory_zone():
+        for text in texts:
+            start = time.perf_counter()
+            doc = nlp.make_doc(text)
+            times["tokenizer"] += time.perf_counter() - start
+            for name, component in nlp.pipeline:
+                start = time.perf_counter()
+                doc = component(doc)
+                times[name] += time.perf_counter() - start
+    return times
+
+
+def environment(language: str) -> dict[str, Any]:
+    """Describe where the benchmark ran, to tell apart incomparable runs."""
+    nlp = NLP_MODELS[language].nlp
+    return {
+        "format": RESULTS_FORMAT,
+        "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "spacy": spacy.__version__,
+        "model": f"{nlp.meta.get('name')}-{nlp.meta.get('version')}",
+        "pipeline": nlp.pipe_names,
+        "language": language,
+    }
+
+
+##################################################
+# Command line
+##################################################
+
+
+@click.group()
+def cli():
+    """onTopic pipeline benchmark."""
+
+
+@cli.command()
+@click.option(
+    "--corpus",
+    default=DEFAULT_CORPUS,
+    show_default=True,
+    help="Essays separated by '- - -' lines, or a directory of .txt/.html files.",
+)
+@click.option(
+    "--sizes",
+    default=",".join(str(s) for s in DEFAULT_SIZES),
+    show_default=True,
+    help="Paragraph counts of the synthetic documents, empty for none.",
+)
+@click.option("--seed", default=0, show_default=True, help="Synthetic corpus seed.")
+@click.option("--repeat", default=5, show_default=True, help="Timed runs.")
+@click.option("--warmup", default=1, show_default=True, help="Untimed runs.")
+@click.option("--language", default="en", show_default=True)
+@click.option("--app/--no-app", default=True, help="Also time the FastAPI app.")
+@click.option("--memory/--no-memory", default=True, help="Measure peak memory.")
+@click.option("--output", "-o", default=None, help="Save the results as JSON.")
+def run(corpus, sizes, seed, repeat, warmup, language, app, memory, output):
+    """Benchmark the corpus and the synthetic documents."""
+    essays = load_corpus(corpus)
+    documents = dict(essays)
+    sentences = corpus_sentences(essays)
+    for size in (int(s) for s in sizes.split(",") if s.strip()):
+        documents[f"synthetic-{size}"] = synthetic_document(sentences, size, seed)
+
+    results: dict[str, Any] = {"environment": environment(language), "documents": {}}
+    with ExitStack() as stack:
+        client = None
+        if app:
+            # pylint: disable=import-outside-toplevel
+            from fastapi.testclient import TestClient
+
+            from app import app as fastapi_app
+
+            # Entering the client runs the lifespan, i.e., starts the executor.
+            client = stack.enter_context(TestClient(fastapi_app))
+
+        for name, fragment in documents.items():
+            result = bench_stages(language, fragment, repeat, warmup)
+            if memory:
+                result["peak_memory_bytes"] = peak_memory(language, fragment)
+            if client is not None:
+                result.update(bench_app(client, language, fragment, repeat))
+            results["documents"][name] = result
+            click.echo(
+                f"{name:>16}: {result['paragraphs']:4d} paragraphs "
+                f"{result['total_ms']['p50']:10.1f} ms (p50)"
+            )
+
+    report(results)
+    if output:
+        with open(output, "w", encoding="utf-8") as fout:
+            json.dump(results, fout, indent=2)
+        click.echo(f"Results saved to {output}")
+
+
+def report(results: dict[str, Any]) -> None:
+    """Print the p50 stage latencies and the throughput of each document."""
+    for name, result in results["documents"].items():
+        click.echo(
+            f"\n{name}: {result['paragraphs']} paragraphs, "
+            f"{result['sentences']} sentences, {result['words']} words"
+        )
+        for stage, data in result["stages"].items():
+            click.echo(
+                f"  {stage:>22} {data['wall_ms']['p50']:10.2f} ms "
+                f"p90 {data['wall_ms']['p90']:10.2f} ms "
+                f"{data['paragraphs_per_s'] or 0:12.1f} paragraphs/s"
+            )
+        click.echo(f"  {'total':>22} {result['total_ms']['p50']:10.2f} ms")
+        if "request_ms" in result:
+            click.echo(f"  {'request':>22} {result['request_ms']['p50']:10.2f} ms")
+        if "peak_memory_bytes" in result:
+            click.echo(
+                f"  {'peak memory':>22} "
+                f"{result['peak_memory_bytes'] / 1024 ** 2:10.2f} MiB"
+            )
+
+
+def warn_environment(old: dict[str, Any], new: dict[str, Any]) -> None:
+    """Print the differences between the environments of two runs."""
+    for key, value in old.items():
+        new_value = new.get(key)
+        if key != "date" and new_value != value:
+            click.echo(f"Warning: {key} differs: {value} != {new_value}")
+
+
+def compare_value(
+    name: str, label: str, old: Optional[float], new: Optional[float], threshold: float
+) -> bool:
+    """Print an old and a new value, return True if it regressed."""
+    if not old or new is None:
+        return False
+    ratio = new / old
+    regressed = ratio > threshold
+    flag = "  REGRESSION" if regressed else ""
+    click.echo(f"{name:>16} {label:>22} {old:10.2f} {new:10.2f} {ratio:6.2f}x{flag}")
+    return regressed
+
+
+@cli.command()
+@click.argument("before", type=click.Path(exists=True))
+@click.argument("after", type=click.Path(exists=True))
+@click.option(
+    "--threshold",
+    default=1.25,
+    show_default=True,
+    help="Slowdown ratio reported as a regression.",
+)
+def compare(before, after, threshold):
+    """Compare the p50 latencies of two saved runs, exit with 1 on regressions."""
+    with open(before, encoding="utf-8") as fin:
+        old = json.load(fin)
+    with open(after, encoding="utf-8") as fin:
+        new = json.load(fin)
+    warn_environment(old["environment"], new["environment"])
+
+    click.echo(f"{'document':>16} {'stage':>22} {'before':>10} {'after':>10}  ratio")
+    regressions = 0
+    for name, old_doc in old["documents"].items():
+        new_doc = new["documents"].get(name)
+        if new_doc is None:
+            continue
+        for stage, data in old_doc["stages"].items():
+            if stage in new_doc["stages"]:
+                regressions += compare_value(
+                    name,
+                    stage,
+                    data["wall_ms"]["p50"],
+                    new_doc["stages"][stage]["wall_ms"]["p50"],
+                    threshold,
+                )
+        regressions += compare_value(
+            name,
+            "total",
+            old_doc["total_ms"]["p50"],
+            new_doc["total_ms"]["p50"],
+            threshold,
+        )
+        if "request_ms" in old_doc and "request_ms" in new_doc:
+            regressions += compare_value(
+                name,
+                "request",
+                old_doc["request_ms"]["p50"],
+                new_doc["request_ms"]["p50"],
+                threshold,
+            )
+        if "peak_memory_bytes" in old_doc and "peak_memory_bytes" in new_doc:
+            regressions += compare_value(
+                name,
+                "peak memory (MiB)",
+                old_doc["peak_memory_bytes"] / 1024**2,
+                new_doc["peak_memory_bytes"] / 1024**2,
+                threshold,
+            )
+    click.echo(f"\n{regressions} regression(s) above {threshold:.2f}x")
+    sys.exit(1 if regressions else 0)
+
+
+def compare_outputs(
+    name: str, expected: dict[str, Any], actual: dict[str, Any], label: str
+) -> int:
+    """Print the fields of a document that differ, return their number."""
+    fields = [field for field, value in expected.items() if actual.get(field) != value]
+    for field in fields:
+        click.echo(f"{name}: {field} differs{label}")
+    return len(fields)
+
+
+@cli.command()
+@click.argument("baseline", type=click.Path())
+@click.option("--save", is_flag=True, help="Save the outputs as the baseline.")
+@click.option(
+    "--corpus",
+    default=DEFAULT_CORPUS,
+    show_default=True,
+    help="Essays separated by '- - -' lines, or a directory of .txt/.html files.",
+)
+@click.option(
+    "--html",
+    "html_dir",
+    default=DEFAULT_HTML,
+    show_default=True,
+    help="Directory of further .txt/.html documents, empty for none.",
+)
+@click.option("--language", default="en", show_default=True)
+def outputs(baseline, save, corpus, html_dir, language):
+    """
+    Save the analysis results of the corpus as a baseline, or compare them
+    with a saved baseline, exit with 1 if any result differs.
+    """
+    documents = load_corpus(corpus)
+    if html_dir:
+        documents.update(load_corpus(html_dir))
+    PARAGRAPH_CACHE.clear()
+    results = {name: document_outputs(language, d) for name, d in documents.items()}
+    if save:
+        with open(baseline, "w", encoding="utf-8") as fout:
+            json.dump(
+                {"environment": environment(language), "documents": results},
+                fout,
+                indent=1,
+            )
+        click.echo(f"Outputs of {len(results)} documents saved to {baseline}")
+        return
+
+    with open(baseline, encoding="utf-8") as fin:
+        old = json.load(fin)
+    warn_environment(old["environment"], environment(language))
+
+    differences = 0
+    for name, fragment in documents.items():
+        expected = old["documents"].get(name)
+        if expected is None:
+            click.echo(f"{name}: not in the baseline")
+            continue
+        differences += compare_outputs(name, expected, results[name], "")
+        cached = document_outputs(language, fragment)
+        differences += compare_outputs(
+            name, expected, cached, " with the paragraph cache"
+        )
+    click.echo(f"{len(documents)} documents, {differences} different result(s)")
+    sys.exit(1 if differences else 0)
+
+
+@cli.command()
+@click.option(
+    "--corpus",
+    default=DEFAULT_CORPUS,
+    show_default=True,
+    help="Essays separated by '- - -' lines, or a directory of .txt/.html files.",
+)
+@click.option("--language", default="en", show_default=True)
+@click.option("--repeat", default=3, show_default=True, help="Timed runs.")
+def pipeline(corpus, language, repeat):
+    """
+    Check that the trimmed pipeline parses like the full model and time each
+    component of both, exit with 1 if any parse differs.
+    """
+    locale = NLP_MODELS[language]
+    full = initialize_nlp_model(locale.model_name)
+    trimmed = locale.nlp
+    texts = corpus_paragraphs(load_corpus(corpus))
+
+    differences = 0
+    with full.memory_zone(), trimmed.memory_zone():
+        for i, text in enumerate(texts):
+            if parse_signature(full(text)) != parse_signature(trimmed(text)):
+                differences += 1
+                click.echo(f"Paragraph {i + 1} is parsed differently: {text[:60]!r}")
+    click.echo(
+        f"{len(texts)} paragraphs, {differences} parsed differently without "
+        f"{', '.join(locale.exclude_components) or 'any excluded component'}"
+    )
+
+    timings = {}
+    for name, nlp in (("full", full), ("trimmed", trimmed)):
+        component_times(nlp, texts)  # warm up
+        runs = [component_times(nlp, texts) for _ in range(repeat)]
+        timings[name] = {c: min(run[c] for run in runs) for c in runs[0]}
+    click.echo(f"\n{'component':>22} {'full':>10} {'trimmed':>10}")
+    for component in timings["full"]:
+        trimmed_s = timings["trimmed"].get(component)
+        click.echo(
+            f"{component:>22} {timings['full'][component] * 1000:10.1f} "
+            + (f"{trimmed_s * 1000:10.1f}" if trimmed_s is not None else f"{'-':>10}")
+        )
+    click.echo(
+        f"{'total':>22} {sum(timings['full'].values()) * 1000:10.1f} "
+        f"{sum(timings['trimmed'].values()) * 1000:10.1f} ms"
+    )
+    sys.exit(1 if differences else 0)
+
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,127 @@
+"""onTopic service configuration.
+
+All settings are read once from environment variables when this module is
+imported. Defaults are suitable for local development.
+"""
+
+import logging
+import os
+
+
+def env_int(name: str, default: int) -> int:
+    """Read an integer setting, falling back to the default on bad values."""
+    value = os.getenv(name)
+    if value is None or value.strip() == "":
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        logging.warning("Invalid integer for %s: %r, using %d", name, value, default)
+        return default
+
+
+# Execution backend for the analysis pipeline: "inline", "thread" or "process".
+EXECUTOR = os.getenv("ONTOPIC_EXECUTOR", "thread").strip().lower()
+# Number of pool workers, 0 uses the number of CPUs.
+WORKERS = env_int("ONTOPIC_WORKERS", 0)
+# Number of analyses allowed to wait for a free worker, 0 is unbounded.
+MAX_QUEUE = env_int("ONTOPIC_MAX_QUEUE", 32)
+
+# Languages whose models are loaded at startup, "all" for every language. The
+# other models are loaded on their first request.
+PRELOAD_LANGUAGES = [
+    language.strip()
+    for language in os.getenv("ONTOPIC_PRELOAD_LANGUAGES", "en").split(",")
+    if language.strip()
+]
+# Load the models in the serving process and fork the worker processes from
+# it so that they share the model memory (process executor only).
+PREFORK = env_int("ONTOPIC_PREFORK", 0) != 0
+
+# /readyz reports the service as not ready when an analysis has been running
+# or waiting for this many seconds, 0 disables the check.
+READY_MAX_JOB_SECONDS = env_int("ONTOPIC_READY_MAX_JOB_SECONDS", 60)
+
+# Settings of the pre-fork launcher (server.py). The address the service
+# listens on and its root path, as for hypercorn.
+BIND = os.getenv("ONTOPIC_BIND", "0.0.0.0:5000").strip()
+ROOT_PATH = os.getenv("ONTOPIC_ROOT_PATH", "").strip()
+# Number of server processes forked from the launcher after the models are
+# loaded, 0 serves in the launcher process itself.
+SERVER_WORKERS = env_int("ONTOPIC_SERVER_WORKERS", 1)
+# A server process is replaced after this many requests, or once its resident
+# memory exceeds this many bytes, 0 is unlimited.
+WORKER_MAX_REQUESTS = env_int("ONTOPIC_WORKER_MAX_REQUESTS", 0)
+WORKER_MAX_MEMORY = env_int("ONTOPIC_WORKER_MAX_MEMORY", 0)
+# Seconds a server process that is stopped or replaced has to finish the
+# requests in progress.
+GRACEFUL_TIMEOUT = env_int("ONTOPIC_GRACEFUL_TIMEOUT", 30)
+# Essays analysed with each preloaded model before the server processes are
+# forked, see corpus.py. A short text of each locale by default.
+WARMUP_CORPUS = os.getenv("ONTOPIC_WARMUP_CORPUS", "").strip()
+
+# The largest document admitted for analysis, 0 is unlimited. The paragraphs
+# and words are estimated from the HTML before it is parsed.
+MAX_DOCUMENT_BYTES = env_int("ONTOPIC_MAX_DOCUMENT_BYTES", 10_000_000)
+MAX_DOCUMENT_PARAGRAPHS = env_int("ONTOPIC_MAX_DOCUMENT_PARAGRAPHS", 1000)
+MAX_DOCUMENT_WORDS = env_int("ONTOPIC_MAX_DOCUMENT_WORDS", 40_000)
+# Number of analysis requests a client may have in progress, 0 is unbounded.
+MAX_CLIENT_REQUESTS = env_int("ONTOPIC_MAX_CLIENT_REQUESTS", 0)
+# Header that identifies the client, e.g., X-Forwarded-For behind a proxy. The
+# address of the connection is used if it is not set. Only a header that the
+# proxies set or append to can be trusted.
+CLIENT_HEADER = os.getenv("ONTOPIC_CLIENT_HEADER", "").strip()
+# Number of trusted proxies that append to CLIENT_HEADER. The client is the
+# value appended by the outermost one, the earlier values are not trusted.
+CLIENT_PROXIES = env_int("ONTOPIC_CLIENT_PROXIES", 1)
+
+# The most topic clusters, and multi-word topics, of a document, the most
+# synonyms of a cluster and the longest topic or synonym, in characters.
+MAX_CLUSTERS = env_int("ONTOPIC_MAX_CLUSTERS", 100)
+MAX_CLUSTER_SYNONYMS = env_int("ONTOPIC_MAX_CLUSTER_SYNONYMS", 50)
+MAX_TOPIC_LENGTH = env_int("ONTOPIC_MAX_TOPIC_LENGTH", 100)
+
+# The largest Word document accepted for upload, in bytes.
+MAX_UPLOAD_BYTES = env_int("ONTOPIC_MAX_UPLOAD_BYTES", 50_000_000)
+# Number of processes that resize the images of uploaded Word documents, 0
+# resizes them in the thread that converts the document.
+IMAGE_WORKERS = env_int("ONTOPIC_IMAGE_WORKERS", 2)
+# Bytes of resized images kept in memory, 0 disables the cache.
+IMAGE_CACHE_BYTES = env_int("ONTOPIC_IMAGE_CACHE_BYTES", 64_000_000)
+
+# Encodings of the compressed responses, in order of preference among those
+# that the client accepts best: zstd (Python 3.14), br (if the brotli package
+# is installed) and gzip. Empty disables the compression.
+COMPRESSION = [
+    encoding.strip().lower()
+    for encoding in os.getenv("ONTOPIC_COMPRESSION", "zstd,br,gzip").split(",")
+    if encoding.strip()
+]
+# Responses smaller than this many bytes are not compressed.
+COMPRESSION_MIN_BYTES = env_int("ONTOPIC_COMPRESSION_MIN_BYTES", 1024)
+# Bytes of serialized analysis results kept in memory by ETag, so that
+# resubmitted documents are not analysed again, 0 disables the cache.
+RESULT_CACHE_BYTES = env_int("ONTOPIC_RESULT_CACHE_BYTES", 64_000_000)
+
+# spaCy nlp.pipe() settings used for batch analysis.
+BATCH_SIZE = env_int("ONTOPIC_BATCH_SIZE", 64)
+BATCH_PROCESSES = env_int("ONTOPIC_BATCH_PROCESSES", 1)
+# Maximum number of documents accepted by a single batch request.
+MAX_BATCH_DOCUMENTS = env_int("ONTOPIC_MAX_BATCH_DOCUMENTS", 500)
+
+# Number of paragraph analyses kept in memory, 0 disables the cache.
+CACHE_SIZE = env_int("ONTOPIC_CACHE_SIZE", 4096)
+# Directory where paragraph analyses are also stored on disk, if set.
+CACHE_DIR = os.getenv("ONTOPIC_CACHE_DIR", "").strip()
+# Bytes of CACHE_DIR beyond which the least recently used entries are deleted,
+# 0 is unlimited.
+CACHE_DIR_BYTES = env_int("ONTOPIC_CACHE_DIR_BYTES", 1_000_000_000)
+
+# Seconds an incremental analysis session is kept after its last request.
+SESSION_TTL = env_int("ONTOPIC_SESSION_TTL", 900)
+# Maximum number of sessions, the least recently used ones are dropped first.
+MAX_SESSIONS = env_int("ONTOPIC_MAX_SESSIONS", 1024)
+
+# Validate the onTopic responses against their models before they are sent,
+# for debugging the analysis. By default they are serialized without validation.
+VALIDATE_RESPONSES = env_int("ONTOPIC_VALIDATE_RESPONSES", 0) != 0
@@ -0,0 +1,48 @@
+"""Corpora of essays for warming up and benchmarking the analysis.
+
+A corpus is either a text file of essays separated by "- - -" lines, like
+tests/test-texts.txt, or a directory of .txt and .html files. The paragraphs
+of plain text essays are separated by blank lines.
+"""
+
+import html
+import os
+import re
+
+
+def text_to_paragraphs(text: str) -> list[str]:
+    """Split plain text into paragraphs at blank lines."""
+    paragraphs = re.split(r"\n\s*\n", text)
+    return [" ".join(p.split()) for p in paragraphs if p.strip()]
+
+
+def paragraphs_to_html(paragraphs: list[str]) -> str:
+    """Create the HTML fragment posted by the frontend for the paragraphs."""
+    return "".join(f"<p>{html.escape(p)}</p>" for p in paragraphs)
+
+
+def load_corpus(path: str) -> dict[str, str]:
+    """
+    Load the essays of the corpus as HTML fragments keyed by name. 'path' is
+    either a text file of essays separated by "- - -" lines or a directory of
+    .txt and .html files.
+    """
+    corpus = {}
+    if os.path.isdir(path):
+        for name in sorted(os.listdir(path)):
+            stem, ext = os.path.splitext(name)
+            with open(os.path.join(path, name), encoding="utf-8") as fin:
+                content = fin.read()
+            if ext == ".html":
+                corpus[stem] = content
+            elif ext == ".txt":
+                corpus[stem] = paragraphs_to_html(text_to_paragraphs(content))
+        return corpus
+
+    with open(path, encoding="utf-8") as fin:
+        essays = fin.read().split("- - -")
+    for i, essay in enumerate(essays):
+        paragraphs = text_to_paragraphs(essay)
+        if paragraphs:
+            corpus[f"essay-{i + 1}"] = paragraphs_to_html(paragraphs)
+    return corpus
@@ -0,0 +1,173 @@
+"""Conversion of Word documents to HTML for the onTopic analysis.
+
+mammoth converts a document and asks a callback for the src of each embedded
+image. Large images are scaled down so that they are displayed at a
+reasonable size, which means decoding, resampling and encoding them again,
+and documents with many screenshots spend more time on this than on the
+language analysis. The images are therefore only collected during the
+conversion and resized afterwards, in a pool of processes if one is given.
+Images that already fit are kept as they are, and the results are cached by
+the hash of the image so that a document that is uploaded again is not
+processed again.
+"""
+
+import hashlib
+import logging
+import re
+import threading
+from base64 import b64encode
+from collections import OrderedDict
+from concurrent.futures import Executor
+from io import BytesIO
+from typing import BinaryIO, Dict, Optional, Tuple
+
+import mammoth
+from PIL import Image, UnidentifiedImageError
+
+import config
+
+# Images are scaled down to fit in this size (width, height).
+MAX_IMAGE_SIZE = (800, 600)
+
+# Image formats that are kept as they are if they fit, by their PIL name.
+WEB_FORMATS = {
+    "PNG": "image/png",
+    "JPEG": "image/jpeg",
+    "GIF": "image/gif",
+    "WEBP": "image/webp",
+}
+
+# The src of the images until they are resized, with the hash of the image.
+PLACEHOLDER = "ontopic-image:"
+PLACEHOLDER_SRC = re.compile(re.escape(PLACEHOLDER) + r"([0-9a-f]{40})")
+
+
+class InvalidDocument(ValueError):
+    """Raised when an upload is not a Word document that can be converted."""
+
+
+def image_key(data: bytes) -> str:
+    """The cache key of an image."""
+    return hashlib.blake2b(data, digest_size=20).hexdigest()
+
+
+def resize_image(data: bytes, content_type: str) -> str:
+    """
+    Return the data URI of an image scaled down to fit in MAX_IMAGE_SIZE, as a
+    PNG. Web images that already fit are not decoded and are returned as they
+    are. Images that cannot be read, e.g., Windows metafiles, are also returned
+    as they are. Raises InvalidDocument if an image is too large to be decoded
+    safely (a decompression bomb).
+    """
+    try:
+        img = Image.open(BytesIO(data))
+        width, height = img.size
+        if (
+            width <= MAX_IMAGE_SIZE[0]
+            and height <= MAX_IMAGE_SIZE[1]
+            and img.format in WEB_FORMATS
+        ):
+            content_type = WEB_FORMATS[img.format]
+        else:
+            img.thumbnail(MAX_IMAGE_SIZE, Image.Resampling.LANCZOS)
+            buffer = BytesIO()
+            img.save(buffer, format="PNG")
+            data = buffer.getvalue()
+            content_type = "image/png"
+    except Image.DecompressionBombError as err:
+        raise InvalidDocument(f"An image of the document is too large: {err}") from err
+    except (UnidentifiedImageError, OSError) as err:
+        logging.warning("Unable to resize a %s image: %s", content_type, err)
+    encoded = b64encode(data).decode("ascii")
+    return f"data:{content_type};base64,{encoded}"
+
+
+class ImageCache:
+    """
+    A thread-safe LRU cache of resized images by image_key(), holding at most
+    'max_bytes' of data URIs. A size of 0 disables the cache.
+    """
+
+    def __init__(self, max_bytes: int = 64_000_000):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries: OrderedDict[str, str] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the resized image, None if it is not cached."""
+        with self._lock:
+            src = self._entries.get(key)
+            if src is not None:
+                self._entries.move_to_end(key)
+            return src
+
+    def put(self, key: str, src: str) -> None:
+        """Store a resized image, dropping the least recently used ones."""
+        if len(src) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            self._entries[key] = src
+            self.size += len(src)
+            while self.size > self.max_bytes:
+                _, dropped = self._entries.popitem(last=False)
+                self.size -= len(dropped)
+
+
+IMAGE_CACHE = ImageCache(config.IMAGE_CACHE_BYTES)
+
+
+def docx_to_html(
+    docx_file: BinaryIO,
+    pool: Optional[Executor] = None,
+    cache: Optional[ImageCache] = IMAGE_CACHE,
+) -> str:
+    """
+    Convert a Word document to an HTML fragment with its images scaled down.
+    The images that are not cached are resized in 'pool', or one after the
+    other if it is None. Raises InvalidDocument if the file cannot be converted.
+    """
+    images: Dict[str, Tuple[bytes, str]] = {}  # not cached yet, by key
+
+    def image_src(image) -> Dict[str, str]:
+        with image.open() as image_bytes:
+            data = image_bytes.read()
+        key = image_key(data)
+        src = cache.get(key) if cache is not None else None
+        if src is None:
+            images[key] = (data, image.content_type)
+            src = PLACEHOLDER + key
+        return {"src": src}
+
+    try:
+        result = mammoth.convert_to_html(
+            docx_file, convert_image=mammoth.images.img_element(image_src)
+        )
+    except Exception as err:  # pylint: disable=broad-exception-caught
+        # mammoth raises zipfile, KeyError and XML errors for invalid files.
+        raise InvalidDocument(f"Unable to read the Word document: {err}") from err
+
+    keys = list(images)
+    resize = pool.map if pool is not None else map
+    sources = dict(
+        zip(
+            keys,
+            resize(
+                resize_image,
+                [images[key][0] for key in keys],
+                [images[key][1] for key in keys],
+            ),
+        )
+    )
+    if cache is not None:
+        for key, src in sources.items():
+            cache.put(key, src)
+    return PLACEHOLDER_SRC.sub(
+        lambda m: sources.get(m.group(1), m.group(0)), result.value
+    )
@@ -13,22 +13,25 @@
 import pprint  # pretty prnting for debugging
 import re
 import string
-from base64 import b64encode
 from collections import Counter, namedtuple
 from dataclasses import dataclass, field
 from enum import Enum
-from io import BytesIO
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
-import mammoth
 import regex
 import unidecode
 from bs4 import BeautifulSoup as bs
 from bs4 import Tag
-from PIL import Image
-from spacy.tokens import Doc
+from bs4.element import PreformattedString
+from spacy.tokens import Doc, Span
 
+from docx_import import docx_to_html
 from localization.NLP import Locale
+from paragraph_cache import ParagraphCache, paragraph_key
+from stage_timer import StageTimings, timed
+from token_table import TokenTable
+from topic_clusters import TopicClusters
+from topic_matrix import GIVEN_FLAG, LEFT_FLAG, MATCH_FLAG, NEW_FLAG, TopicMatrix
 
 
 hyphen_slash = [
@@ -106,6 +109,10 @@ class TopicSort(Enum):
 
 Position = namedtuple("Position", ["start", "end"])
 
+# A block element, the text that has to be parsed for it (None if no parsing is
+# needed), and its paragraph cache key and cached sentences, if any.
+ElementInput = namedtuple("ElementInput", ["element", "source", "cache_key", "cached"])
+
 
 def is_skip(elem, left_count: int, topic_filter: TopicFilter) -> bool:
 
@@ -137,6 +144,103 @@ def contains_html_tags(text: str) -> bool:
     return match is not None
 
 
+def word_positions(sent: Doc | Span) -> List[int]:
+    """
+    Map each token index within a parsed sentence to the number of tokens
+    before it, not counting whitespace tokens. The list has one more entry than
+    the sentence has tokens so that the end of a span can be mapped as well.
+    """
+    positions = [0]
+    for token in sent:
+        positions.append(positions[-1] + (0 if token.is_space else 1))
+    return positions
+
+
+def to_cached_paragraph(sentences: List[Dict]) -> Dict:
+    """
+    Create the paragraph cache entry for the analyzed sentences of an element.
+    The words of the sentences are stored in a TokenTable, under the index of
+    their sentence in the table.
+    """
+    entries = []
+    words = []
+    for sent_dict in sentences:
+        entry = {
+            k: sent_dict[k] for k in ("text", "sent", "is_image") if k in sent_dict
+        }
+        text_w_info = sent_dict.get("text_w_info")
+        if text_w_info is not None:  # images are not analyzed
+            entry["tokens"] = len(words)
+            words.append(text_w_info)
+            # The nouns are references to the 'text_w_info' tuples, they are
+            # restored from the tuples by from_cached_sentence().
+            entry["sent_analysis"] = dict(
+                sent_dict["sent_analysis"], L_NOUNS=[], R_NOUNS=[]
+            )
+        entries.append(entry)
+    return {"sentences": entries, "tokens": TokenTable.from_sentences(words).to_dict()}
+
+
+def from_cached_sentence(
+    entry: Dict, tokens: TokenTable, start: int
+) -> Tuple[List[tuple], Dict, int]:
+    """
+    Restore the analysis of a cached sentence whose first word is at 'start'.
+    Returns the same values as processSent(): 'text_w_info', the sentence
+    analysis, and the position after the last word.
+    """
+    text_w_info = tokens.sentence(entry["tokens"], start)
+    analysis = dict(entry["sent_analysis"])
+    analysis["L_NOUNS"] = []
+    analysis["R_NOUNS"] = []
+    for w in text_w_info:
+        if w[POS] == "NOUN" or w[POS] == "PRP":
+            if w[ISLEFT] is True:
+                analysis["L_NOUNS"].append(w)
+            else:
+                analysis["R_NOUNS"].append(w)
+    if analysis.get("MOD_CL") is not None:
+        analysis["MOD_CL"] = tuple(analysis["MOD_CL"])
+    return text_w_info, analysis, start + len(text_w_info)
+
+
+# Default inline tags kept by get_text_preserve_inline().
+INLINE_TAGS = frozenset(
+    [
+        "img",
+        "strong",
+        "em",
+        "b",
+        "i",
+        "u",
+        "span",
+        "a",
+        "code",
+        "mark",
+        "small",
+        "sub",
+        "sup",
+    ]
+)
+
+# Block-level tags removed by get_text_preserve_inline(). Like the patterns that
+# were applied one after the other before, the names are matched as prefixes,
+# e.g., "p" also removes <pre>.
+BLOCK_TAG = re.compile(r"div|p|h[1-6]|section|article|header|footer|nav|aside")
+HTML_TAG = re.compile(r"<(/?)(\w+)[^>]*>")
+IMG_TAG = re.compile(r"<img[^>]*>")
+SPACES = re.compile(r" +")
+
+
+def attribute_pattern(attrs: List[str]) -> re.Pattern:
+    """Pattern that finds any of the attributes in a tag."""
+    return re.compile(rf"\b(?:{'|'.join(attrs)})\s*=")
+
+
+# Tags inserted by myProse, removed by default by get_text_preserve_inline().
+REMOVE_WITH_ATTRS = {"span": attribute_pattern(["id"])}
+
+
 def get_text_preserve_inline(
     element: Tag,
     inline_tags: Optional[List[str]] = None,
@@ -151,6 +255,8 @@ def get_text_preserve_inline(
 
     By default, <span> tags that are inserted by myProse are removed.
 
+    The tags are rewritten in a single pass with precompiled patterns.
+
     Args:
         element: BeautifulSoup element to process
         inline_tags: List of inline tag names to preserve
@@ -161,82 +267,39 @@ def get_text_preserve_inline(
         String containing HTML with preserved inline tags and cleaned whitespace
     """
 
-    if inline_tags is None:
-        inline_tags = [
-            "img",
-            "strong",
-            "em",
-            "b",
-            "i",
-            "u",
-            "span",
-            "a",
-            "code",
-            "mark",
-            "small",
-            "sub",
-            "sup",
-        ]
-
+    keep = INLINE_TAGS if inline_tags is None else frozenset(inline_tags)
     if remove_with_attrs is None:
-        remove_with_attrs = {"span": ["id"]}
-
-    # Get the inner HTML
-    html = element.decode_contents()
-
-    # Remove block-level tags but keep their content
-    block_tags = [
-        "div",
-        "p",
-        "h[1-6]",
-        "section",
-        "article",
-        "header",
-        "footer",
-        "nav",
-        "aside",
-    ]
-    for tag in block_tags:
-        html = re.sub(f"</?{tag}[^>]*>", " ", html)
-
-    # Remove inline tags that are NOT in the inline_tags list
-    # OR are in the remove_with_attrs list
-    def replace_tag(match):
-        full_tag = match.group(0)
-        tag_name = match.group(1).lower()
-
-        # Handle closing tags
-        if tag_name.startswith("/"):
-            tag_name = tag_name[1:].split()[0]
+        remove = REMOVE_WITH_ATTRS
+    else:
+        remove = {
+            tag: attribute_pattern(attrs) if attrs else None
+            for tag, attrs in remove_with_attrs.items()
+        }
+
+    def replace_tag(match: re.Match) -> str:
+        closing, name = match.group(1, 2)
+
+        # Remove block-level tags but keep their content
+        if BLOCK_TAG.match(name):
+            return " "
+
+        tag_name = name.lower()
+        if tag_name in remove:
             # Remove closing tag if opening tag should be removed
-            if tag_name in remove_with_attrs:
+            if closing:
                 return ""
-            elif tag_name in inline_tags:
-                return full_tag
-            else:
+            # Check if this tag+attribute combination should be removed
+            pattern = remove[tag_name]
+            if pattern is not None and pattern.search(match.group(0)):
                 return ""
 
-        # Opening tag
-        tag_name_only = tag_name.split()[0]
-
-        # Check if this tag+attribute combination should be removed
-        if tag_name_only in remove_with_attrs:
-            for attr in remove_with_attrs[tag_name_only]:
-                if re.search(rf"\b{attr}\s*=", full_tag):
-                    return ""  # Remove this tag
-
         # Keep the tag if it's in inline_tags
-        if tag_name_only in inline_tags:
-            return full_tag
-        else:
-            return ""
+        return match.group(0) if tag_name in keep else ""
 
-    html = re.sub(r"<(/?\w+)[^>]*>", replace_tag, html)
+    html = HTML_TAG.sub(replace_tag, element.decode_contents())
 
     # Clean up extra whitespace
-    html = re.sub(r"\s+", " ", html).strip()
-
-    return html
+    return " ".join(html.split())
 
 
 def extract_and_replace_images(html_string: str) -> Tuple[str, Dict[str, str]]:
@@ -261,42 +324,12 @@ def replace_img(match: re.Match) -> str:
         return replacement
 
     # Find and replace all <img> tags
-    modified_string = re.sub(r"<img[^>]*>", replace_img, html_string)
-    modified_string = re.sub(r" +", " ", modified_string)  # remove multiple spaces.
+    modified_string = IMG_TAG.sub(replace_img, html_string)
+    modified_string = SPACES.sub(" ", modified_string)  # remove multiple spaces.
 
     return modified_string, images
 
 
-def resized_image_handler(image):
-    """
-    mammoth.convert_to_html() will use this function to determine the display
-    dimensions of the image. Without this function, high-resolution
-    images will be displayed using their original pixel dimensions since
-    the img tag will not have width and height attributes.
-    """
-    with image.open() as image_bytes:
-        # Open the image to get its actual dimensions
-        img_data = image_bytes.read()
-        img = Image.open(BytesIO(img_data))
-
-        # Get original dimensions
-        # original_width, original_height = img.size
-
-        # Set max dimensions in case we can't find them.
-        max_width = 800
-        max_height = 600
-
-        # Resize while maintaining aspect ratio
-        img.thumbnail((max_width, max_height), Image.Resampling.LANCZOS)
-
-        # Re-encode
-        buffer = BytesIO()
-        img.save(buffer, format="PNG")
-        encoded = b64encode(buffer.getvalue()).decode("ascii")
-
-    return {"src": f"data:image/png;base64,{encoded}"}
-
-
 def get_table_rows_and_cols(table_element: Tag) -> Optional[Tuple[int, int]]:
     """Get the number of rows and columns in a table element."""
     rows = table_element.find_all("tr")
@@ -358,6 +391,7 @@ class DocumentElement:
     metadata: Dict = field(default_factory=dict)
     id: str = ""
     data: Dict = field(default_factory=dict)
+    cache_key: Optional[str] = None  # paragraph cache key, if it has to be cached
 
     def setData(self, data: Dict) -> None:
         """
@@ -366,6 +400,81 @@ def setData(self, data: Dict) -> None:
         self.data = data
 
 
+class LemmaOverlaps:
+    """
+    (POS, lemma) index of the 'accum_lemmas' of a sequence of paragraphs or
+    sentences, used to find given and new lemmas without comparing every pair
+    of lemmas. The results are the same as calling DSDocument.isGiven() with
+    each of the accumulated lemmas.
+    """
+
+    def __init__(self, units: List[Dict], pronoun: bool = False):
+        self.units = units
+        self.pronoun = pronoun
+
+        self.keys: List[set] = []  # (POS, lemma) pairs accumulated in each unit
+        self.has_non_prp: List[bool] = []  # True if a unit has a non-pronoun
+        self.positions: Dict[Tuple[str, str], List[int]] = {}  # units of each pair
+        self.new_lemmas: List[set] = []  # lemmas in each unit's 'new_accum_lemmas'
+        for i, unit in enumerate(units):
+            keys = {(l[POS], l[LEMMA]) for l in unit.get("accum_lemmas", [])}
+            for key in keys:
+                self.positions.setdefault(key, []).append(i)
+            self.keys.append(keys)
+            self.has_non_prp.append(any(pos != "PRP" for pos, _ in keys))
+            new_lemmas = unit.get("new_accum_lemmas", [])
+            self.new_lemmas.append({l[LEMMA] for l in new_lemmas})
+
+        # Units that are given for a pronoun when pronouns are visible.
+        self.pronoun_positions: Dict[str, List[int]] = {}
+        # Number of units in positions that already have the lemma marked as new.
+        self.visited: Dict[Tuple[str, str], int] = {}
+
+    def isGiven(self, lemma: tuple, i: int) -> bool:
+        """True if 'lemma' is given by any of the accumulated lemmas of unit i."""
+        if lemma[POS] == "PRP":
+            if not self.pronoun:
+                return False
+            # Pronouns are given by any other POS, and by the same pronoun.
+            return self.has_non_prp[i] or ("PRP", lemma[LEMMA]) in self.keys[i]
+        return (lemma[POS], lemma[LEMMA]) in self.keys[i]
+
+    def addNewLemma(self, lemma: tuple, before: int, pronouns: bool = True) -> None:
+        """
+        Add 'lemma' to the 'new_accum_lemmas' of the units before the given index
+        that it is given in, unless a lemma with the same text is already there.
+        Indexes must not decrease between calls.
+        """
+        key = (lemma[POS], lemma[LEMMA])
+        if lemma[POS] == "PRP":
+            if not (pronouns and self.pronoun):
+                return
+            positions = self.pronoun_positions.get(lemma[LEMMA])
+            if positions is None:
+                positions = [
+                    i
+                    for i, keys in enumerate(self.keys)
+                    if self.has_non_prp[i] or key in keys
+                ]
+                self.pronoun_positions[lemma[LEMMA]] = positions
+        else:
+            positions = self.positions.get(key, [])
+
+        # Units are only visited once per key, as once a unit has the lemma in
+        # its new lemmas it is never added again.
+        count = self.visited.get(key, 0)
+        while count < len(positions) and positions[count] < before:
+            self.addLemma(lemma, positions[count])
+            count += 1
+        self.visited[key] = count
+
+    def addLemma(self, lemma: tuple, i: int) -> None:
+        """Add 'lemma' to the 'new_accum_lemmas' of unit i if its text is not there."""
+        if lemma[LEMMA] not in self.new_lemmas[i]:
+            self.new_lemmas[i].add(lemma[LEMMA])
+            self.units[i]["new_accum_lemmas"].append(lemma)
+
+
 def element_not_in_table_cell(tag: Tag) -> bool:
     """Check if the tag is not inside a table cell (td or th). This is used to exclude elements that are inside table cells when processing the document."""
     # Only apply the table cell check to 'p' tags
@@ -390,6 +499,89 @@ def element_not_in_table_cell(tag: Tag) -> bool:
     ]
 
 
+class RawHtml(PreformattedString):
+    """
+    HTML that is inserted in a soup without being parsed and output as is, used
+    for the sentences tagged by DSDocument.toHtml().
+    """
+
+    def output_ready(self, formatter=None) -> str:
+        return str(self)
+
+
+# The tags that toHtml() generates for the sentences and the topic words. If the
+# tagged sentences of an element contain no other markup or entity, the HTML is
+# the same as when it is parsed and serialized again by BeautifulSoup.
+GENERATED_MARKUP = re.compile(
+    r'<span class="sentence" data-ds-paragraph="\d+" data-ds-sentence="\d+" '
+    r'id="p\d+s\d+">'
+    r'|<span class="word" data-ds-paragraph="\d+" data-ds-sentence="\d+" '
+    r'data-topic="[^"<>&]*">'
+    r"|</span>"
+)
+
+
+def has_source_markup(html_str: str) -> bool:
+    """Check if the tagged sentences contain tags or entities from the document."""
+    rest = GENERATED_MARKUP.sub("", html_str)
+    return "<" in rest or ">" in rest or "&" in rest
+
+
+# The strings between tags that are only whitespace.
+WHITESPACE_STRING = re.compile(r"(?:^|(?<=>))[ \t\n\f\r]+(?=<|$)")
+
+
+def collapse_whitespace_strings(html_str: str) -> str:
+    """
+    Replace the strings between tags that are only whitespace by a single space,
+    or a newline if they contain one, as BeautifulSoup does when parsing.
+    """
+    return WHITESPACE_STRING.sub(
+        lambda m: "\n" if "\n" in m.group(0) else " ", html_str
+    )
+
+
+# Block elements that are analysed, paragraphs only when not in a table cell.
+BLOCK_ELEMENTS = frozenset(["p", "h1", "h2", "h3", "h4", "h5", "h6", "ul", "ol", "li"])
+TABLE_CELLS = frozenset(["td", "th"])
+
+
+def block_elements(soup: Tag) -> List[Tag]:
+    """
+    Return the elements of a soup for which element_not_in_table_cell() is True,
+    in document order. The soup is traversed once and whether an element is in
+    a table cell is passed down, instead of searching the parents of each <p>.
+    """
+    elements = []
+    stack = [(child, False) for child in reversed(soup.contents)]
+    while stack:
+        tag, in_cell = stack.pop()
+        if not isinstance(tag, Tag):
+            continue
+        name = tag.name
+        if name in BLOCK_ELEMENTS and not (in_cell and name == "p"):
+            elements.append(tag)
+        in_cell = in_cell or name in TABLE_CELLS
+        stack.extend((child, in_cell) for child in reversed(tag.contents))
+    return elements
+
+
+def element_ids(soup: bs) -> Dict[str, Tag]:
+    """
+    Map the ids that _process_element() gives to the block elements of a document,
+    e.g., "p1" or "li3", to the elements of a soup that has not been processed.
+    """
+    ids = {}
+    para_count = 0
+    for position, tag in enumerate(block_elements(soup), 1):
+        if tag.name.lower() == "li":
+            ids[f"li{position}"] = tag
+        else:
+            para_count += 1
+            ids[f"p{para_count}"] = tag
+    return ids
+
+
 ##########
 #
 # DSDocument
@@ -412,9 +604,20 @@ class DSDocument:
     # Instance methods
     ##########################################
 
-    def __init__(self, locale: Locale):
+    def __init__(
+        self,
+        locale: Locale,
+        cache: Optional[ParagraphCache] = None,
+        clusters: Optional[TopicClusters] = None,
+    ):
 
         self.locale = locale
+        self.cache = cache  # cache of sentence analyses for unchanged paragraphs
+        # user defined topic clusters and multi-word topics of this analysis
+        self.clusters = clusters if clusters is not None else TopicClusters()
+        self.timings = StageTimings()  # wall and CPU time of the pipeline stages
+        self.cache_hits = 0  # elements found in the cache by _collect_inputs()
+        self.cache_misses = 0
         self.controller = None
 
         # Data & Stats
@@ -437,9 +640,11 @@ def __init__(self, locale: Locale):
         self.img_count = 0
 
         self.global_topical_prog_data = None
+        self.topic_matrix: Optional[TopicMatrix] = None
 
         # variables used by the methods for the online version of write & audit
         self.local_topics_dict = None
+        self.local_topic_set = set()  # all the topics in local_topics_dict
         self.global_header = []
         self.local_header = []
         self.global_topics = []
@@ -450,6 +655,8 @@ def __init__(self, locale: Locale):
 
         self.elements: List[DocumentElement] = []
         self.soup: Optional[bs] = None
+        # The tags of the elements in the soup by the id given to them, e.g., "p1".
+        self.element_tags: Dict[str, Tag] = {}
 
         self.sections = []
         self.num_quoted_words = 0
@@ -462,30 +669,133 @@ def __init__(self, locale: Locale):
     #
     ###############
 
-    def _process_document(self) -> List[DocumentElement]:
-        """Process document and extract all elements in order"""
+    def _cache_key(self, tag_name: str, source: Tuple[str, Dict[str, str]]) -> str:
+        """
+        Paragraph cache key of an element for the current language model and
+        topic clusters.
+        """
+        nlp = self.locale.nlp
+        text, images = source
+        model = [
+            self.locale.model_name,
+            nlp.meta.get("version", ""),
+            ",".join(nlp.pipe_names),
+        ]
+        if self.clusters:
+            # The synonyms of the clusters are merged and get the topic's lemma.
+            model.append(self.clusters.key)
+        return paragraph_key(
+            *model,
+            tag_name,
+            text,
+            *images.values(),
+        )
+
+    def _collect_inputs(self) -> List[ElementInput]:
+        """
+        Collect the block elements of the document in order together with the
+        text that has to be parsed for each of them (None if no parsing is needed).
+        For paragraphs, the text has its images replaced by placeholder tags and the
+        mapping from placeholder to image tag is returned with it.
+        If the document has a paragraph cache, the cached sentences of unchanged
+        elements are looked up so that they are not parsed again.
+        """
+        all_elements = block_elements(self.soup) if self.soup else []
+        inputs = []
+        self.cache_hits = 0
+        self.cache_misses = 0
+        for html_element in all_elements:
+            tag_name = html_element.name.lower()
+            source = None
+            if tag_name == "p":
+                source = extract_and_replace_images(
+                    get_text_preserve_inline(html_element)
+                )
+            elif tag_name == "li":
+                source = (get_text_preserve_inline(html_element), {})
+            elif tag_name in ["ol", "ul"]:
+                source = (html_element.get_text(), {})
+            elif tag_name in ["h1", "h2", "h3", "h4", "h5", "h6"]:
+                source = (get_text_preserve_inline(html_element).strip(), {})
+
+            cache_key = None
+            cached = None
+            if source is not None and self.cache is not None and self.cache.enabled:
+                cache_key = self._cache_key(tag_name, source)
+                cached = self.cache.get(cache_key)
+                if cached is None:
+                    self.cache_misses += 1
+                else:
+                    self.cache_hits += 1
+            inputs.append(ElementInput(html_element, source, cache_key, cached))
+        return inputs
+
+    @timed("_process_document")
+    def _process_document(
+        self,
+        inputs: Optional[List[ElementInput]] = None,
+        docs: Optional[Iterator[Doc]] = None,
+    ) -> List[DocumentElement]:
+        """
+        Process document and extract all elements in order
+
+        inputs:   The output of _collect_inputs(), collected if not given.
+        docs:     An iterator of parsed spaCy documents for the texts in inputs that
+                  are not cached. It may be shared by several documents (see
+                  loadManyFromHtmlStrings) as only the documents for this
+                  DSDocument's texts are consumed.
+        """
+
+        if self.locale is None or self.locale.nlp is None:
+            raise ValueError("No SpaCy model available.")
 
         self.elements = []
+        self.element_tags = {}
         position = 1  # every element has a unique position
         self.para_count = 0  # paragraph count/ID (exclude non paragraphs)
         self.word_count = 0
 
-        all_elements = (
-            self.soup.find_all(element_not_in_table_cell) if self.soup else []
-        )
+        if inputs is None:
+            inputs = self._collect_inputs()
+        if docs is None:
+            docs = self.locale.nlp.pipe(
+                i.source[0] for i in inputs if i.source is not None and i.cached is None
+            )
 
-        for html_element in all_elements:
-            doc_element = self._process_element(html_element, position)
+        for html_element, source, cache_key, cached in inputs:
+            if cached is not None:
+                # Already cached, there is nothing to parse or to add to the cache.
+                parsed = None
+                cache_key = None
+            else:
+                parsed = next(docs) if source is not None else None
+                if parsed is not None:
+                    self.clusters.apply(self.locale.nlp, parsed)
+            doc_element = self._process_element(
+                html_element, position, source, parsed, cache_key, cached
+            )
             if doc_element:
                 self.elements.append(doc_element)
+                self.element_tags[str(html_element["id"])] = html_element
                 position += 1
 
         return self.elements
 
     def _process_element(
-        self, html_element: Tag, position: int
+        self,
+        html_element: Tag,
+        position: int,
+        source: Optional[Tuple[str, Dict[str, str]]] = None,
+        parsed_para: Optional[Doc] = None,
+        cache_key: Optional[str] = None,
+        cached: Optional[Dict] = None,
     ) -> Optional[DocumentElement]:
-        """Process individual HTML element"""
+        """
+        Process individual HTML element
+
+        If 'cached' sentences are given, the element is not parsed and the sentences
+        are restored from the cache by processDoc().
+        """
         tag_name = html_element.name.lower()
         styles = {}
         data = {}
@@ -496,13 +806,20 @@ def _process_element(
         if tag_name in ["p"]:
             self.para_count += 1  # increment the paragraph ID.
 
-            text = get_text_preserve_inline(html_element)
-
-            text, images = extract_and_replace_images(text)
+            text, images = source or extract_and_replace_images(
+                get_text_preserve_inline(html_element)
+            )
 
             data["sentences"] = []
-            parsed_para = self.locale.nlp(text)
-            slist = list(parsed_para.sents)  # list of sentences
+            if cached is not None:
+                data["sentences"] = self._cached_sentences(cached)
+                slist = []
+                if data["sentences"]:  # same as the loop below
+                    text = data["sentences"][-1]["text"]
+            else:
+                if parsed_para is None:
+                    parsed_para = self.locale.nlp(text)
+                slist = list(parsed_para.sents)  # list of sentences
 
             for s in slist:
                 if s.text.startswith("<img"):
@@ -531,14 +848,20 @@ def _process_element(
                 position=position,
                 para_id=self.para_count,
                 styles=styles,
+                cache_key=cache_key,
                 metadata={"tag": tag_name, "length": len(text)},
             )
 
         if tag_name in ["li"]:
-            text = get_text_preserve_inline(html_element)
+            text = source[0] if source else get_text_preserve_inline(html_element)
             data["sentences"] = []
-            parsed_para = self.locale.nlp(text)
-            slist = list(parsed_para.sents)  # list of sentences
+            if cached is not None:
+                data["sentences"] = self._cached_sentences(cached)
+                slist = []
+            else:
+                if parsed_para is None:
+                    parsed_para = self.locale.nlp(text)
+                slist = list(parsed_para.sents)  # list of sentences
 
             for s in slist:
                 sent_dict = {}
@@ -558,17 +881,23 @@ def _process_element(
                 position=position,
                 para_id=self.para_count,
                 styles=styles,
+                cache_key=cache_key,
                 metadata={"tag": tag_name, "length": len(text)},
             )
 
         if tag_name in ["ol", "ul"]:
             self.para_count += 1  # increment the paragraph ID.
 
-            text = html_element.get_text()
+            text = source[0] if source else html_element.get_text()
 
             data["sentences"] = []
-            parsed_para = self.locale.nlp(text)
-            slist = list(parsed_para.sents)
+            if cached is not None:
+                data["sentences"] = self._cached_sentences(cached)
+                slist = []
+            else:
+                if parsed_para is None:
+                    parsed_para = self.locale.nlp(text)
+                slist = list(parsed_para.sents)
 
             for s in slist:
                 sent_dict = {}
@@ -588,6 +917,7 @@ def _process_element(
                 position=position,
                 para_id=self.para_count,
                 styles=styles,
+                cache_key=cache_key,
                 metadata={"tag": tag_name, "length": len(text)},
             )
 
@@ -597,10 +927,16 @@ def _process_element(
             text = get_text_preserve_inline(html_element)
 
             data["sentences"] = []
-            sent_dict = {}
-            sent_dict["text"] = text.strip()
-            sent_dict["sent"] = text
-            data["sentences"].append(sent_dict)
+            if cached is not None:
+                data["sentences"] = self._cached_sentences(cached)
+            else:
+                sent_dict = {}
+                sent_dict["text"] = text.strip()
+                # Headings are analysed as a single sentence.
+                if parsed_para is None:
+                    parsed_para = self.locale.nlp(sent_dict["text"])
+                sent_dict["sent"] = parsed_para
+                data["sentences"].append(sent_dict)
 
             # html_element['id'] = f"h{position}"
             html_element["id"] = f"p{self.para_count}"
@@ -614,6 +950,7 @@ def _process_element(
                 position=position,
                 para_id=self.para_count,
                 styles=styles,
+                cache_key=cache_key,
                 metadata={"tag": tag_name, "level": int(tag_name[1])},
             )
 
@@ -667,6 +1004,23 @@ def _process_element(
 
         return None
 
+    def _cached_sentences(self, cached: Dict) -> List[Dict]:
+        """
+        Create the sentences of an element from its paragraph cache entry. The
+        sentence entries and the words of the paragraph are kept under 'cached'
+        until processDoc() restores the analyses.
+        """
+        tokens = TokenTable.from_dict(cached["tokens"])
+        sentences = []
+        for entry in cached["sentences"]:
+            sent_dict = {
+                k: entry[k] for k in ("text", "sent", "is_image") if k in entry
+            }
+            if "tokens" in entry:
+                sent_dict["cached"] = (entry, tokens)
+            sentences.append(sent_dict)
+        return sentences
+
     def _get_table_summary(self, table_element: Tag) -> str:
         """Get a brief summary of table content"""
         return self.locale.tableSummary(get_table_rows_and_cols(table_element))
@@ -683,6 +1037,7 @@ def clearData(self):
 
     def clearGlobalTopicalProgDataCache(self):
         self.global_topical_prog_data = None  # clear the cache
+        self.topic_matrix = None
 
     ########################################
     #
@@ -696,6 +1051,7 @@ def clearGlobalTopicalProgDataCache(self):
     #
     ###############
 
+    @timed("setHtml")
     def setHtml(self, html_str: str):
         self.soup = bs(html_str, "html.parser")
         self._process_document()  # this creates a new self.elements list
@@ -734,11 +1090,12 @@ def getTotalWords(self):
     #
     ########################################
 
-    def processSent(self, sent, start=0):
+    def processSent(self, sent, start=0, is_heading=False):
         """
-        Given a sentence 'sent' in a string format, return a list [] of analyzed words.
+        Given a parsed sentence 'sent' (or a heading), return a list [] of analyzed words.
         Each entry in the list is a tuple (POS, Word, Lemma, bLeft_of_the_Main_Verb).
         e.g., ('NOUN', 'dogs', 'dog', False)
+        Headings may also be given as a string, in which case they are parsed here.
         """
 
         word_pos = start
@@ -746,9 +1103,12 @@ def processSent(self, sent, start=0):
         def processHeading(heading):
             nonlocal word_pos
             res = []
-            if self.locale.nlp is None:
+            if isinstance(heading, (Doc, Span)):
+                spacy_doc = heading
+            elif self.locale.nlp is None:
                 return res, ()
-            spacy_doc = self.locale.nlp(heading)
+            else:
+                spacy_doc = self.locale.nlp(heading)
 
             # t = 0.POS, 1.WORD, 2.LEMMA, 3.ISLEFT,
             #     4.DEP, 5.STEM, 6.LINKS, 7.QUOTE, 8.WORD_POS, 9.DS_DATA
@@ -809,63 +1169,18 @@ def processHeading(heading):
 
         res = []
         is_left = True
-        if not isinstance(sent, str):  # sent is a spacy object
+        if not is_heading and not isinstance(sent, str):  # sent is a spacy object
             spacy_doc: Doc = sent
             # root = None
 
             for token in spacy_doc:
                 lemma = ""
 
-                if {} is not None:  # DSDocument.user_defined_synonyms is not None:
-                    if token.pos_ in ("NOUN", "PROPN"):  # if the token is a noun
-                        t = token.text.lower()  # original spelling
-                        lemma = None  # DSDocument.user_defined_synonyms.get(t, None)  #
-
-                        if lemma is None:
-                            t = token.lemma_.lower()  # SpaCy's lemma
-                            lemma = (
-                                None  # DSDocument.user_defined_synonyms.get(t, None)
-                            )
-
-                        if lemma is None:
-                            lemma = token.lemma_.lower()
-
-                    elif token.tag_ in ("PRP", "PRP$"):
-                        t = token.text.lower()
-                        lemma = None  # DSDocument.user_defined_synonyms.get(
-                        # t, None
-                        # )  # e.g., He
-
-                        if lemma is None:
-                            lemma = self.locale.getPronounLemma(t)  # e.g., his
-                            if lemma is None:
-                                lemma = token.lemma_.lower()
-                        else:
-                            token.pos_ = "NOUN"
-                            token.tag_ = (
-                                "NN"  # if it is a synonym, treat them like a noun
-                            )
-
-                    else:
-                        t = token.text.lower()
-                        lemma = None  # DSDocument.user_defined_synonyms.get(
-                        # t, None
-                        # )  # non-noun phrases included in a topic cluster
-
-                        if lemma is None:
-                            lemma = self.locale.getPronounLemma(t)
-                            if lemma is None:
-                                lemma = token.lemma_.lower()
-                        else:
-                            token.pos_ = "NOUN"
-                            token.tag_ = "NN"
-
-                elif token.tag_ in ("PRP", "PRP$"):
-                    t = token.text.lower()
-                    lemma = self.locale.getPronounLemma(t)
-                    if lemma is None:
-                        lemma = token.lemma_.lower()
-                else:
+                # The synonyms of the topic clusters are nouns whose lemma is
+                # their topic already, see TopicClusters.apply().
+                if token.pos_ in ("NOUN", "PROPN"):  # if the token is a noun
+                    lemma = token.lemma_.lower()
+                else:  # e.g., his
                     t = token.text.lower()
                     lemma = self.locale.getPronounLemma(t)
                     if lemma is None:
@@ -931,7 +1246,7 @@ def processHeading(heading):
             noun_phrases = tuple(temp)
 
         else:
-            # sent is a string. Process it as a string
+            # sent is a heading (or a string). Process it as a heading
             res, noun_phrases = processHeading(sent)
 
         return res, noun_phrases, word_pos
@@ -943,25 +1258,6 @@ def analyzeSent(self, sent_dict, content_type):
         Perform a basic analysis of a given sentence in'sent_data'.
         """
 
-        def traverse(token, is_left):
-            l = None
-            r = None
-            res = None
-
-            l = []
-            for w in token.lefts:
-                l += traverse(w, is_left)
-
-            m = [token.text]
-
-            r = []
-            for w in token.rights:
-                r += traverse(w, is_left)
-
-            res = l + m + r
-
-            return res  # end of traverse
-
         sent_data = sent_dict["text_w_info"]
 
         res = {}  # create a dictionary
@@ -1033,51 +1329,76 @@ def traverse(token, is_left):
 
             word_count += 1
 
+        sent = sent_dict.get("sent")
         text = sent_dict["text"]
-        if contains_html_tags(text):
-            # Strip HTML tags, if any.
-            soup = bs(text, "html.parser")
-            text = soup.text
+        if not isinstance(sent, (Doc, Span)) or contains_html_tags(text):
+            # The sentence is parsed again only if no parsed sentence is available
+            # or if it contains inline HTML tags, which the tokenizer keeps together
+            # with the adjacent words (e.g., "<b>great</b>.").
+            if contains_html_tags(text):
+                # Strip HTML tags, if any.
+                soup = bs(text, "html.parser")
+                text = soup.text
+
+            text = (
+                text.strip().replace("\n", " ").replace("   ", " ").replace("  ", " ")
+            )
+            sent = self.locale.nlp(text) if self.locale.nlp is not None else None
+
+        # Positions are relative to the start of the sentence and, as the
+        # sentence text is normalized, do not count whitespace tokens.
+        offset = sent.start if isinstance(sent, Span) else 0
+        positions = word_positions(sent) if sent is not None else [0]
+        tokens = [t for t in sent if not t.is_space] if sent is not None else []
+
+        def rel_pos(i: int) -> int:
+            return positions[i - offset]
 
-        text = text.strip().replace("\n", " ").replace("   ", " ").replace("  ", " ")
-        spacy_doc = self.locale.nlp(text) if self.locale.nlp is not None else None
+        def traverse(token, is_left):
+            l = []
+            for w in token.lefts:
+                l += traverse(w, is_left)
+
+            m = [] if token.is_space else [token.text]
+
+            r = []
+            for w in token.rights:
+                r += traverse(w, is_left)
+
+            return l + m + r  # end of traverse
 
         if content_type == ContentType.HEADING:
             # if isinstance(sent, str):
             res["HEADING"] = True
 
-        for token in spacy_doc if spacy_doc is not None else {}:
+        for token in tokens:
             if token.dep_ == "ROOT":
-                root_pos = token.i
+                root_pos = rel_pos(token.i)
                 break
 
-        left_nps = []
-        for np in spacy_doc.noun_chunks if spacy_doc is not None else []:
-            if (np.end - 1) < root_pos:  # LEFT
+        noun_chunks = [
+            {"text": np.text, "start": rel_pos(np.start), "end": rel_pos(np.end)}
+            for np in (sent.noun_chunks if sent is not None else [])
+        ]
+
+        left_np_ends = []
+        for np in noun_chunks:
+            if (np["end"] - 1) < root_pos:  # LEFT
                 res["L_NPS"] += 1
-                left_nps.append(np)
-            elif (np.end - 1) > root_pos:  # RIGHT
+                left_np_ends.append(np["end"])
+            elif (np["end"] - 1) > root_pos:  # RIGHT
                 res["R_NPS"] += 1
-            res["NPS"].append(np.text)
+            res["NPS"].append(np["text"])
         res["NUM_NPS"] = len(res["NPS"])
 
-        res["NOUN_CHUNKS"] = (
-            [
-                {"text": np.text, "start": np.start, "end": np.end}
-                for np in spacy_doc.noun_chunks
-            ]
-            if spacy_doc is not None
-            else []
-        )
+        res["NOUN_CHUNKS"] = noun_chunks
 
-        tokens = []
-        for token in spacy_doc if spacy_doc is not None else {}:
-            is_root = token.dep_ == "ROOT"
-            tokens.append({"text": token.text, "is_root": is_root})
-        res["TOKENS"] = tokens
+        res["TOKENS"] = [
+            {"text": token.text, "is_root": token.dep_ == "ROOT"} for token in tokens
+        ]
 
         advcl_root = None
-        for token in spacy_doc if spacy_doc is not None else {}:
+        for token in tokens:
             if (
                 token.dep_ == "ROOT"
             ):  # we are only intersted in the advcl before the main verb
@@ -1094,7 +1415,7 @@ def traverse(token, is_left):
             start = 0
             for w in advcl_root.lefts:
                 if count == 0:
-                    start = w.i
+                    start = rel_pos(w.i)
                     if (
                         self.locale.shouldIgnoreAsFirstWord(w.text.lower())
                         or start != 0
@@ -1115,9 +1436,9 @@ def traverse(token, is_left):
 
                 # Let's count how many NPs are in the modifier clause
                 last_np = 0
-                for np in left_nps:
-                    if np.end <= end:
-                        last_np = np.end
+                for np_end in left_np_ends:
+                    if np_end <= end:
+                        last_np = np_end
                     else:
                         break
 
@@ -1130,6 +1451,7 @@ def traverse(token, is_left):
 
         return res
 
+    @timed("processDoc")
     def processDoc(self):
         """
         This function iterates through all the paragraphs in the given docx document.
@@ -1141,6 +1463,7 @@ def processDoc(self):
             return []
 
         self.global_topical_prog_data = None  # clear the cache
+        self.topic_matrix = None
 
         if self.progress_callback:
             self.progress_callback(max_val=20, msg="Preprocessing...")
@@ -1227,20 +1550,30 @@ def accumulateParaLemmas():
 
             for sent_dict in para_dict["sentences"]:
 
-                if elem.content_type == ContentType.HEADING:
-                    sent_dict["text_w_info"], NPs, word_pos = self.processSent(
-                        sent_dict["text"], start=word_pos + 1
-                    )
+                if "cached" in sent_dict:
+                    # The paragraph is unchanged, restore the sentence analysis.
+                    (
+                        sent_dict["text_w_info"],
+                        sent_dict["sent_analysis"],
+                        word_pos,
+                    ) = from_cached_sentence(*sent_dict.pop("cached"), word_pos + 1)
                 else:
-                    if sent_dict.get("is_image", False):
-                        continue
-                    sent_dict["text_w_info"], NPs, word_pos = self.processSent(
-                        sent_dict["sent"], start=word_pos + 1
-                    )
+                    if elem.content_type == ContentType.HEADING:
+                        sent_dict["text_w_info"], NPs, word_pos = self.processSent(
+                            sent_dict.get("sent", sent_dict["text"]),
+                            start=word_pos + 1,
+                            is_heading=True,
+                        )
+                    else:
+                        if sent_dict.get("is_image", False):
+                            continue
+                        sent_dict["text_w_info"], NPs, word_pos = self.processSent(
+                            sent_dict["sent"], start=word_pos + 1
+                        )
 
-                sent_dict["sent_analysis"] = self.analyzeSent(
-                    sent_dict, elem.content_type
-                )
+                    sent_dict["sent_analysis"] = self.analyzeSent(
+                        sent_dict, elem.content_type
+                    )
                 sent_dict["lemmas"] = listLemmas(
                     sent_dict["text_w_info"]
                 )  # list lemmas in the sentence
@@ -1270,10 +1603,16 @@ def accumulateParaLemmas():
                 # is usually a spaCy object, which can't be JSONified later.
                 sent_dict.pop("sent", None)
 
+            if elem.cache_key is not None and self.cache is not None:
+                self.cache.put(
+                    elem.cache_key, to_cached_paragraph(para_dict["sentences"])
+                )
+
             para_dict["accum_lemmas"] = accumulateParaLemmas()
 
             self.word_count = word_pos + 1
 
+    @timed("recalculateGivenWords")
     def recalculateGivenWords(self):
         """
         (re)Calculate given words at the sentence and the paragraph level.
@@ -1341,75 +1680,34 @@ def findGivenWordsSent(self):
             if self.progress_callback:
                 self.progress_callback(new_val=round(100 * count_para / num_paras))
 
-            prev_s = None
-            for sent in para["sentences"]:  # for each sentence in the paragraph
-                if sent.get("is_image", False):
-                    continue
+            sents = [s for s in para["sentences"] if not s.get("is_image", False)]
+            for sent in sents:
                 sent["given_accum_lemmas"] = []
                 sent["new_accum_lemmas"] = []
 
-                if prev_s is not None:  # start with the 2nd sentence.
-                    for gl in sent["lemmas"]:  # for each given lemmas in the sentence
+            overlaps = LemmaOverlaps(sents, pronoun=self.prp)
 
-                        for cl in prev_s["accum_lemmas"]:
-                            # for each given accum_lemmas in the prev sentence
-                            # if a lemma ('gl') is in the previous paragraph AND their POSs maatch
+            # start with the 2nd sentence.
+            for count_sent, sent in enumerate(sents[1:], start=1):
+                given_lemmas = set()
+                for gl in sent["lemmas"]:  # for each given lemmas in the sentence
+                    # if a lemma ('gl') is in the previous sentence AND their POSs match,
+                    # and if 'gl' is not already in the sentence's given lemma's list
+                    if (
+                        overlaps.isGiven(gl, count_sent - 1)
+                        and gl[LEMMA] not in given_lemmas
+                    ):
+                        given_lemmas.add(gl[LEMMA])
+                        sent["given_accum_lemmas"].append(gl)  # add 'gl' to the list
 
-                            # Note: POS is no longer checked for optmization.
-                            if self.isGiven(
-                                gl[LEMMA], cl[LEMMA], gl[POS], cl[POS], pronoun=self.prp
-                            ):
+                    # add 'gl' to the new lemmas of the earlier sentences it appears in.
+                    # Pronouns are never new at the sentence level.
+                    overlaps.addNewLemma(gl, count_sent, pronouns=False)
 
-                                # and if 'gl' is not already in the sentence's given lemma's list
-                                if gl[LEMMA] not in [
-                                    x[LEMMA] for x in sent["given_accum_lemmas"]
-                                ]:
-                                    sent["given_accum_lemmas"].append(
-                                        gl
-                                    )  # add 'gl' to the list
-
-                        # commented out 9/16/2021
-                        for temp_sent in para["sentences"]:
-                            if temp_sent.get("is_image", False):
-                                continue
-                            # for each sentence in the paragraph
-                            if (
-                                temp_sent == sent
-                            ):  # break if temp_sent is the currente sent.
-                                break
-                            for cl in temp_sent[
-                                "accum_lemmas"
-                            ]:  # for each accum_lemma in the sentence
-                                # if a lemma ('gl') is in the sentence AND their POSs maatch
-                                # Note: POS is no longer checked for optmization.
-                                if self.isGiven(
-                                    gl[LEMMA],
-                                    cl[LEMMA],
-                                    gl[POS],
-                                    cl[POS],
-                                    pronoun=self.prp,
-                                ):
-                                    # if 'cl' is not already in the sentence's new lemmas list
-                                    if gl[POS] != "PRP" and cl[LEMMA] not in [
-                                        x[LEMMA] for x in temp_sent["new_accum_lemmas"]
-                                    ]:
-                                        temp_sent["new_accum_lemmas"].append(
-                                            gl
-                                        )  # add 'cl' to the list ol
-
-                        # if 'lemma' a user defined topic, force it to be 'given'
-                        # if gl[LEMMA].lower() in DSDocument.user_defined_topics:
-                        #     if gl[LEMMA].lower() not in sent["given_accum_lemmas"]:
-                        #         sent["given_accum_lemmas"].append(gl)
-
-                prev_s = sent
-
-                # else:
-                #     prev_s = sent
-                #     for gl in sent["lemmas"]:
-                #         if gl[LEMMA].lower() in DSDocument.user_defined_topics:
-                #             if gl[LEMMA].lower() not in sent["given_accum_lemmas"]:
-                #                 sent["given_accum_lemmas"].append(gl)
+                    # if 'lemma' a user defined topic, force it to be 'given'
+                    # if gl[LEMMA].lower() in DSDocument.user_defined_topics:
+                    #     if gl[LEMMA].lower() not in sent["given_accum_lemmas"]:
+                    #         sent["given_accum_lemmas"].append(gl)
 
     def findGivenWordsPara(self):
         """
@@ -1419,8 +1717,17 @@ def findGivenWordsPara(self):
         """
         num_paras = len(self.elements)
         count_para = 0
-        prev_p = None
+        prev_p = None  # index of the previous paragraph
+
         for elem in self.elements:
+            if elem.content_type in [ContentType.PARAGRAPH, ContentType.LIST]:
+                elem.data["given_accum_lemmas"] = []
+                elem.data["new_accum_lemmas"] = []
+
+        # Given words are looked for in the accum_lemmas of all the elements.
+        overlaps = LemmaOverlaps([elem.data for elem in self.elements], self.prp)
+
+        for count_elem, elem in enumerate(self.elements):
 
             if elem.content_type not in [ContentType.PARAGRAPH, ContentType.LIST]:
                 continue
@@ -1432,54 +1739,25 @@ def findGivenWordsPara(self):
             if self.progress_callback:
                 self.progress_callback(new_val=round(100 * count_para / num_paras))
 
-            para["given_accum_lemmas"] = []
-            para["new_accum_lemmas"] = []
             if prev_p is not None:  # start with the 2nd paragraph.
                 for gl in para["lemmas"]:  # for each lemma in the paragraph
 
-                    for cl in prev_p[
-                        "accum_lemmas"
-                    ]:  # for each given lemmas in the prev. paragraph
-                        # if a lemma ('gl') is in the previous paragraphs AND their POSs maatch
-                        if self.isGiven(
-                            gl[LEMMA], cl[LEMMA], gl[POS], cl[POS], pronoun=self.prp
-                        ):
-                            para["given_accum_lemmas"].append(
-                                gl
-                            )  # add 'gl' to the list
-                            break  # 2024.12.02
-
-                    for temp_elem in self.elements:
-                        temp_para = temp_elem.data
-                        if temp_para == para:
-                            break
+                    # if a lemma ('gl') is in the previous paragraphs AND their POSs match
+                    if overlaps.isGiven(gl, prev_p):
+                        para["given_accum_lemmas"].append(gl)  # add 'gl' to the list
 
-                        for cl in temp_para[
-                            "accum_lemmas"
-                        ]:  # for each paragraph's accum_lemmas
-                            # if a lemma ('gl') is in the previous paragraph AND their POSs maatch
-                            if self.isGiven(
-                                gl[LEMMA], cl[LEMMA], gl[POS], cl[POS], pronoun=self.prp
-                            ):
-                                # if 'cl' is not already in the previous paragraph's new lemmas list
-                                if gl[LEMMA] not in [
-                                    x[LEMMA] for x in temp_para["new_accum_lemmas"]
-                                ]:
-                                    temp_para["new_accum_lemmas"].append(
-                                        gl
-                                    )  # add 'gl' to the list
+                    # add 'gl' to the new lemmas of the earlier elements it appears in.
+                    overlaps.addNewLemma(gl, count_elem)
 
                 # remove the duplicates. It may be a bit faster to do it here than checking duplicates in the loop above...
                 para["given_accum_lemmas"] = list(set(para["given_accum_lemmas"]))
 
-                prev_p = para
-
             else:
-                prev_p = para
                 for gl in para["lemmas"]:
                     #### Adding new (not-given) lemmas to the first paragraph (2024.12.02)
-                    if gl[LEMMA] not in [x[LEMMA] for x in para["new_accum_lemmas"]]:
-                        para["new_accum_lemmas"].append(gl)
+                    overlaps.addLemma(gl, count_elem)
+
+            prev_p = count_elem
 
     ########################################
     #
@@ -1512,11 +1790,7 @@ def loadFromMSWordFile(self, src_dir, file):
 
         # Convert with style preservation
         with open(docx_path, "rb") as docx_file:
-            result = mammoth.convert_to_html(
-                docx_file,
-                convert_image=mammoth.images.img_element(resized_image_handler),
-            )
-            html_str = result.value
+            html_str = docx_to_html(docx_file)
 
         # Process with style extraction
         self.setHtml(html_str)
@@ -1528,6 +1802,52 @@ def loadFromHtmlString(self, html_str):
         self.processDoc()
         self.toHtml()  # tag sentences.
 
+    @classmethod
+    def loadManyFromHtmlStrings(
+        cls,
+        locale: Locale,
+        html_strs: List[str],
+        batch_size: int = 64,
+        n_process: int = 1,
+        cache: Optional[ParagraphCache] = None,
+        tag_sentences: bool = True,
+        clusters: Optional[List[TopicClusters]] = None,
+    ) -> List["DSDocument"]:
+        """
+        Create and load a DSDocument for each HTML string. The texts of all the
+        documents are parsed in a single nlp.pipe() pass, which is much faster than
+        parsing each element separately when many documents are analysed at once.
+        The sentences are tagged in the soup unless 'tag_sentences' is False.
+        'clusters' are the topic clusters of each document, if any.
+        """
+        if clusters is None:
+            clusters = [TopicClusters() for _ in html_strs]
+        documents = [
+            cls(locale=locale, cache=cache, clusters=document_clusters)
+            for document_clusters in clusters
+        ]
+        all_inputs = []
+        for document, html_str in zip(documents, html_strs):
+            document.soup = bs(html_str, "html.parser")
+            all_inputs.append(document._collect_inputs())
+
+        docs = locale.nlp.pipe(
+            (
+                i.source[0]
+                for inputs in all_inputs
+                for i in inputs
+                if i.source is not None and i.cached is None
+            ),
+            batch_size=batch_size,
+            n_process=n_process,
+        )
+        for document, inputs in zip(documents, all_inputs):
+            document._process_document(inputs, docs)
+            document.processDoc()
+            if tag_sentences:
+                document.toHtml()  # tag sentences.
+        return documents
+
     def loadFromHtmlFile(self, src_dir, html_file):
         with open(
             os.path.join(src_dir, html_file), errors="ignore", encoding="utf-8"
@@ -1542,6 +1862,7 @@ def loadFromHtmlFile(self, src_dir, html_file):
     #
     ########################################
 
+    @timed("toHtml")
     def toHtml(self, topics=None, para_pos=-1, font_info=None):
 
         if topics is None:
@@ -1566,18 +1887,16 @@ def toHtml(self, topics=None, para_pos=-1, font_info=None):
                 pcount = elem.position
                 para_id = elem.para_id
                 if self.soup:
-                    tag = self.soup.find(
-                        id=f"p{para_id}"
-                    )  # find the tag with the id = elem.para_id
+                    # find the tag with the id = elem.para_id
+                    tag = self.element_tags.get(f"p{para_id}")
                     if isinstance(tag, Tag):
                         tag.clear()
             elif elem.content_type == ContentType.LISTITEM:
                 pcount = elem.position
                 para_id = elem.para_id
                 if self.soup:
-                    tag = self.soup.find(
-                        id=f"li{pcount}"
-                    )  # find the tag with the id = elem.position
+                    # find the tag with the id = elem.position
+                    tag = self.element_tags.get(f"li{pcount}")
                     if isinstance(tag, Tag):
                         tag.clear()
 
@@ -1609,7 +1928,8 @@ def toHtml(self, topics=None, para_pos=-1, font_info=None):
                 word_count = 0
 
                 # open <span> tag
-                html_str += f'<span id="p{para_id}s{scount}" class="sentence" data-ds-paragraph="{para_id}" data-ds-sentence="{scount}"> '
+                # The attributes are in the order in which BeautifulSoup outputs them.
+                html_str += f'<span class="sentence" data-ds-paragraph="{para_id}" data-ds-sentence="{scount}" id="p{para_id}s{scount}"> '
                 while word_count < total_words:
 
                     w = sent["text_w_info"][word_count]
@@ -1828,10 +2148,13 @@ def toHtml(self, topics=None, para_pos=-1, font_info=None):
                 html_str += next_char
                 scount += 1
 
-            new_content = bs(html_str, "html.parser")
-            for e in new_content:
-                if tag and isinstance(tag, Tag):
-                    tag.append(e)
+            if tag and isinstance(tag, Tag):
+                if has_source_markup(html_str):
+                    # The inline tags of the text may have to be closed or nested
+                    # differently, let BeautifulSoup fix them.
+                    tag.extend(list(bs(html_str, "html.parser").contents))
+                else:
+                    tag.append(RawHtml(collapse_whitespace_strings(html_str)))
 
         html_str = str(self.soup)  # create a new html_string with sentence tags
 
@@ -1877,6 +2200,10 @@ def toXml(self, remove_tags: Optional[list[str]] = None):
 
         allowed_attrs = ["id", "alt", "src"]
 
+        # Parse the sentences tagged by toHtml() so that their attributes are removed.
+        for raw in self.soup.find_all(string=lambda s: isinstance(s, RawHtml)):
+            raw.replace_with(*bs(str(raw), "html.parser").contents)
+
         soup_copy = copy.deepcopy(self.soup)
 
         if remove_tags:
@@ -2127,140 +2454,70 @@ def getLocalTopicalProgData(self, selected_paragraphs: List[int]):
 
         return res
 
-    def getGlobalTopicalProgData(self, sort_by=TopicSort.APPEARANCE):
+    @timed("getTopicMatrix")
+    def getTopicMatrix(self, sort_by=TopicSort.APPEARANCE) -> TopicMatrix:
+        """
+        Return the global topic progression matrix (see topic_matrix.py). The
+        topic candidates are the given and new lemmas of the paragraphs, and each
+        sentence row is built in a single pass over the sentence's lemmas.
+        """
 
         if (
             self.lexical_overlaps_analyzed
         ):  # if lexical overlaps have been analyzed already
             if (
-                self.global_topical_prog_data is not None
-            ):  # if global_topical_prog_data are already genreated, return themn.
-                return (
-                    self.global_topical_prog_data
-                )  # otherwise, we'll generate new global_topical_prog_data
+                self.topic_matrix is not None
+            ):  # if the topic matrix is already generated, return it.
+                return self.topic_matrix  # otherwise, we'll generate a new matrix
+
+        block_elements = [
+            elem
+            for elem in self.elements
+            if elem.content_type
+            in [ContentType.PARAGRAPH, ContentType.LIST, ContentType.HEADING]
+        ]
 
         # first we should make a list of given lemmas as they appear in the text
-        all_lemmas = []
-        temp = []
-
-        for elem in self.elements:
-            if elem.content_type not in [
-                ContentType.PARAGRAPH,
-                ContentType.LIST,
-                ContentType.HEADING,
-            ]:
-                continue
-
+        # (POS, LEMMA) -> word_pos of the first new or given lemma.
+        first_word_pos: Dict[Tuple[str, str], int] = {}
+        for elem in block_elements:
             p = elem.data
-            for l in p["new_accum_lemmas"]:  # for each new lemma
-                t = (l[POS], l[LEMMA])  # tuple = (POS, LEMMA)
-                if t not in temp:  # if the lemma 'l' is not already in the list,
-                    all_lemmas.append(
-                        (l[POS], l[LEMMA], l[8])
-                    )  # append a tuple (POS, LEMMA, word_pos)
-                    temp.append(t)
-            for l in p["given_accum_lemmas"]:  # for each new lemma
-                t = (l[POS], l[LEMMA])  # tuple = (POS, LEMMA)
-                if t not in temp:  # if the lemma 'l' is not already in the list,
-                    all_lemmas.append(
-                        (l[POS], l[LEMMA], l[8])
-                    )  # append a tuple (POS, LEMMA, word_pos)
-                    temp.append(t)
+            for l in p["new_accum_lemmas"] + p["given_accum_lemmas"]:
+                first_word_pos.setdefault((l[POS], l[LEMMA]), l[WORD_POS])
 
         # Count how many times each topic appears on the left side of a sentence.
         sent_topic_counter = Counter()
         para_topic_set = set()
-        p_count = 1
-
-        for elem in self.elements:
-            if elem.content_type not in [
-                ContentType.PARAGRAPH,
-                ContentType.LIST,
-                ContentType.HEADING,
-            ]:
-                continue
-
+        for p_count, elem in enumerate(block_elements, start=1):
             p = elem.data
-
-            s_count = 1
+            p_topics = {(l[POS], l[LEMMA]) for l in p["new_accum_lemmas"]} | {
+                (l[POS], l[LEMMA]) for l in p["given_accum_lemmas"]
+            }
             for s in p["sentences"]:  # for each sentence
                 if s.get("is_image", False):
                     continue
-                for l in all_lemmas:  # for each topic candidate
-                    is_new = False
-                    is_given = False
-
-                    if (l[0], l[1]) in [
-                        (t[POS], t[LEMMA]) for t in p["new_accum_lemmas"]
-                    ]:
-                        is_new = True
-                    if (l[0], l[1]) in [
-                        (t[POS], t[LEMMA]) for t in p["given_accum_lemmas"]
-                    ]:
-                        is_given = True
-
-                    if is_new or is_given:  # if 'l' is given or new
-                        for sl in s["lemmas"]:
-                            if sl[LEMMA] == l[1] and sl[POS] == l[0]:
-                                if sl[ISLEFT]:
-                                    sent_topic_counter[sl[LEMMA]] += 1
-                                    para_topic_set.add((p_count, sl[LEMMA]))
-            p_count += 1
+                for sl in s["lemmas"]:
+                    if sl[ISLEFT] and (sl[POS], sl[LEMMA]) in p_topics:
+                        sent_topic_counter[sl[LEMMA]] += 1
+                        para_topic_set.add((p_count, sl[LEMMA]))
 
         para_topic_counter = Counter()
         for t in para_topic_set:
             para_topic_counter[t[1]] += 1
 
-        all_lemmas = []
-        temp = []
-
-        for elem in self.elements:
-            if elem.content_type not in [
-                ContentType.PARAGRAPH,
-                ContentType.LIST,
-                ContentType.HEADING,
-            ]:
-                continue
-
-            p = elem.data
-            for l in p["new_accum_lemmas"]:  # for each new lemma
-                t = (l[POS], l[LEMMA])  # tuple = (POS, LEMMA)
-                if t not in temp:  # if the lemma 'l' is not already in the list,
-                    s_topic_count = sent_topic_counter[l[LEMMA]]
-                    p_topic_count = para_topic_counter[l[LEMMA]]
-                    all_lemmas.append(
-                        (l[POS], l[LEMMA], l[8], s_topic_count, p_topic_count)
-                    )  # append a tuple (POS, LEMMA, word_pos)
-                    temp.append(t)
-            for l in p["given_accum_lemmas"]:  # for each new lemma
-                t = (l[POS], l[LEMMA])  # tuple = (POS, LEMMA)
-                if t not in temp:  # if the lemma 'l' is not already in the list,
-                    s_topic_count = sent_topic_counter[l[LEMMA]]
-                    p_topic_count = para_topic_counter[l[LEMMA]]
-                    all_lemmas.append(
-                        (l[POS], l[LEMMA], l[8], s_topic_count, p_topic_count)
-                    )  # append a tuple (POS, LEMMA, word_pos)
-                    temp.append(t)
-
+        # (POS, LEMMA, word_pos, sent_topic_count, para_topic_count)
+        all_lemmas = [
+            (pos, lemma, word_pos, sent_topic_counter[lemma], para_topic_counter[lemma])
+            for (pos, lemma), word_pos in first_word_pos.items()
+        ]
         all_lemmas.sort(key=lambda tup: tup[2])  # sort by the order of appearance.
         if sort_by == TopicSort.LEFT_COUNT:
             all_lemmas.sort(
                 key=lambda tup: tup[3], reverse=True
             )  # sort by the total left count
 
-        res = []
-        res.append(all_lemmas)
-        collapsed_res = []
-        res.append([-1] * (len(all_lemmas) + 2))
-
-        pres: List[Any] = [None] * (len(self.elements) + 2)
-        pres[0] = all_lemmas
-        pres[1] = [-1] * (len(all_lemmas) + 2)
-
-        bSkipPunct = False
-
-        # NOTE: Create a dictionary that keeps track of given/new counts
-        # given_new_counts = {}
+        columns = {(l[0], l[1]): c for c, l in enumerate(all_lemmas)}
+        matrix = TopicMatrix(all_lemmas)
 
         for p_count, elem in enumerate(self.elements, start=1):
             if elem.content_type not in [
@@ -2271,6 +2528,8 @@ def getGlobalTopicalProgData(self, sort_by=TopicSort.APPEARANCE):
                 continue
 
             p = elem.data
+            new_topics = {(t[POS], t[LEMMA]) for t in p["new_accum_lemmas"]}
+            given_topics = {(t[POS], t[LEMMA]) for t in p["given_accum_lemmas"]}
 
             for s_count, s in enumerate(p["sentences"], start=1):  # for each sentence
                 # if s['text'] is a single character, and one of these punct chracters
@@ -2287,84 +2546,50 @@ def getGlobalTopicalProgData(self, sort_by=TopicSort.APPEARANCE):
                     )
                 )
 
-                sres = []  # get an empty list
-                for l in all_lemmas:  # for each topic candidate
-                    is_new = False
-                    is_given = False
-
-                    if (l[0], l[1]) in [
-                        (t[POS], t[LEMMA]) for t in p["new_accum_lemmas"]
-                    ]:
-                        is_new = True
-                    if (l[0], l[1]) in [
-                        (t[POS], t[LEMMA]) for t in p["given_accum_lemmas"]
-                    ]:
-                        is_given = True
-
-                    is_match = False
-                    t = None
-                    if is_new or is_given:  # if 'l' is given or new
-                        is_left = False
-                        left_t = None
-                        for sl in s["lemmas"]:
-                            # and the lemma is also in the sentence.
-                            if sl[LEMMA] == l[1] and sl[POS] == l[0]:
-
-                                # Global
-                                # t = 0.POS, 1.WORD, 2.LEMMA, 3.ISLEFT, 4.DEP, 5.STEM,
-                                # 6.LINKS, 7.QUOTE, 8.WORD_POS, 9.DS_DATA, 10.PARA_POS, 11.SENT_POS
-                                # 12.NEW, 13.GIVEN, 14.IS_SKIP, 15.IS_TOPIC
-
-                                if sl[ISLEFT]:
-                                    is_left = True
-                                    left_t = sl + tuple(
-                                        [
-                                            p_count,
-                                            s_count,
-                                            is_new,
-                                            is_given,
-                                            bSkipPunct,
-                                            is_left,
-                                        ]
-                                    )
-                                elif not is_left:
-                                    t = sl + tuple(
-                                        [
-                                            p_count,
-                                            s_count,
-                                            is_new,
-                                            is_given,
-                                            bSkipPunct,
-                                            is_left,
-                                        ]
-                                    )
+                # The cell of a topic is the first lemma in the sentence that matches
+                # the topic, if the topic is a new or given lemma of the paragraph.
+                matches = []
+                matched = set()
+                for sl in s["lemmas"]:
+                    t = (sl[POS], sl[LEMMA])
+                    if t in matched or (t not in new_topics and t not in given_topics):
+                        continue
+                    matched.add(t)
+                    flags = MATCH_FLAG
+                    if sl[ISLEFT]:
+                        flags |= LEFT_FLAG
+                    if t in new_topics:
+                        flags |= NEW_FLAG
+                    if t in given_topics:
+                        flags |= GIVEN_FLAG
+                    matches.append((columns[t], flags, sl))
 
-                                is_match = True
-                                break  # 2021.11.21
+                matrix.add_sentence(p_count, s_count, bSkipPunct, matches)
 
-                        if is_match:
-                            if is_left and left_t is not None:
-                                pres[p_count + 1] = left_t
-                                sres.append(left_t)
-                            else:
-                                pres[p_count + 1] = t
-                                sres.append(t)
+            matrix.add_break()
 
-                    if not is_match:
-                        sres.append(tuple([None, bSkipPunct]))
+        self.topic_matrix = matrix.finish()
 
-                    # end of 'for l in all_lemmas:'
-
-                # append a sentencce
-                collapsed_res.append(pres)
-                res.append(sres)
+        return self.topic_matrix
 
-                # end of 'for s in p['sentences']:'
+    def getGlobalTopicalProgData(self, sort_by=TopicSort.APPEARANCE):
+        """
+        Return the global topic progression data as a table of tuples, created from
+        the topic matrix (see TopicMatrix.to_data()).
+        """
 
-            res.append([-1] * (len(all_lemmas) + 2))
-            # end of 'for p in data['paragraphs']:''
+        if (
+            self.lexical_overlaps_analyzed
+        ):  # if lexical overlaps have been analyzed already
+            if (
+                self.global_topical_prog_data is not None
+            ):  # if global_topical_prog_data are already genreated, return themn.
+                return (
+                    self.global_topical_prog_data
+                )  # otherwise, we'll generate new global_topical_prog_data
 
-        self.global_topical_prog_data = {"data": res, "para_data": []}
+        matrix = self.getTopicMatrix(sort_by=sort_by)
+        self.global_topical_prog_data = {"data": matrix.to_data(), "para_data": []}
 
         return self.global_topical_prog_data
 
@@ -2606,23 +2831,13 @@ def generateGlobalVisData(
 
         self.recalculateGivenWords()
 
-        global_data = self.getGlobalTopicalProgData(sort_by=sort_by)
+        matrix = self.getTopicMatrix(sort_by=sort_by)
         self.updateLocalTopics()
-        self.updateGlobalTopics(global_data)
-
-        if global_data is None:
-            return {"error": "ncols is 0"}
-
-        data = global_data["data"]
-        # para_data = global_data['para_data']
-
-        if data is None:
-            return {"error": "ncols is 0"}
+        self.updateGlobalTopics(matrix)
 
-        header = data[0]  # list of tuples (POS, LEMMA, POS, COUNT)
+        header = matrix.header  # list of tuples (POS, LEMMA, POS, COUNT)
 
-        nrows = len(data)  # Initialize the number of rows and the number of columns.
-        ncols = len(header)
+        ncols = matrix.ncols  # Initialize the number of columns.
 
         self.global_topics = []
 
@@ -2635,11 +2850,10 @@ def generateGlobalVisData(
 
         # Filters
         # para_filter = self.filterParaTopics(data, nrows, ncols)
-        sent_filter = self.filterTopics(data, nrows, ncols)
+        sent_filter = self.filterTopics(matrix)
         topic_filter = TopicFilter.LEFT_RIGHT
 
         # num_sents_per_topic = 0
-        b_break = False
         true_left_count = 0
         l_count = 0
         count = 0
@@ -2647,29 +2861,24 @@ def generateGlobalVisData(
         for ci in range(ncols):  # for each topic entry,
 
             topic = header[ci][1]  # find a topic from the header list.
-            topic_data: List[dict | None] = [None] * (
-                nrows - 1
-            )  # initialize the topic data
-            p_ri = 0  # initialize the row index w/in paragraph
+            # initialize the topic data
+            topic_data: List[dict | None] = [None] * matrix.num_paras
+            # ISLEFT of the topic entry of each paragraph in topic_data
+            topic_left: List[bool | None] = [None] * matrix.num_paras
 
             if topic is not None:  # topic exists
-                if not self.isLocalTopic(topic):
-                    # if not self.isLocalTopic(topic) and not DSDocument.isUserDefinedSynonym(
-                    # topic
-                    # ):  # topic cluster = user defined synonym
+                if not self.isLocalTopic(topic) and not self.clusters.is_topic(topic):
                     # if the topic is NOT a local topic AND it is NOT a topic cluster,
                     # we should skip this topic.
                     continue
 
                 # Count how many times the topic appears on the left side of the main verb.
-                # if DSDocument.isUserDefinedSynonym(topic):  # topic is a topic cluster.
-                #     true_left_count = sent_filter[topic]["left_count"]
-                #     count = sent_filter[topic]["count"]
-                #     l_count = sent_filter[topic]["left_count"]
-                #     count = max(count, 2)  # at least 2
-                # else:  # topic is not a topic cluster
                 true_left_count = sent_filter[topic]["left_count"]
-                if topic_filter == TopicFilter.ALL:  # rarely used.
+                if self.clusters.is_topic(topic):  # topic is a topic cluster.
+                    count = sent_filter[topic]["count"]
+                    l_count = sent_filter[topic]["left_count"]
+                    count = max(count, 2)  # at least 2
+                elif topic_filter == TopicFilter.ALL:  # rarely used.
                     count = sent_filter[topic]["count"]
                     l_count = sent_filter[topic]["left_count"]
                 else:  # default
@@ -2687,98 +2896,67 @@ def generateGlobalVisData(
                 topic
             )  # if we get here, the topic is a global topic.
 
-            is_tc = False  # DSDocument.isUserDefinedSynonym(
-            # topic
-            # )  # check if topic is a topic cluster.
+            is_tc = self.clusters.is_topic(topic)  # check if topic is a topic cluster.
 
             topic_info = None
-            sent_count = 0
 
-            # we will start with the index == 2 because the first index is the header row,
-            # and the second index is the pragraph break indicator.
+            # Only the sentences in which the topic appears are visited, in order.
+            # p_ri is the index of the paragraph, and sent_count is the index of
+            # the sentence within the paragraph.
+            for i in matrix.column(ci):
 
-            for ri in range(2, nrows):  # for each column (r & c are flipped!)
+                elem = matrix.cell(i, ci)  # get the elem
 
-                elem = data[ri][ci]  # get the elem
+                if is_skip(elem, true_left_count, topic_filter):
+                    continue
 
-                if isinstance(elem, int) and elem < 0:  # paragraph brek
-                    b_break = True
+                p_ri = matrix.para[i]
+                sent_count = matrix.sent[i]
+                curr_elem = topic_data[p_ri]
 
-                # Not the first column (not the paragraph ID/Number)
-                elif (
-                    isinstance(elem, tuple)
-                    and elem[0] is not None
-                    and not is_skip(elem, true_left_count, topic_filter)
+                # d['sent_id'] captures the sent id of the first occurence
+                # of the topic on the left side.
+                if (
+                    curr_elem is not None
+                    and elem[ISLEFT] is True
+                    and topic_left[p_ri] is False
                 ):
+                    # 'elem' not the first instance for this paragraph
+                    # the existing element 'curr_elem' is on the right side.
+                    d = {
+                        "first_left_sent_id": sent_count,
+                        "para_pos": p_ri,
+                        "is_left": True,
+                        # 'is_topic_cluster': is_tc,
+                    }
+
+                    if sent_count < max_topic_sents:
+                        d["is_topic_sent"] = True
+                    else:
+                        d["is_topic_sent"] = False
 
-                    curr_elem = topic_data[p_ri]
-
-                    # d['sent_id'] captures the sent id of the first occurence
-                    # of the topic on the left side.
-                    if (
-                        curr_elem is not None
-                        and elem[ISLEFT] is True
-                        and curr_elem["topic"][ISLEFT] is False
-                    ):
-                        # 'elem' not the first instance for this paragraph
-                        # the existing element 'curr_elem' is on the right side.
-                        d = {
-                            "topic": list(elem),
-                            "first_left_sent_id": sent_count,
-                            "para_pos": p_ri,
-                            "is_left": True,
-                            # 'is_topic_cluster': is_tc,
-                        }
-
-                        if sent_count < max_topic_sents:
-                            d["is_topic_sent"] = True
-                        else:
-                            d["is_topic_sent"] = False
-
-                        topic_data[p_ri] = d
-
-                    elif curr_elem is None:
-                        d = {}
-                        d["topic"] = list(elem)
-                        d["para_pos"] = p_ri
-
-                        if elem[ISLEFT] is True:
-                            d["first_left_sent_id"] = sent_count
-                            d["is_left"] = True
-                        else:
-                            d["first_left_sent_id"] = -1
-                            d["is_left"] = False
-
-                        if sent_count < max_topic_sents:
-                            d["is_topic_sent"] = True
-                        else:
-                            d["is_topic_sent"] = False
-
-                        topic_data[p_ri] = d
-                        topic_info = elem
-
-                elif (
-                    isinstance(elem, tuple)
-                    and elem[0] is not None
-                    and is_skip(elem, true_left_count, topic_filter)
-                ):
-                    pass
+                    topic_data[p_ri] = d
+                    topic_left[p_ri] = elem[ISLEFT]
 
-                elif isinstance(elem, tuple) and elem[0] is None:  # if empty slot
-                    pass
+                elif curr_elem is None:
+                    d = {}
+                    d["para_pos"] = p_ri
 
-                if b_break:
-                    p_ri += 1
-                    b_break = False
-                    sent_count = 0
-                else:
-                    sent_count += 1
+                    if elem[ISLEFT] is True:
+                        d["first_left_sent_id"] = sent_count
+                        d["is_left"] = True
+                    else:
+                        d["first_left_sent_id"] = -1
+                        d["is_left"] = False
 
-            topic_data = topic_data[0:p_ri]
+                    if sent_count < max_topic_sents:
+                        d["is_topic_sent"] = True
+                    else:
+                        d["is_topic_sent"] = False
 
-            for d in topic_data:  # delete the topic data.
-                if d is not None:
-                    del d["topic"]
+                    topic_data[p_ri] = d
+                    topic_left[p_ri] = elem[ISLEFT]
+                    topic_info = elem
 
             is_non_local = not self.isLocalTopic(topic)
             # num_sents_per_topic = self.countSentencesWithTopic(topic)
@@ -2794,117 +2972,64 @@ def generateGlobalVisData(
                 }
             )
 
-            vis_data["num_paras"] = p_ri
+            vis_data["num_paras"] = matrix.num_paras
 
         # Add missing topic clusters, if any
-        # tcs = DSDocument.getUserDefinedSynonyms()
-        # if tcs is not None:
-        #     missing_tcs = list(set(tcs) - set(self.global_topics))
-        #     for tc in missing_tcs:
-
-        #         topic_info = ["NOUN", "", tc]
-
-        #         vis_data["data"].append(
-        #             {
-        #                 "paragraphs": [],
-        #                 "is_topic_cluster": True,
-        #                 "is_non_local": False,
-        #                 "topic": topic_info,
-        #                 "sent_count": 0,
-        #             }
-        #         )
-
-        return vis_data
-
-    def filterTopics(self, data, nrows, ncols):
-        res = {}
-        for c in range(1, ncols + 1):  # for each topic
-
-            l_start = -1  # left only
-            l_end = -1
-            start = -1  # left or right
-            end = -1
-            given_count = 0
-            given_left_count = 0
-            given_right_count = 0
-            para_count = 0
-            # num_paras = 0
-            header = data[0][c - 1][1]
-            given_left_paras = []
-            given_right_paras = []
-            # first_new_paras = []
-
-            for r in range(1, nrows):
-                elem = data[r][c - 1]
-
-                if isinstance(elem, tuple) and elem[0] is not None:
-                    if start < 0:
-                        start = r
-                    elif start >= 0:
-                        end = r
-
-                    if elem[ISLEFT]:
-                        if l_start < 0:
-                            l_start = r
-                        elif l_start >= 0:
-                            l_end = r
-
-                        given_left_count += 1
-                        given_left_paras.append(para_count)
-                    else:
-                        given_right_count += 1
-                        given_right_paras.append(para_count)
-
-                    given_count += 1
+        for tc in self.clusters.get_topics():
+            if tc in self.global_topics:
+                continue
 
-                elif isinstance(elem, int) and elem < 0:
-                    para_count += 1
+            topic_info = ["NOUN", "", tc]
 
-            l_skip_lines = 0
-            skip_lines = 0
-            sent_count = 0
-            for r in range(1, nrows):
-                elem = data[r][c - 1]
+            vis_data["data"].append(
+                {
+                    "paragraphs": [],
+                    "is_topic_cluster": True,
+                    "is_non_local": False,
+                    "topic": topic_info,
+                    "sent_count": 0,
+                }
+            )
 
-                if l_start < r < l_end:
-                    if isinstance(elem, str) and elem == "heading":
-                        l_skip_lines += 1
-                    elif isinstance(elem, str) and elem == "title":
-                        l_skip_lines += 1
-                    elif isinstance(elem, int) and elem < 0:
-                        l_skip_lines += 1
+        return vis_data
 
-                if start < r < end:
-                    if isinstance(elem, str) and elem == "heading":
-                        skip_lines += 1
-                    elif isinstance(elem, str) and elem == "title":
-                        skip_lines += 1
-                    elif isinstance(elem, int) and elem < 0:
-                        skip_lines += 1
+    def filterTopics(self, matrix: TopicMatrix):
+        """
+        Return a dictionary of the statistics of each topic in the global topic
+        progression matrix, keyed by the topic's lemma.
+        """
+        res = {}
+        stats = matrix.topic_stats()
+        sent_count = matrix.num_sents
 
-                if not isinstance(elem, (str, int)):
-                    sent_count += 1
+        for c in range(matrix.ncols):  # for each topic
+            header = matrix.header[c][1]
 
-            given_left_paras = list(set(given_left_paras))
-            given_right_paras = list(set(given_right_paras))
+            given_count = int(stats["count"][c])
+            given_left_count = int(stats["left_count"][c])
+            given_right_count = int(stats["right_count"][c])
 
             is_topic = False
-            if len(given_left_paras) > 1:
+            if stats["left_paras"][c] > 1:
                 is_topic = True
-            elif len(given_left_paras) == 1:
+            elif stats["left_paras"][c] == 1:
                 # this topic only appears in one paragraph. Let's see if it appears in
                 # another pragraph on the right side...
-                if len(set(given_right_paras) - set(given_left_paras)) > 0:
+                if stats["right_only"][c]:
                     # This topic satisfies the min requirement to be a topic.
                     is_topic = True
 
             # left only
-            l_span = max((l_end - l_start + 1) - l_skip_lines, 0)
+            l_start = int(stats["l_start"][c])
+            l_end = int(stats["l_end"][c])
+            l_span = max((l_end - l_start + 1) - int(stats["l_skip_lines"][c]), 0)
             norm_l_span = (l_span / sent_count) * 100
             norm_l_coverage = (given_left_count / sent_count) * 100
 
             # left or right
-            span = max(0, (end - start + 1) - skip_lines)
+            start = int(stats["start"][c])
+            end = int(stats["end"][c])
+            span = max(0, (end - start + 1) - int(stats["skip_lines"][c]))
             norm_span = (span / sent_count) * 100
             norm_coverage = (given_count / sent_count) * 100
 
@@ -3105,19 +3230,17 @@ def filterLocalTopics(self, data, nrows, ncols):
 
         return res
 
-    def updateGlobalTopics(self, global_data, min_topics=2):
-        if global_data is None:
+    def updateGlobalTopics(self, matrix: Optional[TopicMatrix], min_topics=2):
+        if matrix is None:
             return []
 
-        data = global_data["data"]
-
-        header = data[0]  # list of tuples (POS, LEMMA, POS, SENT_COUNT, PARA_COUNT)
+        # list of tuples (POS, LEMMA, POS, SENT_COUNT, PARA_COUNT)
+        header = matrix.header
         self.global_header = (
             header.copy()
         )  # Let's make a copy so that we don't actually change the global data.
 
-        nrows = len(data)
-        ncols = len(header)
+        ncols = matrix.ncols
 
         self.global_topics = []
 
@@ -3125,7 +3248,7 @@ def updateGlobalTopics(self, global_data, min_topics=2):
             return []
 
         topic_filter = TopicFilter.ALL
-        sent_filter = self.filterTopics(data, nrows, ncols)
+        sent_filter = self.filterTopics(matrix)
 
         # true_left_count = 0
         l_count = 0
@@ -3157,157 +3280,102 @@ def updateGlobalTopics(self, global_data, min_topics=2):
 
         return self.global_topics
 
+    @timed("updateLocalTopics")
     def updateLocalTopics(self):
+        """
+        Find the local topics of each paragraph, i.e., the lemmas that are given or
+        new in a sentence of the paragraph and that appear on the left side of the
+        main verb in at least one of them (see getLocalTopicalProgData()).
+        Each paragraph is processed in a single pass over its sentences' lemmas.
+        """
 
-        def filter_local_topics(data, nrows, ncols):
-
-            res = {}
-            for c in range(1, ncols + 1):  # for each topic
-
-                start = -1
-                end = -1
-                given_count = 0
-                given_left_count = 0
-                # para_count = 0
-                first_new_count = 0
-                header = data[0][c - 1][1]
-
-                for r in range(1, nrows):
-                    elem = data[r][c - 1]
-
-                    if isinstance(elem, tuple) and elem[0] is not None:
-                        # if para_count == para_pos:
-                        bSkip = False
-
-                        if not elem[IS_TOPIC]:  # it's not a topic word
-                            bSkip = True
-
-                        if bSkip is False:  # it's a topic word
-                            if start < 0:
-                                start = r
-                            elif start >= 0:
-                                end = r
-
-                            given_left_count += 1
-
-                            if not elem[ISLEFT]:
-                                first_new_count += 1
-
-                        given_count += 1
-
-                if (given_left_count - first_new_count) == 0:
-                    start = -1
-                    end = -1
-
-                skip_lines = 0
-                sent_count = 0
-                for r in range(1, nrows):
-                    elem = data[r][c - 1]
-
-                    if start < r < end:
-                        if isinstance(elem, str) and elem == "heading":
-                            skip_lines += 1
-                        elif isinstance(elem, int) and elem < 0:
-                            skip_lines += 1
-
-                    if not isinstance(elem, (str, int)):
-                        sent_count += 1
-
-                if start >= 0 and end >= 0:
-                    span = (end - start + 1) - skip_lines
-                    norm_span = (span / sent_count) * 100
-                else:
-                    span = 0
-                    norm_span = 0.0
-
-                if sent_count > 0:
-                    norm_coverage = (given_left_count / sent_count) * 100
-                else:
-                    norm_coverage = 0
-
-                res[header] = {
-                    "type": 1,
-                    "span": norm_span,
-                    "coverage": norm_coverage,
-                    "count": given_count,
-                    "left_count": given_left_count,
-                    "first_new_count": first_new_count,
-                    "sent_count": sent_count,
-                    "para_count": None,
-                    "top": False,
-                }
-
-            top_left_count = 0
-            for stats in res.values():  # find the top left count
-                if stats["left_count"] > top_left_count:
-                    top_left_count = stats["left_count"]
-
-            for stats in res.values():  # update the 'top' status of each topic.
-                if (
-                    stats["left_count"] == top_left_count
-                    and stats["left_count"] - stats["first_new_count"] != 0
-                ):
-                    stats["top"] = True
-
-            return res
-
-        def get_local_topics(local_data, min_topics=2):
-            data = local_data
-
-            topic_filter = TopicFilter.LEFT_RIGHT
-
-            if data == []:
-                return []
-
-            header = data[0]
-            nrows = len(data)
-            ncols = len(header)
-
-            if ncols == 0:
-                return []
-
-            sent_filter = filter_local_topics(data, nrows, ncols)
-
-            l_count = 0
-            self.local_topics = []
-
-            for ci in range(ncols):
+        def get_local_topics(elem) -> Optional[List[Tuple[str, bool]]]:
+            """
+            Return a list of (topic, is_global) for the paragraph, or None if
+            the paragraph has no given or new lemmas.
+            """
+            left_counts: Dict[Tuple[str, str], int] = {}  # (POS, LEMMA) -> count
+            first_word_pos: Dict[Tuple[str, str], int] = {}
+            sent_topics = []  # (sent lemmas, given/new lemmas) for each sentence
 
-                topic = header[ci][1]
-                count = -1
+            p = elem.data
+            prev_given_lemmas: set = set()
+            prev_para = None
+            for s in p["sentences"]:
+                if s.get("is_image", False):
+                    continue
 
-                if topic is not None:
-                    if topic_filter == TopicFilter.ALL:
-                        count = sent_filter[topic]["count"]
-                        l_count = sent_filter[topic]["left_count"]
-                    else:
-                        l_count = sent_filter[topic]["left_count"]
-                        if l_count == 1:
-                            count = 2
-                        else:
-                            count = l_count
+                for l in s["new_accum_lemmas"] + s["given_accum_lemmas"]:
+                    first_word_pos.setdefault((l[POS], l[LEMMA]), l[WORD_POS])
 
-                if count < min_topics:
-                    continue
+                s_lemmas = {(t[POS], t[LEMMA]) for t in s["lemmas"]}
+                new_lemmas = s_lemmas & (
+                    {(t[POS], t[LEMMA]) for t in s["new_accum_lemmas"]}
+                    - prev_given_lemmas
+                )
+                given_candidates = {(t[POS], t[LEMMA]) for t in s["given_accum_lemmas"]}
+                given_candidates |= prev_given_lemmas
+                if prev_para is not None:
+                    given_candidates |= {
+                        (t[POS], t[LEMMA])
+                        for t in prev_para["given_accum_lemmas"]
+                        + prev_para["new_accum_lemmas"]
+                    }
+                given_lemmas = s_lemmas & given_candidates
 
-                is_global = False
-                if topic in self.global_topics:
-                    is_global = True
+                sent_topics.append((s["lemmas"], new_lemmas | given_lemmas))
 
-                self.local_topics.append((topic, is_global))
+                prev_given_lemmas = given_lemmas
+                prev_para = p
 
-            return self.local_topics
+            if not first_word_pos:
+                return None
+
+            for lemmas, topics in sent_topics:
+                # Whether the first occurrence of each lemma is on the left side.
+                first_is_left: Dict[str, bool] = {}
+                for sl in lemmas:
+                    first_is_left.setdefault(sl[LEMMA], bool(sl[ISLEFT]))
+                for t in topics:
+                    if t in first_word_pos and first_is_left[t[1]]:
+                        left_counts[t] = left_counts.get(t, 0) + 1
+
+            # sort by the order of appearance.
+            columns = sorted(first_word_pos, key=lambda t: first_word_pos[t])
+
+            # The counts are looked up by lemma, if a lemma appears with more than
+            # one POS, the count of the last one is used.
+            left_count_by_lemma = {t[1]: left_counts.get(t, 0) for t in columns}
+
+            # A topic needs to be on the left side of the main verb at least once.
+            return [
+                (t[1], t[1] in self.global_topics)
+                for t in columns
+                if left_count_by_lemma[t[1]] >= 1
+            ]
 
         num_paragraphs = self.getNumParagraphs()
         all_local_topics = []
         self.local_topics_dict = {}
+        self.local_topic_set = set()
 
+        # Note: the first and the last elements are never included (see the
+        # 1-based positions used by getLocalTopicalProgData()).
         for i in range(num_paragraphs):
-            local_data = self.getLocalTopicalProgData([i])
-            local_topics = get_local_topics(local_data)
+            local_topics = []
+            if i >= 1 and self.elements[i - 1].content_type in [
+                ContentType.PARAGRAPH,
+                ContentType.HEADING,
+                ContentType.LIST,
+            ]:
+                topics = get_local_topics(self.elements[i - 1])
+                if topics is not None:
+                    self.local_topics = local_topics = topics
+
             all_local_topics += local_topics
 
             self.local_topics_dict[i] = local_topics
+            self.local_topic_set.update(t[0] for t in local_topics)
 
         return list(set(all_local_topics))
 
@@ -3315,14 +3383,7 @@ def isLocalTopic(self, topic):
         """
         Returns True if <topic> is a local topic.
         """
-        if self.local_topics_dict is not None:
-            for _, value in self.local_topics_dict.items():  # for each paragraph
-                local_topics = [
-                    t[0] for t in value
-                ]  # make a list of lemma/topic strings
-                if topic in local_topics:  # if <topic> is in it, return True
-                    return True
-        return False
+        return topic in self.local_topic_set
 
     def getCurrentTopics(self):
 
@@ -3338,6 +3399,7 @@ def getCurrentTopics(self):
 
         return topics
 
+    @timed("getHtmlSents")
     def getHtmlSents(self, data):
         """
         This method returns a list that contains a set of lists. Each contains a set of sentences
@@ -0,0 +1,280 @@
+"""Execution backends for running onTopic analyses off the event loop."""
+
+import asyncio
+import functools
+import gc
+import itertools
+import logging
+import math
+import multiprocessing
+import os
+import time
+import weakref
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from enum import Enum
+from typing import Any, AsyncIterator, Callable, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class ExecutionMode(Enum):
+    """Where the analysis pipeline is run."""
+
+    INLINE = "inline"  # on the event loop, blocks other requests
+    THREAD = "thread"  # in a thread pool of the serving process
+    PROCESS = "process"  # in a pool of worker processes
+
+
+class ExecutorSaturated(RuntimeError):
+    """
+    Raised when the analysis queue is full and a job is rejected, with the
+    estimated number of seconds until the queue has drained.
+    """
+
+    def __init__(self, message: str, retry_after: int = 1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def init_worker() -> None:
+    """Load the preloaded language models when a worker process starts."""
+    # pylint: disable=import-outside-toplevel
+    import config
+    from localization.NLP import preload_models
+
+    preload_models(config.PRELOAD_LANGUAGES)
+    logging.info("onTopic worker %d ready", os.getpid())
+
+
+class AnalysisExecutor:
+    """
+    Runs blocking analysis jobs for the async request handlers.
+
+    The number of jobs waiting for a free worker is capped by max_queue,
+    jobs submitted beyond that raise ExecutorSaturated instead of waiting.
+    With prefork, worker processes are forked from the serving process so that
+    the language models it has loaded are shared copy-on-write.
+
+    The analyses of a locale hold its lock in a process, so a thread pool runs
+    at most one analysis per locale at a time and has one thread per locale of
+    'locales' at most. More threads would only wait for the lock while they
+    are counted as running. Analyses only run in parallel in process mode.
+    """
+
+    def __init__(
+        self,
+        mode: ExecutionMode = ExecutionMode.THREAD,
+        max_workers: int = 0,
+        max_queue: int = 0,
+        prefork: bool = False,
+        locales: int = 1,
+    ) -> None:
+        self.mode = mode
+        self.prefork = prefork
+        self.max_workers = 1 if mode == ExecutionMode.INLINE else max_workers
+        if self.max_workers <= 0:
+            self.max_workers = os.cpu_count() or 1
+        if mode == ExecutionMode.THREAD:
+            self.max_workers = min(self.max_workers, max(locales, 1))
+        self.max_queue = max_queue
+        self.pending = 0  # running + queued jobs, only touched on the event loop
+        self.job_seconds = 1.0  # moving average of the time from submit to done
+        # Submit time of the running and queued jobs by job id, oldest first.
+        self._jobs: dict[int, float] = {}
+        self._job_ids = itertools.count()
+        self._unstarted: set[int] = set()  # streamed jobs not iterated yet
+        self._pool: Optional[Executor] = None
+        # Passes the items of streamed jobs between processes, started with the
+        # pool as starting it blocks until its server process is up.
+        self._manager: Optional[Any] = None
+
+    @property
+    def queue_depth(self) -> int:
+        """Number of jobs waiting for a free worker."""
+        return max(0, self.pending - self.max_workers)
+
+    @property
+    def in_flight(self) -> int:
+        """Number of jobs currently being processed."""
+        return min(self.pending, self.max_workers)
+
+    @property
+    def oldest_job_seconds(self) -> float:
+        """Seconds since the oldest running or queued job was submitted."""
+        start = next(iter(self._jobs.values()), None)
+        return 0.0 if start is None else time.monotonic() - start
+
+    def worker_pids(self) -> list[int]:
+        """Process ids of the pool's worker processes, if any."""
+        if isinstance(self._pool, ProcessPoolExecutor):
+            # pylint: disable=protected-access
+            return list((self._pool._processes or {}).keys())
+        return []
+
+    def _create_pool(self) -> Optional[Executor]:
+        if self.mode == ExecutionMode.THREAD:
+            return ThreadPoolExecutor(
+                max_workers=self.max_workers, thread_name_prefix="ontopic"
+            )
+        if self.mode == ExecutionMode.PROCESS:
+            mp_context = None
+            if self.prefork:
+                # Keep the garbage collector from writing to the pages of the
+                # objects loaded so far, e.g., the models, in the workers.
+                gc.freeze()
+                mp_context = multiprocessing.get_context("fork")
+            return ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=mp_context,
+                initializer=init_worker,
+            )
+        return None
+
+    def _restart_pool(self, pool: Optional[Executor]) -> None:
+        """
+        Replace a broken pool, unless a job that failed with it at the same
+        time already did.
+        """
+        if pool is not None and self._pool is pool:
+            logging.error("onTopic worker pool is broken, restarting it.")
+            pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = self._create_pool()
+
+    def start(self) -> None:
+        """Create the worker pool."""
+        self._pool = self._create_pool()
+        if self.mode == ExecutionMode.PROCESS:
+            self._manager = multiprocessing.Manager()
+        logging.info(
+            "onTopic executor started: mode=%s workers=%d max_queue=%d prefork=%s",
+            self.mode.value,
+            self.max_workers,
+            self.max_queue,
+            self.prefork,
+        )
+
+    def shutdown(self) -> None:
+        """Stop the worker pool, waiting for running jobs to finish."""
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+        if self._manager is not None:
+            self._manager.shutdown()
+            self._manager = None
+
+    def retry_after(self) -> int:
+        """Estimated number of seconds until the waiting jobs are processed."""
+        waiting = self.queue_depth + 1
+        return max(1, math.ceil(waiting * self.job_seconds / self.max_workers))
+
+    def _admit(self) -> None:
+        if self.max_queue > 0 and self.queue_depth >= self.max_queue:
+            raise ExecutorSaturated(
+                f"Analysis queue is full ({self.queue_depth} waiting)",
+                self.retry_after(),
+            )
+
+    def _submitted(self) -> tuple[int, float]:
+        """Record a new job, return its id and submit time."""
+        job_id = next(self._job_ids)
+        start = self._jobs[job_id] = time.monotonic()
+        self.pending += 1
+        return job_id, start
+
+    def _finished(self, job_id: int, start: float) -> None:
+        """Record that a job submitted at 'start' is done and the time it took."""
+        self.pending -= 1
+        del self._jobs[job_id]
+        self.job_seconds += 0.1 * (time.monotonic() - start - self.job_seconds)
+
+    async def run(self, func: Callable[..., T], *args: Any) -> T:
+        """Run func(*args) on the configured backend and return its result."""
+        self._admit()
+        job_id, start = self._submitted()
+        try:
+            pool = self._pool
+            if pool is None:
+                return func(*args)
+            loop = asyncio.get_running_loop()
+            try:
+                return await loop.run_in_executor(pool, functools.partial(func, *args))
+            except BrokenProcessPool:
+                # A worker died (e.g. killed for memory), replace the pool
+                # so that subsequent requests can still be served.
+                self._restart_pool(pool)
+                raise
+        finally:
+            self._finished(job_id, start)
+
+    def stream(self, func: Callable[..., None], *args: Any) -> AsyncIterator[Any]:
+        """
+        Run func(*args, emit) on the configured backend and iterate over the items
+        it passes to emit() while it runs. The items cannot be None and have to be
+        picklable for the process backend. ExecutorSaturated is raised right away
+        if the job is rejected, not when iterating. The job counts towards the
+        queue from this call, and is released if it is never iterated, e.g.,
+        when the client disconnects before the response starts.
+        """
+        self._admit()
+        job_id, start = self._submitted()
+        self._unstarted.add(job_id)
+        items = self._stream(func, args, job_id, start)
+        weakref.finalize(items, self._abandon, job_id, start)
+        return items
+
+    def _abandon(self, job_id: int, start: float) -> None:
+        """Release a streamed job that was dropped before it was iterated."""
+        if job_id in self._unstarted:
+            self._unstarted.discard(job_id)
+            self._finished(job_id, start)
+
+    def _release(
+        self, future: Optional[asyncio.Future], job_id: int, start: float
+    ) -> None:
+        """Release a streamed job once it is finished, even if it is not consumed."""
+        if future is None or future.done():
+            self._finished(job_id, start)
+        else:
+            future.add_done_callback(lambda _: self._release(None, job_id, start))
+
+    async def _stream(
+        self, func: Callable[..., None], args: tuple, job_id: int, start: float
+    ) -> AsyncIterator[Any]:
+        self._unstarted.discard(job_id)
+        loop = asyncio.get_running_loop()
+        future = None
+        try:
+            pool = self._pool
+            if pool is None:
+                items: list[Any] = []
+                func(*args, items.append)
+                for item in items:
+                    yield item
+                return
+
+            if isinstance(pool, ProcessPoolExecutor) and self._manager is not None:
+                channel = await loop.run_in_executor(None, self._manager.Queue)
+                emit = channel.put
+                receive = functools.partial(loop.run_in_executor, None, channel.get)
+                # Not on the event loop, put() waits for the manager process.
+                finish = functools.partial(
+                    loop.run_in_executor, None, channel.put, None
+                )
+            else:
+                queue: asyncio.Queue = asyncio.Queue()
+                emit = functools.partial(loop.call_soon_threadsafe, queue.put_nowait)
+                receive = queue.get
+                finish = functools.partial(queue.put_nowait, None)
+
+            future = loop.run_in_executor(pool, functools.partial(func, *args, emit))
+            future.add_done_callback(lambda _: finish())
+            while (item := await receive()) is not None:
+                yield item
+            try:
+                await future  # raise the exception of the job, if any
+            except BrokenProcessPool:
+                self._restart_pool(pool)
+                raise
+        finally:
+            self._release(future, job_id, start)
@@ -0,0 +1,233 @@
+"""Negotiated compression of the onTopic responses.
+
+The analysis results are large JSON documents that are passed on by the
+frontend's Node proxy, and they compress to a fraction of their size. The
+responses are compressed with the best encoding that the client accepts:
+zstd (from the standard library of Python 3.14), brotli (if the brotli
+package is installed) or gzip. Responses that are streamed are compressed as
+they go, flushing each part so that the client can decode the lines of an
+NDJSON stream as soon as they are sent.
+"""
+
+import zlib
+from typing import Optional, Protocol, Sequence
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    from compression import zstd
+except ImportError:  # before Python 3.14
+    zstd = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Media types that are worth compressing, in addition to text/*.
+COMPRESSIBLE_TYPES = {
+    "application/json",
+    "application/x-ndjson",
+    "application/javascript",
+    "application/xml",
+    "image/svg+xml",
+}
+
+
+class Encoder(Protocol):
+    """An incremental compressor of a response body."""
+
+    def compress(self, data: bytes) -> bytes:
+        """Compress a part of the body, the output may be buffered."""
+
+    def flush(self) -> bytes:
+        """Return the output buffered so far, so that it can be decoded."""
+
+    def finish(self) -> bytes:
+        """Return the end of the compressed body."""
+
+
+class GzipEncoder:
+    """gzip with zlib."""
+
+    def __init__(self):
+        self._compressor = zlib.compressobj(6, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+
+    def compress(self, data: bytes) -> bytes:
+        """Compress a part of the body."""
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        """Return the output buffered so far."""
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        """Return the end of the compressed body."""
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+class ZstdEncoder:
+    """zstd with compression.zstd."""
+
+    def __init__(self):
+        self._compressor = zstd.ZstdCompressor(level=3)
+
+    def compress(self, data: bytes) -> bytes:
+        """Compress a part of the body."""
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        """Return the output buffered so far."""
+        return self._compressor.flush(zstd.ZstdCompressor.FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        """Return the end of the compressed body."""
+        return self._compressor.flush(zstd.ZstdCompressor.FLUSH_FRAME)
+
+
+class BrotliEncoder:
+    """br with the brotli package."""
+
+    def __init__(self):
+        self._compressor = brotli.Compressor(quality=5)
+
+    def compress(self, data: bytes) -> bytes:
+        """Compress a part of the body."""
+        return self._compressor.process(data)
+
+    def flush(self) -> bytes:
+        """Return the output buffered so far."""
+        return self._compressor.flush()
+
+    def finish(self) -> bytes:
+        """Return the end of the compressed body."""
+        return self._compressor.finish()
+
+
+# The encoders that are available, by Content-Encoding.
+ENCODERS: dict[str, type[Encoder]] = {"gzip": GzipEncoder}
+if zstd is not None:
+    ENCODERS["zstd"] = ZstdEncoder
+if brotli is not None:
+    ENCODERS["br"] = BrotliEncoder
+
+
+def negotiate(accept_encoding: str, encodings: Sequence[str]) -> Optional[str]:
+    """
+    Return the encoding of 'encodings' with the highest quality in an
+    Accept-Encoding header, the first one on ties, None if none is accepted.
+    """
+    qualities = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if name.strip():
+            qualities[name.strip().lower()] = quality
+    best, best_quality = None, 0.0
+    for encoding in encodings:
+        quality = qualities.get(encoding, qualities.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def is_compressible(headers: Headers) -> bool:
+    """True if a response of these headers should be compressed."""
+    if "content-encoding" in headers:
+        return False
+    media_type = headers.get("content-type", "").split(";")[0].strip().lower()
+    return (
+        media_type.startswith("text/")
+        or media_type.endswith("+json")
+        or media_type in COMPRESSIBLE_TYPES
+    )
+
+
+class CompressionMiddleware:  # pylint: disable=too-few-public-methods
+    """
+    Compresses the responses with the first of 'encodings' that the client
+    accepts best. Responses of less than 'minimum_size' bytes are sent as they
+    are, unless they are streamed. The encodings that are not available are
+    ignored, and no encodings disables the compression.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        encodings: Sequence[str] = ("zstd", "br", "gzip"),
+        minimum_size: int = 1024,
+    ):
+        self.app = app
+        self.encodings = [encoding for encoding in encodings if encoding in ENCODERS]
+        self.minimum_size = max(minimum_size, 1)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not self.encodings:
+            await self.app(scope, receive, send)
+            return
+        accept_encoding = Headers(scope=scope).get("accept-encoding", "")
+        encoding = negotiate(accept_encoding, self.encodings)
+        responder = CompressedResponder(send, encoding, self.minimum_size)
+        await self.app(scope, receive, responder.send)
+
+
+class CompressedResponder:
+    """
+    Compresses the body of a response with 'encoding' as it is sent, or only
+    adds Vary: Accept-Encoding if it is None or the response is too small.
+    """
+
+    def __init__(self, send: Send, encoding: Optional[str], minimum_size: int):
+        self._send = send
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.start: Optional[Message] = None  # held until the first body
+        self.encoder: Optional[Encoder] = None
+
+    async def send(self, message: Message) -> None:
+        """Send a message of the response, compressing its body."""
+        if message["type"] == "http.response.start":
+            self.start = message
+            return
+        if message["type"] != "http.response.body":
+            await self._send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if self.start is not None:
+            start, self.start = self.start, None
+            headers = MutableHeaders(raw=start["headers"])
+            if is_compressible(headers):
+                headers.add_vary_header("Accept-Encoding")
+                if self.encoding is not None and (
+                    more_body or len(body) >= self.minimum_size
+                ):
+                    self.encoder = ENCODERS[self.encoding]()
+                    headers["Content-Encoding"] = self.encoding
+                    del headers["Content-Length"]
+            if self.encoder is not None:
+                message = self.compressed(body, more_body)
+                if not more_body:
+                    headers["Content-Length"] = str(len(message["body"]))
+            await self._send(start)
+            await self._send(message)
+            return
+
+        if self.encoder is not None:
+            message = self.compressed(body, more_body)
+        await self._send(message)
+
+    def compressed(self, body: bytes, more_body: bool) -> Message:
+        """The body message with a compressed part of the body."""
+        data = self.encoder.compress(body)
+        data += self.encoder.flush() if more_body else self.encoder.finish()
+        return {"type": "http.response.body", "body": data, "more_body": more_body}
@@ -1,5 +1,9 @@
+import logging
 import re
-from typing import Dict, List, Optional, Tuple
+import threading
+import time
+from functools import cached_property
+from typing import Dict, Iterable, List, Optional, Tuple
 
 import spacy
 from spacy.language import Language
@@ -30,18 +34,31 @@ def html_sentence_splitter(doc):
     return doc
 
 
-def initialize_nlp_model(model_name: str) -> Language:
-    """Initialize NLP model."""
-    nlp = spacy.load(model_name)
+def initialize_nlp_model(model_name: str, exclude: Iterable[str] = ()) -> Language:
+    """
+    Initialize NLP model without the 'exclude' pipeline components, the
+    EXCLUDE_COMPONENTS of the locale. The analysis only uses the tags, lemmas,
+    dependencies, sentence boundaries and noun chunks, so the named entity
+    recognizer is not needed, and neither is the (disabled) senter as the
+    parser sets the sentence boundaries.
+    """
+    nlp = spacy.load(model_name, exclude=list(exclude))
     nlp.tokenizer.token_match = re.compile(r"<[^>]+>").match  # type: ignore
     nlp.add_pipe("html_sentence_splitter", before="parser")
     return nlp
 
 
 class Locale:
+    """
+    The language model and the language specific word lists of a locale. The
+    spaCy model is only loaded when it is first used, or by load().
+    """
+
     def __init__(
         self,
         model_name: str,
+        exclude_components: List[str],
+        warmup_text: str,
         extra_stop_words: List[str],
         pronouns: List[str],
         pronoun_lemmas: Dict[str, List[str]],
@@ -55,23 +72,68 @@ def __init__(
         emphasis_punctuation: List[str],
     ) -> None:
         self.model_name = model_name
+        self.exclude_components = exclude_components
+        self.warmup_text = warmup_text
         self.pronoun_lemmas = pronoun_lemmas
         self.pronoun_to_lemma = invert_pronoun_lemmas(pronoun_lemmas)
-        self.nlp = initialize_nlp_model(model_name)
+        self._nlp: Optional[Language] = None
+        self._load_lock = threading.Lock()
+        # spaCy memory zones must not overlap, so analyses sharing this
+        # model in one process are serialized.
+        self.lock = threading.Lock()
         self.emphasis_punctuation = set(emphasis_punctuation)
         self.table_summary = table_summary
         self.no_space_patterns = set(no_space_patterns)
         self.be_verbs = set(be_verbs)
         self.ignore_first_words = set(ignore_first_words)
-        self.stop_words = (
-            set(self.nlp.Defaults.stop_words)
-            .union(extra_stop_words)
-            .difference(pronouns)
-        )
+        self.extra_stop_words = extra_stop_words
+        self.pronouns = pronouns
         self.terminal_punctuation = set(terminal_punctuation)
         self.start_quotes = set(start_quotes)
         self.end_quotes = set(end_quotes)
 
+    @property
+    def loaded(self) -> bool:
+        """True if the spaCy model is loaded."""
+        return self._nlp is not None
+
+    @property
+    def nlp(self) -> Language:
+        """The spaCy model, loaded on first use."""
+        if self._nlp is None:
+            return self.load()
+        return self._nlp
+
+    def load(self) -> Language:
+        """
+        Load the spaCy model, if it is not loaded yet, and parse a short text so
+        that the first analysis does not pay for the lazy initialization of the
+        pipeline components. Threads using the locale wait for the model.
+        """
+        with self._load_lock:
+            if self._nlp is None:
+                start = time.perf_counter()
+                nlp = initialize_nlp_model(self.model_name, self.exclude_components)
+                with nlp.memory_zone():
+                    nlp(self.warmup_text)
+                self._nlp = nlp
+                logging.info(
+                    "Loaded %s (%s) in %.2f s",
+                    self.model_name,
+                    ", ".join(nlp.pipe_names),
+                    time.perf_counter() - start,
+                )
+        return self._nlp
+
+    @cached_property
+    def stop_words(self) -> set[str]:
+        """The stop words of the language model and the extra ones."""
+        return (
+            set(self.nlp.Defaults.stop_words)
+            .union(self.extra_stop_words)
+            .difference(self.pronouns)
+        )
+
     def getPronounLemma(self, pronoun: str) -> str:
         """Get the lemma for a given pronoun."""
         return self.pronoun_to_lemma.get(pronoun, pronoun)
@@ -119,6 +181,8 @@ def isEmphasisPunctuation(self, text: str) -> bool:
 NLP_MODELS: dict[str, Locale] = {
     "en": Locale(
         model_name=en.MODEL,
+        exclude_components=en.EXCLUDE_COMPONENTS,
+        warmup_text=en.WARMUP_TEXT,
         extra_stop_words=en.EXTRA_STOP_WORDS,
         pronouns=en.PRONOUNS,
         pronoun_lemmas=en.PRONOUN_LEMMAS,
@@ -133,6 +197,8 @@ def isEmphasisPunctuation(self, text: str) -> bool:
     ),
     "es": Locale(
         model_name=es.MODEL,
+        exclude_components=es.EXCLUDE_COMPONENTS,
+        warmup_text=es.WARMUP_TEXT,
         extra_stop_words=es.EXTRA_STOP_WORDS,
         pronouns=es.PRONOUNS,
         pronoun_lemmas={},
@@ -146,3 +212,14 @@ def isEmphasisPunctuation(self, text: str) -> bool:
         emphasis_punctuation=en.EMPHASIS_PUNCTUATION,
     ),
 }
+
+
+def preload_models(languages: Iterable[str]) -> None:
+    """Load the models of the given languages, "all" loads every model."""
+    for language in languages:
+        if language == "all":
+            preload_models(NLP_MODELS.keys())
+        elif language in NLP_MODELS:
+            NLP_MODELS[language].load()
+        else:
+            logging.warning("Cannot preload unknown language: %s", language)
@@ -1,5 +1,10 @@
 MODEL = "en_core_web_sm"
 
+EXCLUDE_COMPONENTS = ["ner", "senter"]
+
+# Parsed when the model is loaded so that the first analysis is not slower.
+WARMUP_TEXT = "The model is ready to analyze this sentence."
+
 EXTRA_STOP_WORDS = [
     "therefore",
     "however",
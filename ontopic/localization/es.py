@@ -1,4 +1,10 @@
 MODEL = "es_core_news_sm"
+
+EXCLUDE_COMPONENTS = ["ner", "senter"]
+
+# Parsed when the model is loaded so that the first analysis is not slower.
+WARMUP_TEXT = "El modelo está listo para analizar esta oración."
+
 EXTRA_STOP_WORDS = []
 PRONOUNS = []
 
@@ -0,0 +1,532 @@
+"""Prometheus metrics of the onTopic service.
+
+The metrics are kept in this process and written in the Prometheus text
+exposition format by the /metrics route. Every labelled series has its
+own lock so that requests updating different series never wait for each
+other, and the metric locks are only taken when a series is created.
+
+Analyses that run in worker processes return their document statistics
+and stage timings with the results, they are recorded here by the
+serving process.
+"""
+
+import bisect
+import math
+import os
+import resource
+import threading
+import time
+from typing import Callable, Iterable, Optional, Sequence, TypeVar
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Buckets in seconds for the durations of the pipeline stages.
+STAGE_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+# Buckets in seconds for the request latencies.
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Buckets for the document sizes.
+PARAGRAPH_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+SENTENCE_BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+WORD_BUCKETS = (50, 100, 250, 500, 1000, 2500, 5000, 10000, 25000, 50000)
+
+# Upper bounds of the document size label, in paragraphs.
+SIZE_BUCKETS = (5, 20, 50, 100, 200)
+
+# Content type of the text exposition format.
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+M = TypeVar("M", bound="Metric")
+
+
+def size_bucket(paragraphs: int) -> str:
+    """Return the document size label for a number of paragraphs."""
+    for bound in SIZE_BUCKETS:
+        if paragraphs <= bound:
+            return f"le{bound}"
+    return f"gt{SIZE_BUCKETS[-1]}"
+
+
+def format_value(value: float) -> str:
+    """Format a sample value as Prometheus expects it."""
+    if math.isnan(value):
+        return "NaN"
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def escape_label(value: str) -> str:
+    """Escape a label value for the text exposition format."""
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    """Format label pairs as {name="value",...}, or "" without labels."""
+    if not names:
+        return ""
+    pairs = ",".join(
+        f'{name}="{escape_label(value)}"' for name, value in zip(names, values)
+    )
+    return f"{{{pairs}}}"
+
+
+##################################################
+# Series
+##################################################
+
+
+class ValueSeries:
+    """A single labelled counter or gauge value."""
+
+    def __init__(self):
+        self._value = 0.0
+        self._function: Optional[Callable[[], float]] = None
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0) -> None:
+        """Add amount to the value."""
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        """Subtract amount from the value."""
+        with self._lock:
+            self._value -= amount
+
+    def set(self, value: float) -> None:
+        """Set the value."""
+        with self._lock:
+            self._value = value
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        """Read the value from function each time the metrics are collected."""
+        self._function = function
+
+    def get(self) -> float:
+        """Return the current value."""
+        if self._function is not None:
+            return self._function()
+        with self._lock:
+            return self._value
+
+
+class HistogramSeries:
+    """A single labelled histogram series."""
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = buckets
+        self._counts = [0] * (len(buckets) + 1)  # the last one is +Inf
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        """Add an observation."""
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[i] += 1
+            self._sum += value
+
+    def snapshot(self) -> tuple[list[int], float]:
+        """Return the cumulative bucket counts and the sum of the observations."""
+        with self._lock:
+            counts = list(self._counts)
+            total = self._sum
+        cumulative = []
+        running = 0
+        for count in counts:
+            running += count
+            cumulative.append(running)
+        return cumulative, total
+
+
+##################################################
+# Metrics
+##################################################
+
+
+class Metric:
+    """A metric family with zero or more labels."""
+
+    metric_type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._series: dict[tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    def _create_series(self):
+        raise NotImplementedError
+
+    def labels(self, *values: str):
+        """Return the series for the label values, creating it if needed."""
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}")
+        series = self._series.get(values)
+        if series is None:
+            with self._lock:
+                series = self._series.get(values)
+                if series is None:
+                    series = self._series[values] = self._create_series()
+        return series
+
+    def samples(self) -> Iterable[str]:
+        """Generate the sample lines of every series."""
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    """A value that only goes up, e.g. the number of requests."""
+
+    metric_type = "counter"
+
+    def _create_series(self) -> ValueSeries:
+        return ValueSeries()
+
+    def inc(self, *values: str, amount: float = 1.0) -> None:
+        """Add amount to the series of the label values."""
+        self.labels(*values).inc(amount)
+
+    def value(self, *values: str) -> float:
+        """Return the value of a series, 0 if it does not exist yet."""
+        series = self._series.get(values)
+        return series.get() if series is not None else 0.0
+
+    def samples(self) -> Iterable[str]:
+        for values, series in list(self._series.items()):
+            labels = format_labels(self.labelnames, values)
+            yield f"{self.name}{labels} {format_value(series.get())}"
+
+
+class Gauge(Counter):
+    """A value that goes up and down, or that is read when collected."""
+
+    metric_type = "gauge"
+
+    def dec(self, *values: str, amount: float = 1.0) -> None:
+        """Subtract amount from the series of the label values."""
+        self.labels(*values).dec(amount)
+
+    def set(self, value: float, *values: str) -> None:
+        """Set the value of the series of the label values."""
+        self.labels(*values).set(value)
+
+    def set_function(self, function: Callable[[], float], *values: str) -> None:
+        """Read the series of the label values from function when collected."""
+        self.labels(*values).set_function(function)
+
+
+class Histogram(Metric):
+    """The distribution of observed values in cumulative buckets."""
+
+    metric_type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = STAGE_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _create_series(self) -> HistogramSeries:
+        return HistogramSeries(self.buckets)
+
+    def observe(self, value: float, *values: str) -> None:
+        """Add an observation to the series of the label values."""
+        self.labels(*values).observe(value)
+
+    def samples(self) -> Iterable[str]:
+        bounds = [format_value(b) for b in self.buckets] + ["+Inf"]
+        names = self.labelnames + ("le",)
+        for values, series in list(self._series.items()):
+            cumulative, total = series.snapshot()
+            for bound, count in zip(bounds, cumulative):
+                labels = format_labels(names, values + (bound,))
+                yield f"{self.name}_bucket{labels} {count}"
+            labels = format_labels(self.labelnames, values)
+            yield f"{self.name}_sum{labels} {format_value(total)}"
+            yield f"{self.name}_count{labels} {cumulative[-1]}"
+
+
+class Registry:
+    """The collection of metrics served by /metrics."""
+
+    def __init__(self):
+        self._metrics: dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: M) -> M:
+        """Add a metric, its name has to be unique."""
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Duplicate metric: {metric.name}")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def expose(self) -> str:
+        """Return all the metrics in the Prometheus text exposition format."""
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.metric_type}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+##################################################
+# Process memory
+##################################################
+
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def resident_memory(pid: Optional[int] = None) -> int:
+    """
+    Return the resident set size of a process in bytes, this process by default.
+    Without /proc, only the peak RSS of this process is available.
+    """
+    try:
+        with open(f"/proc/{pid or 'self'}/statm", encoding="ascii") as fin:
+            return int(fin.read().split()[1]) * PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        if pid is not None:
+            return 0
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+##################################################
+# onTopic metrics
+##################################################
+
+REGISTRY = Registry()
+
+START_TIME = REGISTRY.register(
+    Gauge("ontopic_start_time_seconds", "Start time of the service since the epoch.")
+)
+START_TIME.set(time.time())
+THREADS = REGISTRY.register(
+    Gauge("ontopic_threads", "Number of threads of the serving process.")
+)
+THREADS.set_function(threading.active_count)
+RESIDENT_MEMORY = REGISTRY.register(
+    Gauge(
+        "ontopic_resident_memory_bytes",
+        "Resident memory of the serving process and of the worker processes, "
+        "mostly the spaCy models.",
+        ("process",),
+    )
+)
+RESIDENT_MEMORY.set_function(resident_memory, "server")
+
+REQUESTS = REGISTRY.register(
+    Counter(
+        "ontopic_requests_total",
+        "Number of HTTP requests.",
+        ("endpoint", "language", "status"),
+    )
+)
+REQUEST_SECONDS = REGISTRY.register(
+    Histogram(
+        "ontopic_request_duration_seconds",
+        "Latency of the HTTP requests.",
+        ("endpoint", "language"),
+        LATENCY_BUCKETS,
+    )
+)
+REQUESTS_IN_FLIGHT = REGISTRY.register(
+    Gauge("ontopic_requests_in_flight", "Number of HTTP requests being served.")
+)
+
+
+class RequestMetricsMiddleware:  # pylint: disable=too-few-public-methods
+    """
+    Counts the HTTP requests and records their latency per endpoint and
+    language until the end of the response body is sent, so that streamed
+    responses are measured in full. 'language' returns the language of a
+    request from its scope.
+    """
+
+    def __init__(self, app: ASGIApp, language: Callable[[Scope], str]):
+        self.app = app
+        self.language = language
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        REQUESTS_IN_FLIGHT.inc()
+        start = time.perf_counter()
+        status = 500
+        recorded = False
+
+        def record() -> None:
+            nonlocal recorded
+            if recorded:
+                return
+            recorded = True
+            REQUESTS_IN_FLIGHT.dec()
+            # The router sets the route in the scope of the request.
+            endpoint = getattr(scope.get("route"), "path", "other")
+            language = self.language(scope)
+            REQUESTS.inc(endpoint, language, str(status))
+            REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint, language)
+
+        async def send_recorded(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get(
+                "more_body", False
+            ):
+                record()
+
+        try:
+            await self.app(scope, receive, send_recorded)
+        finally:
+            record()
+
+
+REJECTED_REQUESTS = REGISTRY.register(
+    Counter(
+        "ontopic_rejected_requests_total",
+        "Number of requests rejected by the admission control.",
+        ("reason",),
+    )
+)
+EXECUTOR_QUEUE_DEPTH = REGISTRY.register(
+    Gauge(
+        "ontopic_executor_queue_depth", "Number of analyses waiting for a worker."
+    )
+)
+EXECUTOR_IN_FLIGHT = REGISTRY.register(
+    Gauge("ontopic_executor_in_flight", "Number of analyses being processed.")
+)
+
+SESSIONS = REGISTRY.register(
+    Gauge("ontopic_sessions", "Number of incremental analysis sessions.")
+)
+
+DOCUMENT_PARAGRAPHS = REGISTRY.register(
+    Histogram(
+        "ontopic_document_paragraphs",
+        "Number of paragraphs of the analysed documents.",
+        ("endpoint", "language"),
+        PARAGRAPH_BUCKETS,
+    )
+)
+DOCUMENT_SENTENCES = REGISTRY.register(
+    Histogram(
+        "ontopic_document_sentences",
+        "Number of sentences of the analysed documents.",
+        ("endpoint", "language"),
+        SENTENCE_BUCKETS,
+    )
+)
+DOCUMENT_WORDS = REGISTRY.register(
+    Histogram(
+        "ontopic_document_words",
+        "Number of words of the analysed documents.",
+        ("endpoint", "language"),
+        WORD_BUCKETS,
+    )
+)
+
+CACHE_LOOKUPS = REGISTRY.register(
+    Counter(
+        "ontopic_paragraph_cache_lookups_total",
+        "Number of paragraph cache lookups.",
+        ("result",),
+    )
+)
+CACHE_HIT_RATIO = REGISTRY.register(
+    Gauge(
+        "ontopic_paragraph_cache_hit_ratio",
+        "Fraction of the paragraph cache lookups that were hits.",
+    )
+)
+
+
+def cache_hit_ratio() -> float:
+    """Return the paragraph cache hit ratio since the service started."""
+    hits = CACHE_LOOKUPS.value("hit")
+    lookups = hits + CACHE_LOOKUPS.value("miss")
+    return hits / lookups if lookups else 0.0
+
+
+CACHE_HIT_RATIO.set_function(cache_hit_ratio)
+
+RESULT_CACHE_LOOKUPS = REGISTRY.register(
+    Counter(
+        "ontopic_result_cache_lookups_total",
+        "Number of analysis result lookups by ETag.",
+        ("result",),
+    )
+)
+
+STAGE_WALL_SECONDS = REGISTRY.register(
+    Histogram(
+        "ontopic_stage_wall_seconds",
+        "Wall time of each analysis pipeline stage.",
+        ("stage", "locale", "size"),
+    )
+)
+STAGE_CPU_SECONDS = REGISTRY.register(
+    Histogram(
+        "ontopic_stage_cpu_seconds",
+        "CPU time of each analysis pipeline stage.",
+        ("stage", "locale", "size"),
+    )
+)
+
+
+def observe_stages(
+    timings: dict[str, tuple[float, float]], locale: str, paragraphs: int
+) -> None:
+    """Add the stage timings of an analysis to the stage histograms."""
+    size = size_bucket(paragraphs)
+    for stage, (wall, cpu) in timings.items():
+        STAGE_WALL_SECONDS.observe(wall, stage, locale, size)
+        STAGE_CPU_SECONDS.observe(cpu, stage, locale, size)
+
+
+def observe_document(endpoint: str, language: str, stats: dict[str, int]) -> None:
+    """Add the statistics of an analysed document (see analysis.document_stats)."""
+    DOCUMENT_PARAGRAPHS.observe(stats["paragraphs"], endpoint, language)
+    DOCUMENT_SENTENCES.observe(stats["sentences"], endpoint, language)
+    DOCUMENT_WORDS.observe(stats["words"], endpoint, language)
+    if stats["cache_hits"]:
+        CACHE_LOOKUPS.inc("hit", amount=stats["cache_hits"])
+    if stats["cache_misses"]:
+        CACHE_LOOKUPS.inc("miss", amount=stats["cache_misses"])
+
+
+def watch_executor(executor) -> None:
+    """Read the queue depth and the worker memory from the analysis executor."""
+    EXECUTOR_QUEUE_DEPTH.set_function(lambda: executor.queue_depth)
+    EXECUTOR_IN_FLIGHT.set_function(lambda: executor.in_flight)
+    RESIDENT_MEMORY.set_function(
+        lambda: sum(resident_memory(pid) for pid in executor.worker_pids()),
+        "workers",
+    )
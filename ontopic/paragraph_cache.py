@@ -0,0 +1,219 @@
+"""Content addressed cache of per-paragraph sentence analyses.
+
+Students resubmit the same essay many times with small edits. The spaCy
+parse and the sentence level analysis of a paragraph only depend on the
+paragraph itself, so they are cached here and only the paragraphs that
+changed are parsed again. The cross-paragraph stages (given/new words and
+topics) are always recomputed by DSDocument.
+
+Entries are kept in a bounded in-memory LRU and optionally written to a
+directory as msgpack files so that they survive restarts and are shared by
+worker processes.
+"""
+
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Any, Optional
+
+import srsly
+
+import config
+
+# Bump when the cached analysis changes so that stale disk entries are ignored.
+CACHE_FORMAT = 2
+
+
+def paragraph_key(*parts: str) -> str:
+    """Create a cache key from the model identity and paragraph content."""
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(str(CACHE_FORMAT).encode("utf-8"))
+    for part in parts:
+        digest.update(b"\0")
+        digest.update(part.encode("utf-8"))
+    return digest.hexdigest()
+
+
+class ParagraphCache:  # pylint: disable=too-many-instance-attributes
+    """
+    A thread-safe LRU cache of paragraph analyses with an optional disk tier.
+
+    max_entries:     number of entries kept in memory, 0 disables the cache.
+    directory:       where entries are also stored as msgpack files, if given.
+    max_disk_bytes:  size of the directory beyond which the least recently used
+                     files are deleted, 0 is unlimited.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 4096,
+        directory: Optional[str] = None,
+        max_disk_bytes: int = 0,
+    ):
+        self.max_entries = max_entries
+        self.directory = directory or None
+        self.max_disk_bytes = max_disk_bytes
+        self._written = 0  # bytes written since the directory was last pruned
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: OrderedDict[str, Any] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        """True if entries are stored at all."""
+        return self.max_entries > 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory or "", key[:2], f"{key}.msgpack")
+
+    def _read(self, key: str) -> Optional[Any]:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as fin:
+                value = srsly.msgpack_loads(fin.read())
+            if self.max_disk_bytes > 0:
+                os.utime(path)  # the modification time is the last use
+            return value
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as err:
+            logging.warning("Unable to read cached paragraph %s: %s", key, err)
+            return None
+
+    def _write(self, key: str, value: Any) -> None:
+        path = self._path(key)
+        tmp_path = None
+        try:
+            data = srsly.msgpack_dumps(value)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write to a temporary file first so that readers in other
+            # processes never see a partially written entry.
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+            with os.fdopen(fd, "wb") as fout:
+                fout.write(data)
+            os.replace(tmp_path, path)
+            tmp_path = None
+        except (OSError, ValueError) as err:
+            logging.warning("Unable to write cached paragraph %s: %s", key, err)
+            return
+        finally:
+            if tmp_path is not None:
+                try:
+                    os.unlink(tmp_path)
+                except OSError:
+                    pass
+
+        if self.max_disk_bytes > 0:
+            # Prune after every tenth of the directory size has been written.
+            with self._lock:
+                self._written += len(data)
+                prune = self._written >= self.max_disk_bytes // 10
+                if prune:
+                    self._written = 0
+            if prune:
+                self.prune()
+
+    def prune(self) -> None:
+        """
+        Delete the least recently used files of the directory, by modification
+        time, until it is at most 90% of max_disk_bytes if it is larger. Other
+        processes sharing the directory may be pruning it at the same time.
+        """
+        if self.directory is None or self.max_disk_bytes <= 0:
+            return
+        files = []
+        total = 0
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+        if total <= self.max_disk_bytes:
+            return
+        files.sort()
+        removed = 0
+        for _, size, path in files:
+            if total <= self.max_disk_bytes * 0.9:
+                break
+            try:
+                os.unlink(path)
+                removed += 1
+            except FileNotFoundError:
+                pass
+            except OSError as err:
+                logging.warning("Unable to delete cached paragraph %s: %s", path, err)
+                continue
+            total -= size
+        logging.info("Pruned %d cached paragraphs from %s", removed, self.directory)
+
+    def _store(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return the cached value for key, or None if it is not cached."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+        if self.directory is not None:
+            value = self._read(key)
+            if value is not None:
+                self._store(key, value)
+                with self._lock:
+                    self.hits += 1
+                return value
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: str, value: Any) -> None:
+        """Add or replace the value for key."""
+        if not self.enabled:
+            return
+        self._store(key, value)
+        if self.directory is not None:
+            self._write(key, value)
+
+    def clear(self) -> None:
+        """Remove all the in-memory entries and reset the counters."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def stats(self) -> dict[str, int]:
+        """Return the hit, miss and eviction counters and the current size."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+            }
+
+
+PARAGRAPH_CACHE = ParagraphCache(
+    config.CACHE_SIZE, config.CACHE_DIR, config.CACHE_DIR_BYTES
+)
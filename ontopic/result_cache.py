@@ -0,0 +1,88 @@
+"""ETags and a cache of the serialized onTopic results.
+
+Clients post the same document again, e.g., when a page is reloaded or when
+the frontend's Node proxy retries a request, and the result of an analysis
+only depends on the request and on the model that analysed it. Each result
+is therefore given an ETag, a hash of the request body and query, the
+locale, the model version and the service version. A request whose
+If-None-Match header has this ETag is answered with 304, and the serialized
+results are kept in memory so that a resubmitted document is not analysed
+again. The ETags are weak as the responses may be compressed.
+"""
+
+import hashlib
+from collections import OrderedDict
+from functools import lru_cache
+from importlib.metadata import PackageNotFoundError, version
+from typing import Optional
+
+import config
+
+
+@lru_cache(maxsize=None)
+def model_version(model_name: str) -> str:
+    """The version of an installed spaCy model package, "" if it is unknown."""
+    try:
+        return version(model_name)
+    except PackageNotFoundError:
+        return ""
+
+
+def result_etag(body: bytes, *parts: str) -> str:
+    """The ETag of the result of a request body, e.g., with its locale and model."""
+    digest = hashlib.blake2b(body, digest_size=20)
+    for part in parts:
+        digest.update(b"\0")
+        digest.update(part.encode("utf-8"))
+    return f'W/"{digest.hexdigest()}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """True if an If-None-Match header has 'etag', compared weakly."""
+    if not if_none_match:
+        return False
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in tags or etag.removeprefix("W/") in tags
+
+
+class ResultCache:
+    """
+    An LRU cache of serialized results by ETag, holding at most 'max_bytes'.
+    A size of 0 disables the cache. It is only used from the event loop.
+    """
+
+    def __init__(self, max_bytes: int = 64_000_000):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries: OrderedDict[str, bytes] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, etag: str) -> Optional[bytes]:
+        """Return a serialized result, None if it is not cached."""
+        body = self._entries.get(etag)
+        if body is not None:
+            self._entries.move_to_end(etag)
+        return body
+
+    def clear(self) -> None:
+        """Remove all the entries."""
+        self._entries.clear()
+        self.size = 0
+
+    def put(self, etag: str, body: bytes) -> None:
+        """Store a serialized result, dropping the least recently used ones."""
+        if len(body) > self.max_bytes:
+            return
+        old = self._entries.pop(etag, None)
+        if old is not None:
+            self.size -= len(old)
+        self._entries[etag] = body
+        self.size += len(body)
+        while self.size > self.max_bytes:
+            _, dropped = self._entries.popitem(last=False)
+            self.size -= len(dropped)
+
+
+RESULT_CACHE = ResultCache(config.RESULT_CACHE_BYTES)
@@ -0,0 +1,243 @@
+"""Pre-fork launcher of the onTopic service.
+
+Each hypercorn worker process loads its own copy of the spaCy models, about
+500 MB, and the first requests of a new worker are slow while the pipeline
+warms up. This launcher loads the preloaded models and analyses the warm-up
+corpus once, then forks the server processes, which share the memory of the
+models copy-on-write and are ready as soon as they are forked. The server
+processes accept connections on a socket opened by the launcher.
+
+A server process is replaced when it exits, and it stops by itself, after
+finishing the requests in progress, once it has served WORKER_MAX_REQUESTS
+requests or its memory exceeds WORKER_MAX_MEMORY. SIGTERM or SIGINT stop all
+of them gracefully. With SERVER_WORKERS=0 the launcher serves by itself and is
+never replaced, so these limits are ignored.
+
+Each server process has its own sessions, result cache, client request counts
+and metrics. With several server processes, the edits of a session have to be
+sent to the process that created it, e.g., by a proxy with sticky sessions,
+and /metrics reports the process that answers the scrape.
+
+    > python server.py
+"""
+
+import asyncio
+import gc
+import logging
+import os
+import random
+import signal
+import time
+from typing import Optional
+
+from hypercorn.asyncio import serve
+from hypercorn.config import Config
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+import config
+from analysis import ontopic_analysis
+from app import app
+from corpus import load_corpus
+from localization.NLP import NLP_MODELS, preload_models
+from metrics import resident_memory
+
+# A server process that exits within this many seconds of being forked is
+# replaced after this delay, so that a failing startup does not fork in a loop.
+RESTART_DELAY = 1.0
+
+
+def warm_up(corpus: str = "") -> None:
+    """
+    Analyse the essays of a corpus, or the warm-up text of each locale, with
+    every loaded model, so that the lazily initialized parts of the analysis
+    are ready before the server processes are forked.
+    """
+    essays = list(load_corpus(corpus).values()) if corpus else []
+    for language, locale in NLP_MODELS.items():
+        if not locale.loaded:
+            continue
+        start = time.perf_counter()
+        for html in essays or [f"<p>{locale.warmup_text}</p>"]:
+            ontopic_analysis(language, html)
+        logging.info(
+            "Warmed up %s with %d documents in %.2f s",
+            language,
+            len(essays) or 1,
+            time.perf_counter() - start,
+        )
+
+
+class WorkerLifetime:
+    """
+    Counts the HTTP requests of a server process and asks it to stop once it
+    has served 'max_requests' requests or uses more than 'max_memory' bytes,
+    0 is unlimited. Up to 10% more requests are allowed at random so that the
+    server processes are not all replaced at once.
+    """
+
+    def __init__(self, asgi_app: ASGIApp, max_requests: int = 0, max_memory: int = 0):
+        self.app = asgi_app
+        self.max_requests = max_requests
+        if max_requests > 0:
+            self.max_requests += random.randint(0, max_requests // 10)
+        self.max_memory = max_memory
+        self.requests = 0
+        self.stopping = asyncio.Event()
+
+    def stop(self) -> None:
+        """Stop accepting connections and exit once the requests are done."""
+        self.stopping.set()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.requests += 1
+            if not self.stopping.is_set():
+                reason = self.expired()
+                if reason is not None:
+                    pid = os.getpid()
+                    logging.info("onTopic server %d is replaced %s", pid, reason)
+                    self.stop()
+
+    def expired(self) -> Optional[str]:
+        """The reason to replace the server process, None if it can go on."""
+        if 0 < self.max_requests <= self.requests:
+            return f"after {self.requests} requests"
+        if self.max_memory > 0:
+            memory = resident_memory()
+            if memory > self.max_memory:
+                return f"as it uses {memory // 1_000_000} MB"
+        return None
+
+
+def run_server(hypercorn_config: Config, replaced: bool = True) -> None:
+    """
+    Serve the app until the process is asked to stop, or until it has to be
+    replaced if it is a forked server process.
+    """
+    if replaced:
+        lifetime = WorkerLifetime(
+            app, config.WORKER_MAX_REQUESTS, config.WORKER_MAX_MEMORY
+        )
+    else:
+        lifetime = WorkerLifetime(app)
+
+    async def serve_app() -> None:
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(signum, lifetime.stop)
+        await serve(
+            lifetime,
+            hypercorn_config,
+            shutdown_trigger=lifetime.stopping.wait,
+            mode="asgi",
+        )
+
+    asyncio.run(serve_app())
+
+
+class Launcher:
+    """Forks the server processes and replaces them when they exit."""
+
+    def __init__(self, hypercorn_config: Config, workers: int):
+        self.hypercorn_config = hypercorn_config
+        self.workers = workers
+        self.servers: dict[int, float] = {}  # fork time by process id
+        self.stopping = False
+
+    def fork(self) -> None:
+        """Start a server process."""
+        pid = os.fork()
+        if pid == 0:
+            code = 1
+            try:
+                # Not the launcher's handlers, run_server() sets its own.
+                signal.signal(signal.SIGINT, signal.SIG_DFL)
+                signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                run_server(self.hypercorn_config)
+                code = 0
+            except BaseException:  # pylint: disable=broad-exception-caught
+                logging.exception("onTopic server %d failed", os.getpid())
+            finally:
+                logging.shutdown()
+                os._exit(code)  # pylint: disable=protected-access
+        self.servers[pid] = time.monotonic()
+        logging.info("onTopic server %d started", pid)
+
+    def stop(self, signum: int, _frame=None) -> None:
+        """Ask the server processes to finish their requests and exit."""
+        if not self.stopping:
+            logging.info("Stopping the onTopic servers (%s)", signal.strsignal(signum))
+        self.stopping = True
+        for pid in self.servers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def run(self) -> None:
+        """Keep 'workers' server processes running until stopped."""
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        for _ in range(self.workers):
+            self.fork()
+        while self.servers:
+            pid, status = os.wait()
+            started = self.servers.pop(pid, None)
+            if started is None:
+                continue
+            code = os.waitstatus_to_exitcode(status)
+            if self.stopping:
+                continue
+            if code != 0:
+                logging.error("onTopic server %d exited with %d", pid, code)
+            if time.monotonic() - started < RESTART_DELAY:
+                time.sleep(RESTART_DELAY)
+            self.fork()
+
+
+def main() -> None:
+    """Load the models, warm them up and serve with the configured workers."""
+    logging.basicConfig(level=logging.INFO)
+    preload_models(config.PRELOAD_LANGUAGES)
+    warm_up(config.WARMUP_CORPUS)
+
+    hypercorn_config = Config()
+    hypercorn_config.bind = [config.BIND]
+    hypercorn_config.root_path = config.ROOT_PATH
+    hypercorn_config.graceful_timeout = config.GRACEFUL_TIMEOUT
+    if config.SERVER_WORKERS <= 0:
+        if config.WORKER_MAX_REQUESTS > 0 or config.WORKER_MAX_MEMORY > 0:
+            logging.warning(
+                "ONTOPIC_WORKER_MAX_REQUESTS and ONTOPIC_WORKER_MAX_MEMORY are "
+                "ignored without server processes to replace"
+            )
+        run_server(hypercorn_config, replaced=False)
+        return
+    if config.SERVER_WORKERS > 1:
+        logging.warning(
+            "Each of the %d server processes has its own sessions, caches and "
+            "metrics, session edits must reach the process that created the "
+            "session",
+            config.SERVER_WORKERS,
+        )
+
+    # The server processes accept the connections of the launcher's socket.
+    sockets = hypercorn_config.create_sockets()
+    hypercorn_config.bind = [
+        f"fd://{sock.fileno()}" for sock in sockets.insecure_sockets
+    ]
+    # Keep the garbage collector from writing to the pages of the models in the
+    # server processes, so that they stay shared.
+    gc.freeze()
+    Launcher(hypercorn_config, config.SERVER_WORKERS).run()
+    for sock in sockets.insecure_sockets:
+        sock.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Incremental analysis sessions.
+
+A session keeps the HTML fragment of a document that is being edited so
+that follow-up requests only send the paragraphs that were added, removed
+or changed. The analysed DSDocument itself is not kept: its sentences refer
+to spaCy objects that are only valid within the memory zone of a request,
+and the analysis may run in another process. The sentence analyses of the
+unchanged paragraphs are found in the paragraph cache instead, so that only
+the edited paragraphs are parsed again.
+
+Sessions are only used from the event loop of the serving process.
+"""
+
+import asyncio
+import secrets
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Optional
+
+from topic_clusters import ClusterDefinition
+
+
+@dataclass
+class Session:
+    """The current HTML fragment of a document, its language and topic clusters."""
+
+    handle: str
+    language: str
+    html: str
+    expires: float
+    clusters: ClusterDefinition = ()
+    # Serializes the edits of a session, they are applied to the latest html.
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+
+
+class SessionStore:
+    """
+    Sessions by handle, dropped 'ttl' seconds after their last use or when
+    there are more than 'max_sessions' of them.
+    """
+
+    def __init__(self, ttl: int = 900, max_sessions: int = 1024):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._sessions: OrderedDict[str, Session] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def _evict(self) -> None:
+        """Drop the expired sessions and the least recently used extra ones."""
+        now = time.monotonic()
+        while self._sessions:
+            session = next(iter(self._sessions.values()))
+            if session.expires > now and len(self._sessions) <= self.max_sessions:
+                break
+            self._sessions.popitem(last=False)
+
+    def create(
+        self, language: str, html: str, clusters: ClusterDefinition = ()
+    ) -> Session:
+        """Start a new session for an HTML fragment."""
+        session = Session(
+            handle=secrets.token_urlsafe(16),
+            language=language,
+            html=html,
+            expires=time.monotonic() + self.ttl,
+            clusters=clusters,
+        )
+        self._sessions[session.handle] = session
+        self._evict()
+        return session
+
+    def get(self, handle: str) -> Optional[Session]:
+        """Return the session and extend its lifetime, None if it has expired."""
+        self._evict()
+        session = self._sessions.get(handle)
+        if session is not None:
+            session.expires = time.monotonic() + self.ttl
+            self._sessions.move_to_end(handle)
+        return session
+
+    def remove(self, handle: str) -> bool:
+        """End a session, return False if there is no such session."""
+        return self._sessions.pop(handle, None) is not None
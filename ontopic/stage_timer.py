@@ -0,0 +1,83 @@
+"""Wall and CPU time of the analysis pipeline stages.
+
+DSDocument methods decorated with timed() record their duration on the
+document's StageTimings so that a slow request can be attributed to spaCy
+or to the topic analysis. The timings are plain dictionaries so that they
+can be returned from a worker process together with the analysis.
+"""
+
+import time
+from contextlib import contextmanager
+from functools import wraps
+from typing import Callable, Iterator, Optional
+
+# stage name -> (wall seconds, CPU seconds)
+type Timings = dict[str, tuple[float, float]]
+
+
+class StageTimings:
+    """
+    Accumulated wall and CPU seconds of each stage. A stage that runs several
+    times is added up, and the time of a stage nested in another one is only
+    counted for the inner stage.
+    """
+
+    def __init__(self, timings: Optional[Timings] = None):
+        self._stages: dict[str, list[float]] = {
+            name: list(times) for name, times in (timings or {}).items()
+        }
+        self._nested: list[list[float]] = []  # time of the nested stages
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Time the body of the with statement as the stage 'name'."""
+        self._nested.append([0.0, 0.0])
+        wall = time.perf_counter()
+        cpu = time.thread_time()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - wall
+            cpu = time.thread_time() - cpu
+            nested_wall, nested_cpu = self._nested.pop()
+            if self._nested:
+                self._nested[-1][0] += wall
+                self._nested[-1][1] += cpu
+            total = self._stages.setdefault(name, [0.0, 0.0])
+            total[0] += wall - nested_wall
+            total[1] += cpu - nested_cpu
+
+    def to_dict(self) -> Timings:
+        """Return the timings of the stages in the order they first ran."""
+        return {name: (wall, cpu) for name, (wall, cpu) in self._stages.items()}
+
+
+def timed(name: str) -> Callable:
+    """Decorate a method of an object with a 'timings' attribute to time it."""
+
+    def decorator(method: Callable) -> Callable:
+        @wraps(method)
+        def wrapper(self, *args, **kwargs):
+            with self.timings.stage(name):
+                return method(self, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def server_timing(timings: Timings) -> str:
+    """Format the timings as a Server-Timing header value in milliseconds."""
+    return ", ".join(
+        f'{name};dur={wall * 1000:.2f};desc="cpu={cpu * 1000:.2f}ms"'
+        for name, (wall, cpu) in timings.items()
+    )
+
+
+def log_fields(timings: Timings) -> dict[str, float]:
+    """Flatten the timings into <stage>_wall_ms and <stage>_cpu_ms log fields."""
+    fields = {}
+    for name, (wall, cpu) in timings.items():
+        fields[f"{name.strip('_')}_wall_ms"] = round(wall * 1000, 2)
+        fields[f"{name.strip('_')}_cpu_ms"] = round(cpu * 1000, 2)
+    return fields
@@ -0,0 +1,167 @@
+"""Columnar storage of the analyzed words in the paragraph cache.
+
+DSDocument represents each word of a sentence as a tuple (see the constants
+in ds_document.py):
+    (POS, WORD, LEMMA, ISLEFT, DEP, STEM, LINKS, QUOTE, WORD_POS, DS_DATA)
+With its own string objects, such a tuple takes a few hundred bytes per
+word, which adds up in the paragraph cache that keeps thousands of
+paragraphs. TokenTable keeps the words of a sequence of sentences in a few
+arrays instead: the strings are interned and stored as ids, the flags and
+positions are NumPy arrays, and the sentences are ranges given by offsets.
+
+This is only the storage format of the cache entries, the document is still
+analysed with the tuples. sentence() creates the tuples of a sentence again
+on each cache hit, which costs some allocations on a hit for cache entries
+that take about a tenth of the memory of the tuples.
+"""
+
+import sys
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Indexes of the fields of a word tuple (see ds_document.py).
+POS, WORD, LEMMA, ISLEFT, DEP, STEM, LINKS, QUOTE, WORD_POS, DS_DATA = range(10)
+
+# The string fields of a word, in the order of the columns of TokenTable.ids.
+STRING_FIELDS = (POS, WORD, LEMMA, DEP, STEM)
+
+
+class TokenTable:
+    """
+    The words of a sequence of sentences as columns.
+
+    strings:    the distinct strings of the words, interned when the table is
+                created from sentences so that the tables share them.
+    ids:        (words x 5) ids in 'strings' of POS, WORD, LEMMA, DEP and STEM.
+    is_left:    ISLEFT of each word.
+    quote:      QUOTE of each word.
+    word_pos:   WORD_POS of each word, relative to the first word of its sentence.
+    offsets:    index of the first word of each sentence, and the number of words.
+    extra:      (LINKS, DS_DATA) of the words where either is not None, by index.
+    """
+
+    def __init__(  # pylint: disable=too-many-arguments,too-many-positional-arguments
+        self,
+        strings: List[str],
+        ids: np.ndarray,
+        is_left: np.ndarray,
+        quote: np.ndarray,
+        word_pos: np.ndarray,
+        offsets: np.ndarray,
+        extra: Optional[Dict[int, Tuple[Any, Any]]] = None,
+    ):
+        self.strings = strings
+        self.ids = ids
+        self.is_left = is_left
+        self.quote = quote
+        self.word_pos = word_pos
+        self.offsets = offsets
+        self.extra = extra or {}
+
+    def __len__(self) -> int:
+        """Number of sentences."""
+        return len(self.offsets) - 1
+
+    @property
+    def num_words(self) -> int:
+        """Total number of words."""
+        return int(self.offsets[-1])
+
+    @classmethod
+    def from_sentences(  # pylint: disable=too-many-locals
+        cls, sentences: Iterable[Sequence[tuple]]
+    ) -> "TokenTable":
+        """Create a table from the word tuples of each sentence."""
+        strings: List[str] = []
+        string_ids: Dict[str, int] = {}
+        ids: List[List[int]] = []
+        is_left: List[bool] = []
+        quote: List[bool] = []
+        word_pos: List[int] = []
+        offsets = [0]
+        extra: Dict[int, Tuple[Any, Any]] = {}
+        for words in sentences:
+            start = words[0][WORD_POS] if words else 0
+            for w in words:
+                row = []
+                for f in STRING_FIELDS:
+                    i = string_ids.get(w[f])
+                    if i is None:
+                        i = string_ids[w[f]] = len(strings)
+                        strings.append(sys.intern(w[f]))
+                    row.append(i)
+                if w[LINKS] is not None or w[DS_DATA] is not None:
+                    extra[len(ids)] = (w[LINKS], w[DS_DATA])
+                ids.append(row)
+                is_left.append(w[ISLEFT])
+                quote.append(w[QUOTE])
+                word_pos.append(w[WORD_POS] - start)
+            offsets.append(len(ids))
+        return cls(
+            strings,
+            np.array(ids, dtype=np.int32).reshape(-1, len(STRING_FIELDS)),
+            np.array(is_left, dtype=np.bool_),
+            np.array(quote, dtype=np.bool_),
+            np.array(word_pos, dtype=np.int32),
+            np.array(offsets, dtype=np.int32),
+            extra,
+        )
+
+    def sentence(  # pylint: disable=too-many-locals
+        self, i: int, start: int = 0
+    ) -> List[tuple]:
+        """
+        Create the word tuples of sentence i, whose first word is at position
+        'start' of the document.
+        """
+        lo, hi = int(self.offsets[i]), int(self.offsets[i + 1])
+        s = self.strings
+        is_left = self.is_left[lo:hi].tolist()
+        quote = self.quote[lo:hi].tolist()
+        word_pos = (self.word_pos[lo:hi] + start).tolist()
+        words = []
+        for k, (pos, word, lemma, dep, stem) in enumerate(self.ids[lo:hi].tolist()):
+            links, ds_data = self.extra.get(lo + k, (None, None))
+            words.append(
+                (
+                    s[pos],
+                    s[word],
+                    s[lemma],
+                    is_left[k],
+                    s[dep],
+                    s[stem],
+                    links,
+                    quote[k],
+                    word_pos[k],
+                    ds_data,
+                )
+            )
+        return words
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Return the table as plain values that can be stored as msgpack."""
+        return {
+            "strings": self.strings,
+            "ids": self.ids.tobytes(),
+            "is_left": self.is_left.tobytes(),
+            "quote": self.quote.tobytes(),
+            "word_pos": self.word_pos.tobytes(),
+            "offsets": self.offsets.tobytes(),
+            "extra": [
+                [i, links, ds_data] for i, (links, ds_data) in self.extra.items()
+            ],
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "TokenTable":
+        """Create a table from the values returned by to_dict()."""
+        return cls(
+            data["strings"],
+            np.frombuffer(data["ids"], dtype=np.int32).reshape(-1, len(STRING_FIELDS)),
+            np.frombuffer(data["is_left"], dtype=np.bool_),
+            np.frombuffer(data["quote"], dtype=np.bool_),
+            np.frombuffer(data["word_pos"], dtype=np.int32),
+            np.frombuffer(data["offsets"], dtype=np.int32),
+            {i: (links, ds_data) for i, links, ds_data in data["extra"]},
+        )
@@ -0,0 +1,160 @@
+"""User defined topic clusters and multi-word topics.
+
+A topic cluster groups the words and phrases (its synonyms) that a writer
+uses for one topic, so that the topic can be followed through a document
+even when it is not always named the same way. A multi-word topic, e.g.,
+"climate change", is analysed as a single word, like a cluster of itself.
+
+The legacy desktop application kept the clusters in class variables of
+DSDocument and looked every token up in four case variants of each synonym,
+after joining the words of the multi-word topics with "_" in the text. Here
+the clusters are given with each analysis and the synonyms are found in the
+parsed paragraphs with a spaCy PhraseMatcher on the lowercase text. The
+matched phrases are merged into one token whose lemma is the topic. Clients
+typically send the same clusters with every request, so the matchers are
+cached by cluster definition.
+"""
+
+import hashlib
+from functools import lru_cache
+from typing import Dict, Iterable, Optional, Tuple
+
+from spacy.language import Language
+from spacy.matcher import PhraseMatcher
+from spacy.tokens import Doc, Span
+from spacy.util import filter_spans
+
+# The topics and their synonyms, in the order given, as plain tuples so that
+# they can be sent to a worker process and used as a cache key.
+type ClusterDefinition = Tuple[Tuple[str, Tuple[str, ...]], ...]
+
+
+def topic_lemma(topic: str) -> str:
+    """The lemma of a user defined topic, e.g., "climate_change"."""
+    return "_".join(topic.lower().split())
+
+
+def cluster_definition(
+    clusters: Iterable[Tuple[str, Iterable[str]]] = (),
+    multiword_topics: Iterable[str] = (),
+) -> ClusterDefinition:
+    """
+    Create the definition of the topic clusters from (topic, synonyms) pairs
+    and multi-word topics. The topic of a cluster is one of its synonyms, and a
+    multi-word topic is a cluster of itself. Empty topics and repeated
+    synonyms are dropped, a phrase that is a synonym of several topics belongs
+    to the first one.
+    """
+    definition = []
+    seen = set()
+    pairs = list(clusters) + [(topic, ()) for topic in multiword_topics]
+    for topic, synonyms in pairs:
+        topic = " ".join(topic.split())
+        if not topic:
+            continue
+        phrases = []
+        for phrase in (topic, *synonyms):
+            phrase = " ".join(phrase.split())
+            if phrase and phrase.lower() not in seen:
+                seen.add(phrase.lower())
+                phrases.append(phrase)
+        definition.append((topic, tuple(phrases)))
+    return tuple(definition)
+
+
+@lru_cache(maxsize=64)
+def phrase_matcher(
+    nlp: Language, definition: ClusterDefinition
+) -> Tuple[PhraseMatcher, Dict[int, str]]:
+    """
+    Return a PhraseMatcher for the synonyms of the clusters and the lemmas of
+    the topics by match id. The match ids are the position of the cluster
+    rather than its topic: the matcher outlives the memory zone of the request
+    that created it, so its labels have to be kept in the vocabulary, and
+    there are only as many of these as the clusters of the largest request.
+    """
+    matcher = PhraseMatcher(nlp.vocab, attr="LOWER")
+    topics = {}
+    for i, (topic, synonyms) in enumerate(definition):
+        label = f"topic_cluster_{i}"
+        topics[nlp.vocab.strings.add(label, allow_transient=False)] = topic_lemma(topic)
+        matcher.add(label, [nlp.make_doc(synonym) for synonym in synonyms])
+    return matcher, topics
+
+
+class TopicClusters:
+    """
+    The topic clusters of an analysis. An empty TopicClusters is false and
+    leaves the parsed paragraphs as they are.
+    """
+
+    def __init__(self, definition: ClusterDefinition = ()):
+        self.definition = definition
+        self.topics = frozenset(topic_lemma(topic) for topic, _ in definition)
+        # The topics of the one-word synonyms, also matched with the lemma of
+        # the nouns, e.g., "studies" is in a cluster with the synonym "study".
+        self.words: Dict[str, str] = {}
+        for topic, synonyms in definition:
+            for synonym in synonyms:
+                if " " not in synonym:
+                    self.words.setdefault(synonym.lower(), topic_lemma(topic))
+        self.key = ""  # the part of the paragraph cache key for the clusters
+        if definition:
+            digest = hashlib.blake2b(repr(definition).encode("utf-8"), digest_size=16)
+            self.key = f"clusters:{digest.hexdigest()}"
+
+    def __bool__(self) -> bool:
+        return bool(self.definition)
+
+    def is_topic(self, lemma: Optional[str]) -> bool:
+        """Return True if 'lemma' is the lemma of a user defined topic."""
+        return lemma in self.topics
+
+    def get_topics(self) -> list[str]:
+        """The lemmas of the topics, in the order they were given."""
+        return [topic_lemma(topic) for topic, _ in self.definition]
+
+    def apply(self, nlp: Language, doc: Doc) -> Doc:
+        """
+        Find the synonyms of the clusters in a parsed paragraph. Each one is
+        merged into a single token whose lemma is its topic and which is
+        treated as a noun. Overlapping matches are resolved in favour of the
+        longest, and phrases that span two sentences are not matched.
+        """
+        if not self.definition:
+            return doc
+
+        matcher, topics = phrase_matcher(nlp, self.definition)
+        spans = [
+            Span(doc, start, end, label=match_id)
+            for match_id, start, end in matcher(doc)
+            if not any(token.is_sent_start for token in doc[start + 1 : end])
+        ]
+        spans = filter_spans(spans)
+        matched = set()
+        for span in spans:
+            matched.update(range(span.start, span.end))
+            if len(span) == 1:
+                set_topic(span[0], topics[span.label])
+
+        for token in doc:
+            if token.i not in matched and token.pos_ in ("NOUN", "PROPN"):
+                topic = self.words.get(token.lemma_.lower())
+                if topic is not None:
+                    set_topic(token, topic)
+
+        with doc.retokenize() as retokenizer:
+            for span in spans:
+                if len(span) > 1:
+                    retokenizer.merge(
+                        span,
+                        attrs={"LEMMA": topics[span.label], "POS": "NOUN", "TAG": "NN"},
+                    )
+        return doc
+
+
+def set_topic(token, topic: str) -> None:
+    """Make a token a noun whose lemma is 'topic'."""
+    token.lemma_ = topic
+    token.pos_ = "NOUN"
+    token.tag_ = "NN"
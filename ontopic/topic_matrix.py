@@ -0,0 +1,208 @@
+"""Array backed topic progression matrix.
+
+The global topic progression data is a table of sentences (rows) by topic
+candidates (columns). DSDocument used to build it as lists of tuples, one
+per cell, and every consumer scanned all the cells. TopicMatrix keeps a
+flag matrix with one int8 per cell instead, along with the sentence
+lemma of every non empty cell, so that the statistics of all the topics
+can be computed with a few array operations.
+
+The rows of the legacy table are:
+    0       the header, a list of (POS, LEMMA, WORD_POS, SENT_COUNT, PARA_COUNT)
+    1       a paragraph break, [-1] * (ncols + 2)
+    ...     a row of cells for each sentence, followed by a paragraph break
+            after the last sentence of each paragraph.
+TopicMatrix.to_data() creates that table for the callers that still need it.
+"""
+
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+# Cell flags
+MATCH_FLAG = 1  # the topic appears in the sentence
+LEFT_FLAG = 2  # the topic appears on the left side of the main verb
+NEW_FLAG = 4  # the topic is a new lemma of the paragraph
+GIVEN_FLAG = 8  # the topic is a given lemma of the paragraph
+
+
+class TopicMatrix:  # pylint: disable=too-many-instance-attributes
+    """
+    Sentences x topics matrix of the global topic progression.
+
+    Sentences are added in order with add_sentence() and paragraphs are closed
+    with add_break(). The arrays are created by finish().
+    """
+
+    def __init__(self, header: List[tuple]):
+        self.header = header  # list of (POS, LEMMA, WORD_POS, SENT_COUNT, PARA_COUNT)
+        self.ncols = len(header)
+        self.nrows = 2  # number of rows in the legacy table
+
+        self.rows: List[int] = []  # legacy row index of each sentence
+        self.breaks: List[int] = [1]  # legacy row index of each paragraph break
+        self.para: List[int] = []  # index of the paragraph of each sentence
+        self.sent: List[int] = []  # index of each sentence in its paragraph
+        self.para_pos: List[int] = []  # PARA_POS of each sentence
+        self.sent_pos: List[int] = []  # SENT_POS of each sentence
+        self.skip_punct: List[bool] = []  # IS_SKIP of each sentence
+
+        # (sentence, topic) -> sentence lemma of the non empty cells
+        self.cells: Dict[Tuple[int, int], tuple] = {}
+        self._flags: List[Tuple[int, int, int]] = []
+        self.flags = np.zeros((0, self.ncols), dtype=np.int8)
+
+    @property
+    def num_sents(self) -> int:
+        """Number of sentence rows."""
+        return len(self.rows)
+
+    @property
+    def num_paras(self) -> int:
+        """Number of paragraphs, i.e., paragraph breaks after the first one."""
+        return len(self.breaks) - 1
+
+    def add_sentence(
+        self,
+        para_pos: int,
+        sent_pos: int,
+        skip_punct: bool,
+        matches: List[Tuple[int, int, tuple]],
+    ) -> None:
+        """
+        Add a sentence row. 'matches' is a list of (column, flags, lemma) for the
+        topics that appear in the sentence, where lemma is the first of the
+        sentence's lemmas that matches the topic.
+        """
+        i = len(self.rows)
+        self.rows.append(self.nrows)
+        self.para.append(len(self.breaks) - 1)
+        self.sent.append(
+            self.sent[-1] + 1 if i > 0 and self.para[-2] == self.para[-1] else 0
+        )
+        self.para_pos.append(para_pos)
+        self.sent_pos.append(sent_pos)
+        self.skip_punct.append(skip_punct)
+        for c, flags, lemma in matches:
+            self.cells[(i, c)] = lemma
+            self._flags.append((i, c, flags))
+        self.nrows += 1
+
+    def add_break(self) -> None:
+        """Add a paragraph break after the last sentence of a paragraph."""
+        self.breaks.append(self.nrows)
+        self.nrows += 1
+
+    def finish(self) -> "TopicMatrix":
+        """Create the flag matrix once all the rows are added."""
+        self.flags = np.zeros((self.num_sents, self.ncols), dtype=np.int8)
+        if self._flags:
+            i, c, flags = np.array(self._flags, dtype=np.int64).T
+            self.flags[i, c] = flags
+        self._flags = []
+        return self
+
+    def cell(self, i: int, c: int) -> tuple:
+        """
+        Return the legacy tuple of a cell, the sentence lemma extended with
+        (PARA_POS, SENT_POS, NEW, GIVEN, IS_SKIP, IS_TOPIC), or (None, IS_SKIP)
+        for an empty cell.
+        """
+        lemma = self.cells.get((i, c))
+        if lemma is None:
+            return (None, self.skip_punct[i])
+        flags = int(self.flags[i, c])
+        return lemma + (
+            self.para_pos[i],
+            self.sent_pos[i],
+            bool(flags & NEW_FLAG),
+            bool(flags & GIVEN_FLAG),
+            self.skip_punct[i],
+            bool(flags & LEFT_FLAG),
+        )
+
+    def column(self, c: int) -> List[int]:
+        """Indexes of the sentences in which topic c appears."""
+        return np.flatnonzero(self.flags[:, c] & MATCH_FLAG).tolist()
+
+    def to_data(self) -> List[list]:
+        """Create the legacy table of lists of tuples (see the module docstring)."""
+        para_break = [-1] * (self.ncols + 2)
+        data: List[list] = [self.header, list(para_break)]
+        breaks = set(self.breaks)
+        i = 0
+        for r in range(2, self.nrows):
+            if r in breaks:
+                data.append(list(para_break))
+            else:
+                data.append([self.cell(i, c) for c in range(self.ncols)])
+                i += 1
+        return data
+
+    def topic_stats(self) -> Dict[str, np.ndarray]:  # pylint: disable=too-many-locals
+        """
+        Compute the statistics of every topic used by DSDocument.filterTopics().
+        Rows are the indexes of the legacy table, -1 if there is no such row.
+
+        count, left_count, right_count:     number of sentences with the topic.
+        start, end, l_start, l_end:         first and last rows with the topic, on
+                                            either side or on the left side. The
+                                            last row is -1 if there is only one.
+        skip_lines, l_skip_lines:           paragraph breaks between them.
+        left_paras:                         number of paragraphs with the topic on
+                                            the left side.
+        right_only:                         True if the topic is on the right side
+                                            in a paragraph where it is never on
+                                            the left side.
+        """
+        rows = np.asarray(self.rows, dtype=np.int64)
+        breaks = np.asarray(self.breaks, dtype=np.int64)
+        present = (self.flags & MATCH_FLAG) != 0
+        left = present & ((self.flags & LEFT_FLAG) != 0)
+        right = present & ~left
+
+        def first_last(mask: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+            count = mask.sum(axis=0)
+            if len(rows) == 0:
+                none = np.full(self.ncols, -1, dtype=np.int64)
+                return count, none, none
+            first = rows[mask.argmax(axis=0)]
+            last = rows[len(rows) - 1 - mask[::-1].argmax(axis=0)]
+            first = np.where(count > 0, first, -1)
+            last = np.where(count > 1, last, -1)
+            return count, first, last
+
+        def breaks_between(start: np.ndarray, end: np.ndarray) -> np.ndarray:
+            between = np.searchsorted(breaks, end, side="left") - np.searchsorted(
+                breaks, start, side="right"
+            )
+            return np.maximum(between, 0)
+
+        count, start, end = first_last(present)
+        left_count, l_start, l_end = first_last(left)
+
+        # Sentences are in paragraph order, combine the sentences of each paragraph.
+        para = np.asarray(self.para, dtype=np.int64)
+        if len(para) > 0:
+            _, para_starts = np.unique(para, return_index=True)
+            left_in_para = np.logical_or.reduceat(left, para_starts, axis=0)
+            right_in_para = np.logical_or.reduceat(right, para_starts, axis=0)
+            left_paras = left_in_para.sum(axis=0)
+            right_only = (right_in_para & ~left_in_para).any(axis=0)
+        else:
+            left_paras = np.zeros(self.ncols, dtype=np.int64)
+            right_only = np.zeros(self.ncols, dtype=bool)
+
+        return {
+            "count": count,
+            "left_count": left_count,
+            "right_count": count - left_count,
+            "start": start,
+            "end": end,
+            "l_start": l_start,
+            "l_end": l_end,
+            "skip_lines": breaks_between(start, end),
+            "l_skip_lines": breaks_between(l_start, l_end),
+            "left_paras": left_paras,
+            "right_only": right_only,
+        }
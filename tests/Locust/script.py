@@ -1,6 +1,13 @@
-import time, json
+import json
 from locust import HttpUser, task, between
 
+PARAGRAPHS = [
+  "I am applying for the Graduate Assistant position at Crane & Jenkins University. As a Sports Studies graduate student at the university, I am eager to start a position to supplement my studies. I have knowledge of ice hockey, field hockey, badminton and gymnastics, which are all sports the university offers. Furthermore, I am creative, fast-thinking and innovative and great at analyzing game footage. I am thrilled about the idea of helping out the department, the student-athletes and the fans.",
+  "At Coral Springs University, I served as the Marketing Intern for the Department of Athletics, specifically for men’s ice hockey and the women’s gymnastics teams. I put together game-day rosters, play-by-play videos and media guides. I also shot practice footage, interviewed student-athletes and managed game-day promotions. I assisted in creating a positive environment for fans, athletes and staff members.",
+  "The Crane & Jenkins Cranes can always use more fans at their games. Through my internship, I’ve gained experience with creating eye-catching marketing materials that have been proven to increase game attendance. I thrive on the nerves of game days and tight deadlines. With a goal to increase student attendance at the major hockey game of the season, I spearheaded an on-campus ticket giveaway, and 80% more students claimed their tickets than in years past.",
+  "Attached is my resume for your review. Thank you for your consideration. I look forward to learning more about the Graduate Assistant position at Crane & Jenkins University. I believe that I would be an excellent match for the role and the position aligns with my skills and interests. Getting experience in your athletic department would help me get closer to my goal of being the Marketing Director of a team.",
+]
+
 class EberlyTestUser(HttpUser):
     wait_time = between(1.0, 3.0)
     
@@ -15,14 +22,12 @@ def on_stop(self):
     @task(1)
     def api_page(self):
         payload = {
-          "status": "request",
-          "data": {
-            "base": "SSUyMGFtJTIwYXBwbHlpbmclMjBmb3IlMjB0aGUlMjBHcmFkdWF0ZSUyMEFzc2lzdGFudCUyMHBvc2l0aW9uJTIwYXQlMjBDcmFuZSUyMCUyNiUyMEplbmtpbnMlMjBVbml2ZXJzaXR5LiUyMEFzJTIwYSUyMFNwb3J0cyUyMFN0dWRpZXMlMjBncmFkdWF0ZSUyMHN0dWRlbnQlMjBhdCUyMHRoZSUyMHVuaXZlcnNpdHklMkMlMjBJJTIwYW0lMjBlYWdlciUyMHRvJTIwc3RhcnQlMjBhJTIwcG9zaXRpb24lMjB0byUyMHN1cHBsZW1lbnQlMjBteSUyMHN0dWRpZXMuJTIwSSUyMGhhdmUlMjBrbm93bGVkZ2UlMjBvZiUyMGljZSUyMGhvY2tleSUyQyUyMGZpZWxkJTIwaG9ja2V5JTJDJTIwYmFkbWludG9uJTIwYW5kJTIwZ3ltbmFzdGljcyUyQyUyMHdoaWNoJTIwYXJlJTIwYWxsJTIwc3BvcnRzJTIwdGhlJTIwdW5pdmVyc2l0eSUyMG9mZmVycy4lMjBGdXJ0aGVybW9yZSUyQyUyMEklMjBhbSUyMGNyZWF0aXZlJTJDJTIwZmFzdC10aGlua2luZyUyMGFuZCUyMGlubm92YXRpdmUlMjBhbmQlMjBncmVhdCUyMGF0JTIwYW5hbHl6aW5nJTIwZ2FtZSUyMGZvb3RhZ2UuJTIwSSUyMGFtJTIwdGhyaWxsZWQlMjBhYm91dCUyMHRoZSUyMGlkZWElMjBvZiUyMGhlbHBpbmclMjBvdXQlMjB0aGUlMjBkZXBhcnRtZW50JTJDJTIwdGhlJTIwc3R1ZGVudC1hdGhsZXRlcyUyMGFuZCUyMHRoZSUyMGZhbnMuJTBBJTBBJTBBJTBBQXQlMjBDb3JhbCUyMFNwcmluZ3MlMjBVbml2ZXJzaXR5JTJDJTIwSSUyMHNlcnZlZCUyMGFzJTIwdGhlJTIwTWFya2V0aW5nJTIwSW50ZXJuJTIwZm9yJTIwdGhlJTIwRGVwYXJ0bWVudCUyMG9mJTIwQXRobGV0aWNzJTJDJTIwc3BlY2lmaWNhbGx5JTIwZm9yJTIwbWVuJUUyJTgwJTk5cyUyMGljZSUyMGhvY2tleSUyMGFuZCUyMHRoZSUyMHdvbWVuJUUyJTgwJTk5cyUyMGd5bW5hc3RpY3MlMjB0ZWFtcy4lMjBJJTIwcHV0JTIwdG9nZXRoZXIlMjBnYW1lLWRheSUyMHJvc3RlcnMlMkMlMjBwbGF5LWJ5LXBsYXklMjB2aWRlb3MlMjBhbmQlMjBtZWRpYSUyMGd1aWRlcy4lMjBJJTIwYWxzbyUyMHNob3QlMjBwcmFjdGljZSUyMGZvb3RhZ2UlMkMlMjBpbnRlcnZpZXdlZCUyMHN0dWRlbnQtYXRobGV0ZXMlMjBhbmQlMjBtYW5hZ2VkJTIwZ2FtZS1kYXklMjBwcm9tb3Rpb25zLiUyMEklMjBhc3Npc3RlZCUyMGluJTIwY3JlYXRpbmclMjBhJTIwcG9zaXRpdmUlMjBlbnZpcm9ubWVudCUyMGZvciUyMGZhbnMlMkMlMjBhdGhsZXRlcyUyMGFuZCUyMHN0YWZmJTIwbWVtYmVycy4lMEElMEElMEElMEFUaGUlMjBDcmFuZSUyMCUyNiUyMEplbmtpbnMlMjBDcmFuZXMlMjBjYW4lMjBhbHdheXMlMjB1c2UlMjBtb3JlJTIwZmFucyUyMGF0JTIwdGhlaXIlMjBnYW1lcy4lMjBUaHJvdWdoJTIwbXklMjBpbnRlcm5zaGlwJTJDJTIwSSVFMiU4MCU5OXZlJTIwZ2FpbmVkJTIwZXhwZXJpZW5jZSUyMHdpdGglMjBjcmVhdGluZyUyMGV5ZS1jYXRjaGluZyUyMG1hcmtldGluZyUyMG1hdGVyaWFscyUyMHRoYXQlMjBoYXZlJTIwYmVlbiUyMHByb3ZlbiUyMHRvJTIwaW5jcmVhc2UlMjBnYW1lJTIwYXR0ZW5kYW5jZS4lMjBJJTIwdGhyaXZlJTIwb24lMjB0aGUlMjBuZXJ2ZXMlMjBvZiUyMGdhbWUlMjBkYXlzJTIwYW5kJTIwdGlnaHQlMjBkZWFkbGluZXMuJTIwV2l0aCUyMGElMjBnb2FsJTIwdG8lMjBpbmNyZWFzZSUyMHN0dWRlbnQlMjBhdHRlbmRhbmNlJTIwYXQlMjB0aGUlMjBtYWpvciUyMGhvY2tleSUyMGdhbWUlMjBvZiUyMHRoZSUyMHNlYXNvbiUyQyUyMEklMjBzcGVhcmhlYWRlZCUyMGFuJTIwb24tY2FtcHVzJTIwdGlja2V0JTIwZ2l2ZWF3YXklMkMlMjBhbmQlMjA4MCUyNSUyMG1vcmUlMjBzdHVkZW50cyUyMGNsYWltZWQlMjB0aGVpciUyMHRpY2tldHMlMjB0aGFuJTIwaW4lMjB5ZWFycyUyMHBhc3QuJTBBJTBBJTBBJTBBQXR0YWNoZWQlMjBpcyUyMG15JTIwcmVzdW1lJTIwZm9yJTIweW91ciUyMHJldmlldy4lMjBUaGFuayUyMHlvdSUyMGZvciUyMHlvdXIlMjBjb25zaWRlcmF0aW9uLiUyMEklMjBsb29rJTIwZm9yd2FyZCUyMHRvJTIwbGVhcm5pbmclMjBtb3JlJTIwYWJvdXQlMjB0aGUlMjBHcmFkdWF0ZSUyMEFzc2lzdGFudCUyMHBvc2l0aW9uJTIwYXQlMjBDcmFuZSUyMCUyNiUyMEplbmtpbnMlMjBVbml2ZXJzaXR5LiUyMEklMjBiZWxpZXZlJTIwdGhhdCUyMEklMjB3b3VsZCUyMGJlJTIwYW4lMjBleGNlbGxlbnQlMjBtYXRjaCUyMGZvciUyMHRoZSUyMHJvbGUlMjBhbmQlMjB0aGUlMjBwb3NpdGlvbiUyMGFsaWducyUyMHdpdGglMjBteSUyMHNraWxscyUyMGFuZCUyMGludGVyZXN0cy4lMjBHZXR0aW5nJTIwZXhwZXJpZW5jZSUyMGluJTIweW91ciUyMGF0aGxldGljJTIwZGVwYXJ0bWVudCUyMHdvdWxkJTIwaGVscCUyMG1lJTIwZ2V0JTIwY2xvc2VyJTIwdG8lMjBteSUyMGdvYWwlMjBvZiUyMGJlaW5nJTIwdGhlJTIwTWFya2V0aW5nJTIwRGlyZWN0b3IlMjBvZiUyMGElMjB0ZWFtLiUwQSUwQQ=="
-          }
+          "base": "".join(f"<p>{p}</p>" for p in PARAGRAPHS)
         }
         
         headers = {
-          'content-type': 'application/json'
+          'content-type': 'application/json',
+          'accept-language': 'en'
         }
         
-        response = self.client.post("/api/v1/ontopic", data=json.dumps(payload), headers=headers)
\ No newline at end of file
+        response = self.client.post("/api/v2/ontopic", data=json.dumps(payload), headers=headers)